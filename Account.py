@@ -1,18 +1,21 @@
-import pandas as pd
+import gongcq.Analytics as Analytics
+import gongcq.Report as Report
 import numpy as np
 import os
-import matplotlib.pyplot as mp
 
 class Delegate:
     """委托类"""
-    dlgDate = None          # 委托日期
-    stockCode = None        # 股票代码
-    dlgNum = None           # 委托数量（股）
-    dlgAmt = None           # 委托金额（在买入委托中，可以指定委托数量为None，用委托金额代替，内部会通过委托金额计算数量）
-    dlgPrice = None         # 委托价格
-    dlgDrct = None          # 委托方向（取值为 '买'/'卖'）
-    dlgTransPoint = None    # 委托成交时间点（取值为'o'/'c'，'o'表示开盘成交，'c'表示收盘成交）
-    comment = None          # 备注信息
+    __slots__ = ('dlgDate',         # 委托日期
+                 'stockCode',       # 股票代码
+                 'dlgNum',          # 委托数量（股）
+                 'dlgAmt',          # 委托金额（在买入委托中，可以指定委托数量为None，用委托金额代替，内部会通过委托金额计算数量）
+                 'dlgPrice',        # 委托价格
+                 'dlgDrct',         # 委托方向（取值为 '买'/'卖'）
+                 'dlgTransPoint',   # 委托成交时间点（取值为'o'/'c'，'o'表示开盘成交，'c'表示收盘成交）
+                 'comment')         # 备注信息
+
+    def __init__(self):
+        self.SetInvalid()
 
     def SetInvalid(self):
         '''
@@ -31,12 +34,15 @@ class Delegate:
 
 class Position:
     """持仓类"""
-    stockCode = None        # 股票编码，如果为None则表示无效委托
-    buyDate = None          # 买入日期
-    buyPrice = None         # 买入价格
-    buyPriceRe = None       # 买入价格（复权）
-    buyNum = None           # 买入数量（股）
-    latestVal = None        # 最新价值
+    __slots__ = ('stockCode',       # 股票编码，如果为None则表示无效委托
+                 'buyDate',         # 买入日期
+                 'buyPrice',        # 买入价格
+                 'buyPriceRe',      # 买入价格（复权）
+                 'buyNum',          # 买入数量（股）
+                 'latestVal')       # 最新价值
+
+    def __init__(self):
+        self.SetInvalid()
 
     def SetInvalid(self):
         '''
@@ -68,6 +74,14 @@ class Account:
     此list中的每个元素都是一个长度为5的list，
     第0个表示日期，第1个表示基准组合净值，第2个表示基准组合涨幅，第3个表示账户净值，第4个表示账户净值涨幅"""
     netValList = None
+    """
+    持仓簿在Market.bookMatrix中的行号，为None时表示持仓不参与批量估值"""
+    bookRow = None
+    """
+    已作废的委托和持仓对象的回收池，新建委托和持仓时优先复用，poolSize为每个回收池保留的最大对象数"""
+    dlgPool = None
+    posPool = None
+    poolSize = 1000
 
     def __init__(self, actID, cap, market, csMap = None):
         '''
@@ -81,13 +95,58 @@ class Account:
         self.capital = cap
         self.market = market
         self.csMap = csMap
-        self.position = dict()
+        self.dlgPool = []
+        self.posPool = []
+        self.InitPosition()
         self.delegateBuy = dict()
         self.delegateSell = dict()
         self.netVal = cap
         self.tradeRecord = []
         self.netValList = []
 
+    def InitPosition(self):
+        '''
+        初始化持仓
+        :return:
+        '''
+        self.position = dict()
+
+    def NewDlg(self):
+        '''
+        获取一个空白的委托对象，优先从回收池中复用
+        :return: 委托对象
+        '''
+        return self.dlgPool.pop() if len(self.dlgPool) > 0 else Delegate()
+
+    def NewPos(self):
+        '''
+        获取一个空白的持仓对象，优先从回收池中复用
+        :return: 持仓对象
+        '''
+        return self.posPool.pop() if len(self.posPool) > 0 else Position()
+
+    def RecycleDlg(self, dlgDict):
+        '''
+        作废并回收一组委托，然后清空委托dict（回收后的委托对象会被复用，不应在外部继续持有）
+        :param dlgDict: 委托dict
+        :return:
+        '''
+        for dlg in dlgDict.values():
+            dlg.SetInvalid()
+            if len(self.dlgPool) < self.poolSize:
+                self.dlgPool.append(dlg)
+        dlgDict.clear()
+
+    def RecyclePos(self, pos):
+        '''
+        作废并回收一个持仓对象（回收后的持仓对象会被复用，不应在外部继续持有）
+        :param pos: 持仓对象
+        :return:
+        '''
+        pos.SetInvalid()
+        if len(self.posPool) < self.poolSize:
+            self.posPool.append(pos)
+
     def ClearAll(self, transPoint = 'o', comment = ''):
         '''
         清空所有持仓
@@ -96,7 +155,7 @@ class Account:
         :return:
         '''
         for code, pos in self.position.items():
-            dlg = Delegate()
+            dlg = self.NewDlg()
             dlg.stockCode = code
             dlg.dlgNum = pos.buyNum
             dlg.dlgPrice = None
@@ -119,7 +178,7 @@ class Account:
         :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
         :return:
         '''
-        dlg = Delegate()
+        dlg = self.NewDlg()
         dlg.stockCode = code
         dlg.dlgNum = num
         dlg.dlgPrice = price
@@ -134,20 +193,86 @@ class Account:
             self.delegateSell[code] = dlg
             return self.MatchSellDlg(dlg)
 
-    def UpdateVal(self):
+    def AddDlgBatch(self, codes, nums = None, amounts = None, drct = '买', comment = '', transPoint = 'c'):
+        '''
+        批量添加同一方向的委托，成交规则与逐个调用AddDlg相同（按codes的顺序依次成交）
+        :param codes: 股票编码数组
+        :param nums: 委托数量数组，为None时通过amounts计算委托数量
+        :param amounts: 委托金额数组，nums为None时必须指定
+        :param drct: 委托方向，'买' '卖'
+        :param comment: 注释内容，str类型
+        :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
+        :return: 每个委托是否成交的bool数组
+        '''
+        codes = np.asarray(codes, dtype = np.int64)
+        numList = np.asarray(nums).tolist() if nums is not None else None  # 委托数量原样传给AddDlg，不取整
+        done = np.zeros([len(codes)], dtype = bool)
+        for i, code in enumerate(codes.tolist()):
+            num = numList[i] if numList is not None else None
+            amount = float(amounts[i]) if amounts is not None else None
+            done[i] = bool(self.AddDlg(code, num, None, amount, drct, comment, transPoint))
+        return done
+
+    def GetPosValueArray(self, priceRe):
+        '''
+        按复权价格计算持仓价值，结果按行情数据源中的股票序号排列
+        :param priceRe: 按股票序号排列的复权价格数组，无效价格为nan
+        :return: 持仓价值数组，价格无效时取持仓的最新价值，未持有的位置为0
+        '''
+        val = np.zeros([len(priceRe)])
+        for code, pos in self.position.items():
+            if pos.stockCode is None:
+                continue
+            seq = self.market.GetSeq(code)
+            if seq < 0:
+                continue
+            val[seq] = priceRe[seq] / pos.buyPriceRe * pos.buyPrice * pos.buyNum if priceRe[seq] == priceRe[seq] else pos.latestVal
+        return val
+
+    def Rebalance(self, weights, transPoint = 'c', comment = '', tolerance = 0.05):
+        '''
+        按目标权重调仓：先卖出目标权重为0或需要减仓的股票（卖出为全部卖出，需要减仓的股票卖出后再按目标金额买回），再买入需要加仓的股票
+        :param weights: 按行情数据源中的股票序号排列的目标权重数组，nan视为0
+        :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
+        :param comment: 注释内容，str类型
+        :param tolerance: 目标金额与持仓价值的相对偏差不超过此值时不调整
+        :return: 卖出委托的成交结果，买入委托的成交结果（均为bool数组）
+        '''
+        ds = self.market.dsList[0]
+        weights = np.nan_to_num(np.asarray(weights, dtype = float))
+        priceRe = self.market.GetPriceVector(6 if transPoint == 'o' else 3)
+        posVal = self.GetPosValueArray(priceRe)
+        target = weights * (posVal.sum() + self.capital)
+        sellSeq = np.flatnonzero((posVal > 0) & (target < posVal * (1 - tolerance)))
+        sellDone = self.AddDlgBatch(np.asarray(ds.codeList)[sellSeq], None, None, '卖', comment, transPoint)
+        posVal[sellSeq[sellDone]] = 0
+        buySeq = np.flatnonzero(target > posVal * (1 + tolerance))
+        buyDone = self.AddDlgBatch(np.asarray(ds.codeList)[buySeq], None, (target - posVal)[buySeq], '买', comment, transPoint)
+        return sellDone, buyDone
+
+    def UpdateVal(self, closeRe = None, posVal = None):
         '''
         更新账户净值
+        :param closeRe: 由Market共享的按股票序号排列的收盘复权价格数组，为None时从行情数据源中逐个读取
+        :param posVal: 由Market批量计算好的持仓总价值，指定时直接使用
         :return:
         '''
+        if posVal is not None:
+            self.netVal = posVal + self.capital
+            return
         val = 0
         for code, pos in self.position.items():
             if pos.stockCode is None:
                 continue
             seq = self.market.dsList[0].GetSeq(code)
-            prc = self.market.dsList[0].data[seq]
             pos = self.position[code]
-            if prc is not None and prc[3] is not None:
-                pos.latestVal = prc[3] / pos.buyPriceRe * pos.buyPrice * pos.buyNum
+            if closeRe is not None:
+                if closeRe[seq] == closeRe[seq]:
+                    pos.latestVal = closeRe[seq] / pos.buyPriceRe * pos.buyPrice * pos.buyNum
+            else:
+                prc = self.market.dsList[0].data[seq]
+                if prc is not None and prc[3] is not None:
+                    pos.latestVal = prc[3] / pos.buyPriceRe * pos.buyPrice * pos.buyNum
             val += pos.latestVal
         self.netVal = val + self.capital
 
@@ -162,6 +287,20 @@ class Account:
                 n += 1
         return n
 
+    def GetTransPrice(self, prc, transPoint):
+        '''
+        获取成交价格
+        :param prc: 行情数据记录
+        :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
+        :return: 成交价格，复权成交价格
+        '''
+        if transPoint == 'o':
+            return prc[5], prc[6]  # 最新价，最新复权价
+        elif transPoint == 'c':
+            return prc[2], prc[3]  # 最新价，最新复权价
+        else:
+            raise Exception('Unknown dlgTransPoint!')
+
     def MatchBuyDlg(self, dlg):
         '''
         成交一个买委托
@@ -174,14 +313,7 @@ class Account:
         if prc is None:
             return False
         # 获取成交价格
-        if dlg.dlgTransPoint == 'o':
-            price = prc[5]    # 最新价
-            priceRe = prc[6]  # 最新复权价
-        elif dlg.dlgTransPoint == 'c':
-            price = prc[2]    # 最新价
-            priceRe = prc[3]  # 最新复权价
-        else:
-            raise Exception('Unknown dlgTransPoint!')
+        price, priceRe = self.GetTransPrice(prc, dlg.dlgTransPoint)
         # 行情数据有效且未涨停且有可用资金
         if price is not None and priceRe is not None and prc[4] is not None and prc[4] <= 0.099 and self.capital > 0:
             if dlg.dlgNum is None:  # 如果委托数量为None，则通过委托金额计算委托数量
@@ -189,7 +321,7 @@ class Account:
             num = min(int(self.capital / (1 + self.fee) / (price * 100)) * 100, dlg.dlgNum)  # 实际可买数量
             if not num > 0:
                 return False
-            pos = Position()
+            pos = self.NewPos()
             pos.stockCode = code
             pos.buyDate = self.market.crtDate
             if code in self.position.keys() and self.position[code].stockCode is not None:  # 有持仓（计算逻辑为将原持仓股票全部卖出后再等额以现价买入）
@@ -197,6 +329,7 @@ class Account:
                 valOld = priceRe / tempPos.buyPriceRe * tempPos.buyPrice * tempPos.buyNum
                 numOld = int(valOld / price)  # 假设原有持仓的股票全部卖出后再立即以卖出所得金额全部现价买入的数量
                 pos.buyNum = num + numOld     # 将新买入的数量与原数量合并，所持有股票全部视为新买入
+                self.RecyclePos(tempPos)
             else:  # 无持仓
                 pos.buyNum = num
             pos.buyPrice = price
@@ -228,14 +361,7 @@ class Account:
             if prc is None:
                 return False
             # 获取成交价格
-            if dlg.dlgTransPoint == 'o':
-                price = prc[5]    # 最新价
-                priceRe = prc[6]  # 最新复权价
-            elif dlg.dlgTransPoint == 'c':
-                price = prc[2]    # 最新价
-                priceRe = prc[3]  # 最新复权价
-            else:
-                raise Exception('Unknown dlgTransPoint!')
+            price, priceRe = self.GetTransPrice(prc, dlg.dlgTransPoint)
             # 行情数据有效且未跌停
             if price is not None and priceRe is not None and prc[4] is not None and prc[4] >= -0.099:
                 amtChg = (priceRe / pos.buyPriceRe * pos.buyPrice * pos.buyNum) * (1 - self.fee)
@@ -251,85 +377,619 @@ class Account:
             dlg.SetInvalid()
             return False
 
-    def NewDayHandler(self):
+    def NewDayHandler(self, closeRe = None, posVal = None):
         '''
         收盘后事件处理
+        :param closeRe: 由Market共享的按股票序号排列的收盘复权价格数组
+        :param posVal: 由Market批量计算好的持仓总价值
         :return:
         '''
         # 清理已卖出的股票仓位
-        allKeys = list(self.position.keys())
-        for code in allKeys:
-            if self.position[code].stockCode is None:
-                del self.position[code]
-        # 清空所有委托
-        self.delegateBuy.clear()
-        self.delegateSell.clear()
+        self.ClearInvalidPos()
+        # 清空并回收所有委托
+        self.RecycleDlg(self.delegateBuy)
+        self.RecycleDlg(self.delegateSell)
         # 成交后计算账户净值
-        self.UpdateVal()
+        self.UpdateVal(closeRe, posVal)
         netValRise = 0
         if len(self.netValList) > 0:
             netValRise = self.netVal / self.netValList[-1][3] - 1
         if len(self.tradeRecord) > 0:  # 将第一笔交易的时间视作策略开始时间，在此时间之前不记录净值
             self.netValList.append([self.market.crtDate, self.market.bmList[-1][1], self.market.bmList[-1][2], self.netVal, netValRise])
 
-    def EvalAccount(self, path, label, showFigure = False):
+    def ClearInvalidPos(self):
+        '''
+        清理已卖出（已作废）的持仓记录
+        :return:
+        '''
+        allKeys = list(self.position.keys())
+        for code in allKeys:
+            if self.position[code].stockCode is None:
+                self.RecyclePos(self.position.pop(code))
+
+    def GetPosState(self):
+        '''
+        获取持仓状态，用于保存检查点
+        :return: dict类型，key为股票编码，value为(买入日期, 买入价格, 买入价格（复权）, 买入数量, 最新价值)，按持仓的加入次序排列
+        '''
+        state = dict()
+        for code, pos in self.position.items():
+            if pos.stockCode is not None:
+                state[code] = (pos.buyDate, pos.buyPrice, pos.buyPriceRe, pos.buyNum, pos.latestVal)
+        return state
+
+    def SetPosState(self, state):
+        '''
+        以GetPosState的结果恢复持仓
+        :param state: 持仓状态
+        :return:
+        '''
+        for pos in self.position.values():
+            self.RecyclePos(pos)
+        self.position.clear()
+        for code, (buyDate, buyPrice, buyPriceRe, buyNum, latestVal) in state.items():
+            pos = self.NewPos()
+            pos.stockCode = code
+            pos.buyDate = buyDate
+            pos.buyPrice = buyPrice
+            pos.buyPriceRe = buyPriceRe
+            pos.buyNum = buyNum
+            pos.latestVal = latestVal
+            self.position[code] = pos
+
+    def GetStat(self):
+        '''
+        计算账户的绩效统计指标
+        :return: dict类型，totalEar总收益，annualEar年化收益，annualStd年化波动率，sharpe夏普比率，
+                 以及最大回撤、索提诺比率、卡玛比率、信息比率、换手率等（见Analytics.GetMetrics），没有净值数据时各指标为nan
+        '''
+        return Analytics.GetMetrics(self.netValList, self.tradeRecord)
+
+    def EvalAccount(self, path, label, showFigure = False, render = True):
         '''
         评估账户绩效
         :param path: 相关评估文件的保存路径
         :param label: 标签
         :param showFigure: 是否显示图
-        :return:
+        :param render: 是否绘制并保存净值图（绘图由Report模块完成，matplotlib在此时才被导入），为False时只输出数据，可以之后由Report.RenderCharts批量绘制
+        :return: 净值图数据（见Report.GetChartData），没有数据时返回None
         '''
         if len(self.netValList) == 0 or len(self.tradeRecord) == 0:
             np.savetxt(os.path.join(path, label + ' - No data to save' + '.csv'), np.array([['No data to save']]), fmt='%s,', newline='\n')
             print(label + ': No data to save')
-            return
-        netFrm = pd.DataFrame(self.netValList)
-        # 计算超额收益
-        excEar = np.ones([len(self.netValList)])
-        posRow = 0
-        for i in range(0, len(self.netValList), 1):
-            earning = self.netValList[i][3] / self.netValList[posRow][3] - self.netValList[i][1] / self.netValList[posRow][1]
-            excEar[i] = excEar[posRow] * (1 + earning)
-            if i % 20 == 0:
-                posRow = i
-        # 计算收益回撤等
-        annualStd = netFrm.iloc[:, 4].std() * np.sqrt(250)
-        totalEar = self.netValList[-1][3] / self.netValList[0][3] - 1
-        annualEar = np.power((totalEar + 1), 250 / len(self.netValList)) - 1
-        sharpe = annualEar / annualStd
-        statStr = '总收益,' + '%f'%totalEar + \
-                  '\n年化收益,' + '%f'%annualEar + \
-                  '\n年化波动率,' + '%f'%annualStd + \
-                  '\n夏普比率,' + '%f'%sharpe
-        fh = open(os.path.join(path, 'stat ' + label + '.csv'), 'w')
-        fh.write(statStr)
-        fh.close()
-        print([['ID', self.accountID], ['总收益', totalEar], ['年化收益', annualEar], ['年化波动率', annualStd], ['夏普比率', sharpe]])
-        # 保存交易记录与净值文件
-        tr = [['Date', 'stockCode', 'symbol', 'number', 'direct', 'amount', 'price', 'priceRe', 'comment']]
-        tr.extend(self.tradeRecord)
-        np.savetxt(os.path.join(path, 'tradeRecord ' + label + '.csv'), np.array(tr), fmt='%s,', newline='\n')
-        nv = [['Date', 'Benchmark', 'BenchmarkReturn', 'StrategyNetValue', 'StrategyReturn']]
-        nv.extend(self.netValList)
-        np.savetxt(os.path.join(path, 'netVal ' + label + '.csv'), np.array(nv), fmt='%s,', newline='\n')
-        # 绘图
-        stgEar = netFrm.iloc[:, 3].T.values / netFrm.iloc[0, 3]
-        bmEar = netFrm.iloc[:, 1].T.values / netFrm.iloc[0, 1]
-        xTickList = []
-        xLabelList = []
-        for i in range(0, len(self.netValList), 1):
-            if i % 60 == 0:
-                xTickList.append(i)
-                xLabelList.append(self.netValList[i][0].strftime('%Y%m%d'))
-        x = np.array(range(0, len(self.netValList), 1))
-        mp.plot(x, bmEar,  label="Benchmark", color="black")
-        mp.plot(x, stgEar, label="Strategy", color="blue")
-        mp.plot(x, excEar, label="Excess", color="red")
-        mp.xticks(xTickList, xLabelList, rotation = 90)
-        mp.legend(loc = 'upper left')
-        mp.savefig(os.path.join(path, 'figure ' + label + '.png'))
-        mp.cla()
+            return None
+        profiler = self.market.profiler if self.market is not None else None
+        if profiler is not None:
+            profiler.Begin('EvalAccount')
+        try:
+            dates, bm, bmRise, netVal, rise = Analytics.GetNetValArray(self.netValList)
+            # 计算超额收益
+            excEar = Analytics.GetExcessCurve(netVal, bm)
+            # 计算收益回撤等
+            stat = self.GetStat()
+            totalEar = stat['totalEar']
+            annualEar = stat['annualEar']
+            annualStd = stat['annualStd']
+            sharpe = stat['sharpe']
+            statStr = '总收益,' + '%f'%totalEar + \
+                      '\n年化收益,' + '%f'%annualEar + \
+                      '\n年化波动率,' + '%f'%annualStd + \
+                      '\n夏普比率,' + '%f'%sharpe + \
+                      '\n最大回撤,' + '%f'%stat['maxDrawdown'] + \
+                      '\n最长回撤天数,' + '%d'%stat['maxDrawdownDays'] + \
+                      '\n索提诺比率,' + '%f'%stat['sortino'] + \
+                      '\n卡玛比率,' + '%f'%stat['calmar'] + \
+                      '\n信息比率,' + '%f'%stat['infoRatio'] + \
+                      '\n年化换手率,' + '%f'%stat['turnover']
+            fh = open(os.path.join(path, 'stat ' + label + '.csv'), 'w')
+            fh.write(statStr)
+            fh.close()
+            print([['ID', self.accountID], ['总收益', totalEar], ['年化收益', annualEar], ['年化波动率', annualStd], ['夏普比率', sharpe]])
+            # 保存交易记录与净值文件
+            tr = [['Date', 'stockCode', 'symbol', 'number', 'direct', 'amount', 'price', 'priceRe', 'comment']]
+            tr.extend(self.tradeRecord)
+            Analytics.WriteRows(os.path.join(path, 'tradeRecord ' + label + '.csv'), tr)
+            nv = [['Date', 'Benchmark', 'BenchmarkReturn', 'StrategyNetValue', 'StrategyReturn']]
+            nv.extend(self.netValList)
+            Analytics.WriteRows(os.path.join(path, 'netVal ' + label + '.csv'), nv)
+            # 绘图
+            data = Report.GetChartData(self.netValList, excEar)
+            if render:
+                if profiler is not None:
+                    profiler.Begin('Plot')
+                try:
+                    Report.RenderChart(data, os.path.join(path, 'figure ' + label + '.png'))
+                finally:
+                    if profiler is not None:
+                        profiler.End()
+        finally:
+            if profiler is not None:
+                profiler.End()
         if showFigure:
-            mp.show()
+            Report.ShowChart(data)
+        return data
+
+
+def NumValue(num):
+    '''
+    将持仓簿中的数量（float）转换为与Account中相同类型的数值：整数股数返回int，以非整数数量委托得到的数量原样返回float
+    :param num: 数量
+    :return: int或float
+    '''
+    num = float(num)
+    return int(num) if num.is_integer() else num
+
+
+
+class PositionBook:
+    """
+    数组形式的持仓簿，各数组均按行情数据源（market.dsList[0]）中的股票序号索引，
+    用于以向量化的方式计算所有持仓的市值"""
+    held = None             # 是否持有（bool数组）
+    buyDate = None          # 买入日期（object数组）
+    buyPrice = None         # 买入价格，未持有的位置为nan
+    buyPriceRe = None       # 买入价格（复权），未持有的位置为nan
+    buyNum = None           # 买入数量（股），未持有的位置为0
+    latestVal = None        # 最新价值，未持有的位置为0
+    posOrder = None         # 持仓的加入次序，-1表示无持仓记录，用于保持与dict形式的持仓相同的遍历顺序
+    orderCount = 0          # 已分配的加入次序
+
+    def __init__(self, codeCount, matrix = None, row = None):
+        '''
+        构造一个持仓簿
+        :param codeCount: 股票数量
+        :param matrix: BookMatrix对象，指定时持仓簿的各数组为其中第row行的视图
+        :param row: 在matrix中的行号
+        '''
+        if matrix is not None:
+            self.held = matrix.held[row]
+            self.buyDate = matrix.buyDate[row]
+            self.buyPrice = matrix.buyPrice[row]
+            self.buyPriceRe = matrix.buyPriceRe[row]
+            self.buyNum = matrix.buyNum[row]
+            self.latestVal = matrix.latestVal[row]
+            self.posOrder = matrix.posOrder[row]
+            self.orderCount = 0
+            return
+        self.held = np.zeros([codeCount], dtype = bool)
+        self.buyDate = np.full([codeCount], None, dtype = object)
+        self.buyPrice = np.full([codeCount], np.nan)
+        self.buyPriceRe = np.full([codeCount], np.nan)
+        self.buyNum = np.zeros([codeCount])
+        self.latestVal = np.zeros([codeCount])
+        self.posOrder = np.full([codeCount], -1, dtype = np.int64)
+        self.orderCount = 0
+
+    def SetPos(self, seq, buyDate, buyPrice, buyPriceRe, buyNum):
+        '''
+        设置一个持仓（覆盖原有持仓）
+        :param seq: 股票序号
+        :param buyDate: 买入日期
+        :param buyPrice: 买入价格
+        :param buyPriceRe: 买入价格（复权）
+        :param buyNum: 买入数量（股）
+        :return:
+        '''
+        if self.posOrder[seq] < 0:
+            self.posOrder[seq] = self.orderCount
+            self.orderCount += 1
+        self.held[seq] = True
+        self.buyDate[seq] = buyDate
+        self.buyPrice[seq] = buyPrice
+        self.buyPriceRe[seq] = buyPriceRe
+        self.buyNum[seq] = buyNum
+        self.latestVal[seq] = buyNum * buyPrice
+
+    def RemovePos(self, seq):
+        '''
+        移除持仓（加入次序保留至ClearOrder时清除，与dict形式的持仓在当日保留作废记录的行为一致）
+        :param seq: 股票序号（可以是序号数组）
+        :return:
+        '''
+        self.held[seq] = False
+        self.buyDate[seq] = None
+        self.buyPrice[seq] = np.nan
+        self.buyPriceRe[seq] = np.nan
+        self.buyNum[seq] = 0
+        self.latestVal[seq] = 0
+
+    def GetHeldSeq(self):
+        '''
+        按加入次序获取所有持仓的股票序号
+        :return: 股票序号数组
+        '''
+        seqs = np.flatnonzero(self.held)
+        return seqs[np.argsort(self.posOrder[seqs], kind = 'stable')]
+
+    def SetPosBatch(self, seqs, buyDate, buyPrice, buyPriceRe, buyNum):
+        '''
+        批量设置持仓（覆盖原有持仓），seqs中不能有重复的序号
+        :param seqs: 股票序号数组
+        :param buyDate: 买入日期
+        :param buyPrice: 买入价格数组
+        :param buyPriceRe: 买入价格（复权）数组
+        :param buyNum: 买入数量（股）数组
+        :return:
+        '''
+        newSeqs = seqs[self.posOrder[seqs] < 0]
+        self.posOrder[newSeqs] = self.orderCount + np.arange(len(newSeqs))
+        self.orderCount += len(newSeqs)
+        self.held[seqs] = True
+        self.buyDate[seqs] = buyDate
+        self.buyPrice[seqs] = buyPrice
+        self.buyPriceRe[seqs] = buyPriceRe
+        self.buyNum[seqs] = buyNum
+        self.latestVal[seqs] = buyNum * buyPrice
+
+    def ClearOrder(self):
+        '''
+        清除已移除持仓的加入次序
+        :return:
+        '''
+        self.posOrder[~self.held] = -1
+
+    def GetValue(self, priceRe):
+        '''
+        按复权价格计算每个持仓的价值
+        :param priceRe: 按股票序号排列的复权价格数组，无效价格为nan
+        :return: 每个持仓的价值数组，未持有或价格无效的位置为nan
+        '''
+        return priceRe / self.buyPriceRe * self.buyPrice * self.buyNum
+
+    def MarkToMarket(self, closeRe):
+        '''
+        以收盘复权价格更新所有持仓的最新价值，价格无效的持仓保留原有价值
+        :param closeRe: 按股票序号排列的收盘复权价格数组，无效价格为nan
+        :return: 持仓总价值
+        '''
+        val = self.GetValue(closeRe)
+        np.copyto(self.latestVal, val, where = self.held & ~np.isnan(val))
+        return self.latestVal.sum()
+
+
+class BookMatrix:
+    """
+    多个账户的持仓簿矩阵（账户数×股票数），每个账户的PositionBook为其中一行的视图，
+    用于在同一个市场中运行多个数组持仓账户时，以一次向量化运算计算所有账户的持仓市值"""
+    held = None             # 是否持有
+    buyDate = None          # 买入日期
+    buyPrice = None         # 买入价格
+    buyPriceRe = None       # 买入价格（复权）
+    buyNum = None           # 买入数量（股）
+    latestVal = None        # 最新价值
+    posOrder = None         # 持仓的加入次序
+    rowNum = 0              # 已分配的行数
+
+    def __init__(self, maxRowNum, codeCount):
+        '''
+        构造一个持仓簿矩阵
+        :param maxRowNum: 最大账户数
+        :param codeCount: 股票数量
+        '''
+        self.held = np.zeros([maxRowNum, codeCount], dtype = bool)
+        self.buyDate = np.full([maxRowNum, codeCount], None, dtype = object)
+        self.buyPrice = np.full([maxRowNum, codeCount], np.nan)
+        self.buyPriceRe = np.full([maxRowNum, codeCount], np.nan)
+        self.buyNum = np.zeros([maxRowNum, codeCount])
+        self.latestVal = np.zeros([maxRowNum, codeCount])
+        self.posOrder = np.full([maxRowNum, codeCount], -1, dtype = np.int64)
+        self.rowNum = 0
+
+    def NewBook(self):
+        '''
+        分配一行并返回以其为存储的持仓簿
+        :return: 持仓簿，行号
+        '''
+        if self.rowNum >= len(self.held):
+            raise Exception('BookMatrix已满：' + str(len(self.held)))
+        row = self.rowNum
+        self.rowNum += 1
+        return PositionBook(self.held.shape[1], self, row), row
+
+    def AttachBook(self, book, row):
+        '''
+        将一个持仓簿的数据写入第row行，并使持仓簿的各数组重新成为该行的视图（用于反序列化后恢复视图关系）
+        :param book: 持仓簿
+        :param row: 行号
+        :return:
+        '''
+        for name in ('held', 'buyDate', 'buyPrice', 'buyPriceRe', 'buyNum', 'latestVal', 'posOrder'):
+            matrix = getattr(self, name)
+            matrix[row] = getattr(book, name)
+            setattr(book, name, matrix[row])
+
+    def MarkToMarket(self, closeRe):
+        '''
+        以收盘复权价格一次性更新所有账户持仓的最新价值，价格无效的持仓保留原有价值
+        :param closeRe: 按股票序号排列的收盘复权价格数组，无效价格为nan
+        :return: 每个账户的持仓总价值数组（按行号排列）
+        '''
+        n = self.rowNum
+        val = closeRe / self.buyPriceRe[: n] * self.buyPrice[: n] * self.buyNum[: n]
+        np.copyto(self.latestVal[: n], val, where = self.held[: n] & ~np.isnan(val))
+        return self.latestVal[: n].sum(axis = 1)
+
+
+class ArrayAccount(Account):
+    """
+    以数组形式持仓的账户类，交易规则与Account相同，
+    但持仓存放于按股票序号索引的PositionBook中，每日市值以向量化的方式计算，适用于持仓股票较多的账户。
+    要求在创建账户之前已经创建了行情数据源"""
+    book = None
+
+    def InitPosition(self):
+        '''
+        初始化持仓
+        :return:
+        '''
+        if self.market.bookMatrix is not None:
+            self.book, self.bookRow = self.market.bookMatrix.NewBook()
+        else:
+            self.book = PositionBook(self.market.dsList[0].codeCount)
+
+    @property
+    def position(self):
+        '''
+        以dict形式返回当前持仓的快照（key为股票编码，value为Position对象），修改此快照不会影响账户持仓
+        :return:
+        '''
+        posDict = dict()
+        for seq in self.book.GetHeldSeq().tolist():
+            pos = Position()
+            pos.stockCode = self.market.GetCode(seq)
+            pos.buyDate = self.book.buyDate[seq]
+            pos.buyPrice = float(self.book.buyPrice[seq])
+            pos.buyPriceRe = float(self.book.buyPriceRe[seq])
+            pos.buyNum = NumValue(self.book.buyNum[seq])
+            pos.latestVal = float(self.book.latestVal[seq])
+            posDict[pos.stockCode] = pos
+        return posDict
+
+    def ClearAll(self, transPoint = 'o', comment = ''):
+        '''
+        清空所有持仓（以批量委托的方式卖出）
+        :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
+        :param comment: 注释内容，str类型
+        :return:
+        '''
+        seqs = self.book.GetHeldSeq()
+        self.AddDlgBatch(np.asarray(self.market.dsList[0].codeList)[seqs], None, None, '卖', comment, transPoint)
+
+    def AddDlgBatch(self, codes, nums = None, amounts = None, drct = '买', comment = '', transPoint = 'c'):
+        '''
+        批量添加同一方向的委托，成交规则与逐个调用AddDlg相同（按codes的顺序依次成交）。
+        价格查找、涨跌停判断、委托数量取整和持仓更新均以向量化的方式完成，
+        只有依赖于剩余资金的买入数量按顺序逐个计算；只有未成交的委托会被记录在delegateBuy/delegateSell中
+        :param codes: 股票编码数组
+        :param nums: 委托数量数组，为None时通过amounts计算委托数量
+        :param amounts: 委托金额数组，nums为None时必须指定
+        :param drct: 委托方向，'买' '卖'
+        :param comment: 注释内容，str类型
+        :param transPoint: 成交时间点，'o'开盘成交，'c'收盘成交
+        :return: 每个委托是否成交的bool数组
+        '''
+        codes = np.asarray(codes, dtype = np.int64)
+        numList = np.asarray(nums).tolist() if nums is not None else None  # 委托数量与AddDlg一样原样使用，不取整
+        if len(np.unique(codes)) < len(codes):  # 同一股票的多个委托相互影响，逐个处理
+            return Account.AddDlgBatch(self, codes, nums, amounts, drct, comment, transPoint)
+        ds = self.market.dsList[0]
+        book = self.book
+        seqs = ds.GetSeqArray(codes)
+        found = seqs >= 0
+        priceCol, priceReCol = (5, 6) if transPoint == 'o' else (2, 3)
+        if transPoint not in ('o', 'c'):
+            raise Exception('Unknown dlgTransPoint!')
+        price = np.full([len(codes)], np.nan)
+        priceRe = np.full([len(codes)], np.nan)
+        rise = np.full([len(codes)], np.nan)
+        price[found] = self.market.GetPriceVector(priceCol)[seqs[found]]
+        priceRe[found] = self.market.GetPriceVector(priceReCol)[seqs[found]]
+        rise[found] = self.market.GetPriceVector(4)[seqs[found]]
+        quoted = found & ~np.isnan(price) & ~np.isnan(priceRe) & ~np.isnan(rise)
+        done = np.zeros([len(codes)], dtype = bool)
+        symbolList = [self.csMap.GetSymbol(code) for code in codes.tolist()] if self.csMap is not None else [''] * len(codes)
+        crtDate = self.market.crtDate
+        if drct == '卖':
+            held = found.copy()
+            held[found] = book.held[seqs[found]]
+            ok = held & quoted & (rise >= -0.099)
+            idx = np.flatnonzero(ok)
+            okSeq = seqs[idx]
+            buyNum = book.buyNum[okSeq]
+            amtChg = ((priceRe[idx] / book.buyPriceRe[okSeq] * book.buyPrice[okSeq] * buyNum) * (1 - self.fee)).tolist()
+            buyNum = buyNum.tolist()
+            codeList = codes[idx].tolist()
+            priceList = price[idx].tolist()
+            priceReList = priceRe[idx].tolist()
+            for k, i in enumerate(idx.tolist()):
+                amt = amtChg[k]
+                self.capital += amt
+                self.tradeRecord.append([crtDate, codeList[k], symbolList[i], NumValue(buyNum[k]), 'sell', amt, priceList[k], priceReList[k], comment])
+            book.RemovePos(okSeq)
+            done[idx] = True
+            pending = np.flatnonzero(held & ~ok)
+        elif drct == '买':
+            ok = quoted & (rise <= 0.099)
+            if numList is not None:
+                want = list(numList)
+            else:
+                want = [int(w) if w == w else None for w in (np.trunc(np.asarray(amounts, dtype = float) / (price * 100)) * 100).tolist()]
+            idx = np.flatnonzero(ok)
+            okSeq = seqs[idx]
+            # 原有持仓按现价折算为股数（与MatchBuyDlg相同，视为全部卖出后再等额以现价买入）
+            heldOk = book.held[okSeq]
+            numOld = np.zeros([len(idx)])
+            numOld[heldOk] = np.trunc(priceRe[idx][heldOk] / book.buyPriceRe[okSeq][heldOk] * book.buyPrice[okSeq][heldOk] * book.buyNum[okSeq][heldOk] / price[idx][heldOk])
+            fillIdx = []
+            fillNum = []
+            capital = self.capital
+            fee = self.fee
+            codeList = codes[idx].tolist()
+            priceList = price[idx].tolist()
+            priceReList = priceRe[idx].tolist()
+            wantList = [want[i] for i in idx.tolist()]
+            for k, i in enumerate(idx.tolist()):
+                if not capital > 0:
+                    break
+                p = priceList[k]
+                num = min(int(capital / (1 + fee) / (p * 100)) * 100, wantList[k])
+                if not num > 0:
+                    continue
+                amt = - num * p * (1 + fee)
+                capital += amt
+                fillIdx.append(k)
+                fillNum.append(num)
+                self.tradeRecord.append([crtDate, codeList[k], symbolList[i], num, 'buy', amt, p, priceReList[k], comment])
+            self.capital = capital
+            fillIdx = np.array(fillIdx, dtype = np.int64)
+            fillNum = np.array(fillNum, dtype = float)
+            book.SetPosBatch(okSeq[fillIdx], crtDate, price[idx][fillIdx], priceRe[idx][fillIdx], fillNum + numOld[fillIdx])
+            done[idx[fillIdx]] = True
+            pending = np.flatnonzero(~done)
+        else:
+            return done
+        # 记录未成交的委托
+        dlgDict = self.delegateBuy if drct == '买' else self.delegateSell
+        for i in pending.tolist():
+            dlg = self.NewDlg()
+            dlg.stockCode = int(codes[i])
+            dlg.dlgNum = numList[i] if numList is not None else (want[i] if drct == '买' else None)
+            dlg.dlgPrice = None
+            dlg.dlgAmt = float(amounts[i]) if amounts is not None else None
+            dlg.dlgDrct = drct
+            dlg.dlgTransPoint = transPoint
+            dlg.comment = comment
+            dlgDict[dlg.stockCode] = dlg
+        return done
+
+    def GetPosValueArray(self, priceRe):
+        '''
+        按复权价格计算持仓价值，结果按行情数据源中的股票序号排列
+        :param priceRe: 按股票序号排列的复权价格数组，无效价格为nan
+        :return: 持仓价值数组，价格无效时取持仓的最新价值，未持有的位置为0
+        '''
+        val = self.book.GetValue(priceRe)
+        return np.where(np.isnan(val), self.book.latestVal, val)
+
+    def UpdateVal(self, closeRe = None, posVal = None):
+        '''
+        更新账户净值
+        :param closeRe: 由Market共享的按股票序号排列的收盘复权价格数组，为None时从Market获取
+        :param posVal: 由Market批量计算好的持仓总价值（持仓簿位于Market.bookMatrix中时），指定时直接使用
+        :return:
+        '''
+        if posVal is not None:
+            self.netVal = posVal + self.capital
+            return
+        if closeRe is None:
+            closeRe = self.market.GetPriceVector(3)
+        self.netVal = self.book.MarkToMarket(closeRe) + self.capital
+
+    def GetHoldNum(self):
+        '''
+        获取当前持股数
+        :return:
+        '''
+        return int(self.book.held.sum())
+
+    def GetPosState(self):
+        '''
+        获取持仓状态，用于保存检查点
+        :return: dict类型，key为股票编码，value为(买入日期, 买入价格, 买入价格（复权）, 买入数量, 最新价值)，按持仓的加入次序排列
+        '''
+        book = self.book
+        seqs = book.GetHeldSeq()
+        codes = np.asarray(self.market.dsList[0].codeList)[seqs].tolist()
+        return dict(zip(codes, zip(book.buyDate[seqs].tolist(), book.buyPrice[seqs].tolist(), book.buyPriceRe[seqs].tolist(),
+                                   [NumValue(n) for n in book.buyNum[seqs].tolist()], book.latestVal[seqs].tolist())))
+
+    def SetPosState(self, state):
+        '''
+        以GetPosState的结果恢复持仓（原地修改持仓簿，不改变其与BookMatrix的视图关系）
+        :param state: 持仓状态
+        :return:
+        '''
+        book = self.book
+        book.RemovePos(np.flatnonzero(book.held))
+        book.ClearOrder()
+        book.orderCount = 0
+        for code, (buyDate, buyPrice, buyPriceRe, buyNum, latestVal) in state.items():
+            seq = self.market.GetSeq(code)
+            book.SetPos(seq, buyDate, buyPrice, buyPriceRe, buyNum)
+            book.latestVal[seq] = latestVal
 
+    def MatchBuyDlg(self, dlg):
+        '''
+        成交一个买委托
+        :param dlg: 买委托对象
+        :return:
+        '''
+        code = dlg.stockCode
+        seq = self.market.dsList[0].GetSeq(code)
+        if seq < 0:
+            return False
+        prc = self.market.dsList[0].data[seq]
+        if prc is None:
+            return False
+        # 获取成交价格
+        price, priceRe = self.GetTransPrice(prc, dlg.dlgTransPoint)
+        # 行情数据有效且未涨停且有可用资金
+        if price is not None and priceRe is not None and prc[4] is not None and prc[4] <= 0.099 and self.capital > 0:
+            if dlg.dlgNum is None:  # 如果委托数量为None，则通过委托金额计算委托数量
+                dlg.dlgNum = int(dlg.dlgAmt / (price * 100)) * 100
+            num = min(int(self.capital / (1 + self.fee) / (price * 100)) * 100, dlg.dlgNum)  # 实际可买数量
+            if not num > 0:
+                return False
+            book = self.book
+            if book.held[seq]:  # 有持仓（计算逻辑为将原持仓股票全部卖出后再等额以现价买入）
+                valOld = priceRe / book.buyPriceRe[seq] * book.buyPrice[seq] * book.buyNum[seq]
+                numOld = int(valOld / price)  # 假设原有持仓的股票全部卖出后再立即以卖出所得金额全部现价买入的数量
+                buyNum = num + numOld         # 将新买入的数量与原数量合并，所持有股票全部视为新买入
+            else:  # 无持仓
+                buyNum = num
+            book.SetPos(seq, self.market.crtDate, price, priceRe, buyNum)
+            amtChg = - num * price * (1 + self.fee)
+            self.capital += amtChg
+            symbol = self.csMap.GetSymbol(code) if self.csMap is not None else ''
+            self.tradeRecord.append([self.market.crtDate, code, symbol, num, 'buy', amtChg, price, priceRe, dlg.comment])
+            dlg.SetInvalid()
+            return True
+        else:
+            return False
+
+    def MatchSellDlg(self, dlg):
+        '''
+        成交一个卖委托
+        :param dlg: 卖委托对象
+        :return:
+        '''
+        code = dlg.stockCode
+        seq = self.market.dsList[0].GetSeq(code)
+        if seq < 0 or not self.book.held[seq]:  # 无持仓
+            dlg.SetInvalid()
+            return False
+        prc = self.market.dsList[0].data[seq]
+        if prc is None:
+            return False
+        # 获取成交价格
+        price, priceRe = self.GetTransPrice(prc, dlg.dlgTransPoint)
+        # 行情数据有效且未跌停
+        if price is not None and priceRe is not None and prc[4] is not None and prc[4] >= -0.099:
+            book = self.book
+            buyNum = NumValue(book.buyNum[seq])
+            amtChg = (priceRe / book.buyPriceRe[seq] * book.buyPrice[seq] * buyNum) * (1 - self.fee)
+            self.capital += amtChg
+            symbol = self.csMap.GetSymbol(code) if self.csMap is not None else ''
+            self.tradeRecord.append([self.market.crtDate, code, symbol, buyNum, 'sell', amtChg, price, priceRe, dlg.comment])
+            book.RemovePos(seq)
+            dlg.SetInvalid()
+            return True
+        else:
+            return False
+
+    def ClearInvalidPos(self):
+        '''
+        清理已卖出的持仓记录，持仓簿在卖出时即已移除持仓，此处只清除其加入次序
+        :return:
+        '''
+        self.book.ClearOrder()
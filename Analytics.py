@@ -0,0 +1,278 @@
+import gongcq.CircSeries as CircSeries
+import numpy as np
+
+"""
+每年的交易日数"""
+PERIODS = 250
+"""
+GetMetrics返回的指标名称"""
+METRIC_NAMES = ['totalEar', 'annualEar', 'annualStd', 'sharpe', 'maxDrawdown', 'maxDrawdownDays', 'sortino', 'calmar',
+                'bmTotalEar', 'excessEar', 'trackingError', 'infoRatio', 'turnover', 'tradeNum', 'dayNum']
+
+
+def GetNetValArray(netValList):
+    """
+    将账户的净值list转换为数组
+    :param netValList: Account.netValList，每个元素为[日期, 基准指数, 基准指数涨幅, 账户净值, 账户净值涨幅]
+    :return: 日期list，基准指数数组，基准指数涨幅数组，账户净值数组，账户净值涨幅数组（float64）
+    """
+    dates = [nv[0] for nv in netValList]
+    if len(netValList) == 0:
+        empty = np.zeros([0])
+        return dates, empty, empty, empty, empty
+    mat = np.array([nv[1 : 5] for nv in netValList], dtype = np.float64)
+    return dates, mat[:, 0], mat[:, 1], mat[:, 2], mat[:, 3]
+
+
+def GetExcessCurve(netVal, bm, resetDays = 20):
+    """
+    计算超额收益曲线（向量化）：每resetDays个交易日以当时的账户净值和基准指数为起点重新计算超额收益，各段首尾相乘，
+    与原EvalAccount中逐日循环的计算结果相同
+    :param netVal: 账户净值数组
+    :param bm: 基准指数数组
+    :param resetDays: 重新计算起点的间隔（交易日数）
+    :return: 超额收益曲线（初值为1）
+    """
+    n = len(netVal)
+    if n == 0:
+        return np.zeros([0])
+    index = np.arange(n)
+    anchor = np.maximum(index - 1, 0) // resetDays * resetDays   # 第i日所用的起点
+    factor = 1 + netVal / netVal[anchor] - bm / bm[anchor]
+    factor[0] = 1
+    anchorVal = np.cumprod(factor[:: resetDays])                  # 各起点处的超额收益
+    return anchorVal[anchor // resetDays] * factor
+
+
+def GetDrawdown(netVal):
+    """
+    计算回撤序列
+    :param netVal: 账户净值数组
+    :return: 回撤数组（非正数），距离最近一次净值新高的交易日数数组
+    """
+    n = len(netVal)
+    peak = np.maximum.accumulate(netVal)
+    index = np.arange(n)
+    lastPeak = np.maximum.accumulate(np.where(netVal >= peak, index, 0))
+    return netVal / peak - 1, index - lastPeak
+
+
+def GetTurnover(tradeRecord):
+    """
+    计算交易记录的成交金额
+    :param tradeRecord: Account.tradeRecord，每个元素为[日期, 股票编码, 股票代码, 数量, 方向, 资金变化, 价格, 复权价格, 备注]
+    :return: 总成交金额（买入与卖出之和）
+    """
+    return float(sum([abs(tr[3] * tr[6]) for tr in tradeRecord]))
+
+
+def GetMetrics(netValList, tradeRecord = None, riskFree = 0.0):
+    """
+    计算账户的绩效指标（向量化）
+    :param netValList: Account.netValList
+    :param tradeRecord: Account.tradeRecord，为None时不计算换手率
+    :param riskFree: 年化无风险收益率，用于夏普比率与索提诺比率
+    :return: dict类型：totalEar总收益，annualEar年化收益，annualStd年化波动率，sharpe夏普比率，
+             maxDrawdown最大回撤（正数），maxDrawdownDays最长回撤持续交易日数，sortino索提诺比率，calmar卡玛比率，
+             bmTotalEar基准总收益，excessEar超额总收益，trackingError年化跟踪误差，infoRatio信息比率，
+             turnover年化单边换手率，tradeNum交易笔数，dayNum交易日数；没有净值数据时各指标为nan
+    """
+    dates, bm, bmRise, netVal, rise = GetNetValArray(netValList)
+    tradeNum = len(tradeRecord) if tradeRecord is not None else np.nan
+    n = len(netVal)
+    if n == 0:
+        metrics = dict.fromkeys(METRIC_NAMES, np.nan)
+        metrics['tradeNum'] = tradeNum
+        metrics['dayNum'] = 0
+        return metrics
+    years = n / PERIODS
+    totalEar = netVal[-1] / netVal[0] - 1
+    annualEar = np.power(totalEar + 1, 1 / years) - 1
+    annualStd = rise.std(ddof = 1) * np.sqrt(PERIODS) if n > 1 else np.nan
+    downside = np.sqrt(np.mean(np.minimum(rise, 0) ** 2)) * np.sqrt(PERIODS)
+    drawdown, duration = GetDrawdown(netVal)
+    maxDrawdown = -drawdown.min()
+    bmTotalEar = bm[-1] / bm[0] - 1
+    active = rise - bmRise
+    trackingError = active.std(ddof = 1) * np.sqrt(PERIODS) if n > 1 else np.nan
+    turnover = GetTurnover(tradeRecord) / 2 / netVal.mean() / years if tradeRecord is not None else np.nan
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        return {'totalEar': totalEar, 'annualEar': annualEar, 'annualStd': annualStd,
+                'sharpe': np.float64(annualEar - riskFree) / annualStd,
+                'maxDrawdown': maxDrawdown, 'maxDrawdownDays': int(duration.max()),
+                'sortino': np.float64(annualEar - riskFree) / downside,
+                'calmar': np.float64(annualEar) / maxDrawdown,
+                'bmTotalEar': bmTotalEar, 'excessEar': totalEar - bmTotalEar,
+                'trackingError': trackingError, 'infoRatio': np.float64(active.mean() * PERIODS) / trackingError,
+                'turnover': turnover, 'tradeNum': tradeNum, 'dayNum': n}
+
+
+def GetRollingMetrics(netValList, window = 60):
+    """
+    计算滚动窗口指标（向量化）
+    :param netValList: Account.netValList
+    :param window: 窗口长度（交易日数）
+    :return: pandas.DataFrame类型，以日期为索引，列为窗口收益ear、窗口超额收益excessEar、年化波动率annualStd、夏普比率sharpe、
+             窗口内最大回撤maxDrawdown（正数）、年化跟踪误差trackingError，前window - 1行为nan
+    """
+    import pandas as pd
+    dates, bm, bmRise, netVal, rise = GetNetValArray(netValList)
+    frame = pd.DataFrame({'netVal': netVal, 'bm': bm, 'rise': rise, 'active': rise - bmRise}, index = dates)
+    result = pd.DataFrame(index = dates)
+    result['ear'] = frame['netVal'] / frame['netVal'].shift(window - 1) - 1
+    result['excessEar'] = result['ear'] - (frame['bm'] / frame['bm'].shift(window - 1) - 1)
+    rolling = frame['rise'].rolling(window)
+    result['annualStd'] = rolling.std() * np.sqrt(PERIODS)
+    result['sharpe'] = rolling.mean() * PERIODS / result['annualStd']
+    result['maxDrawdown'] = 1 - (frame['netVal'] / frame['netVal'].rolling(window).max()).rolling(window).min()
+    result['trackingError'] = frame['active'].rolling(window).std() * np.sqrt(PERIODS)
+    return result
+
+
+class MetricTracker:
+    """
+    增量绩效指标：每个交易日加入一条净值记录（或通过Update从账户中读取新增的净值与交易记录），以O(1)的代价更新指标，
+    GetMetrics的结果与对完整历史调用Analytics.GetMetrics相同（浮点误差范围内），适用于实盘中每日发布指标"""
+    """
+    已加入的交易日数"""
+    count = 0
+    """
+    首日与最新的账户净值、基准指数"""
+    firstNetVal = None
+    lastNetVal = None
+    firstBm = None
+    lastBm = None
+    """
+    净值涨幅的均值与离差平方和（Welford算法），下行涨幅的平方和，超额涨幅的均值与离差平方和，净值之和"""
+    riseMean = 0.0
+    riseM2 = 0.0
+    downSq = 0.0
+    activeMean = 0.0
+    activeM2 = 0.0
+    netValSum = 0.0
+    """
+    历史最高净值，最大回撤（非正数），最近一次新高的交易日序号，最长回撤持续交易日数"""
+    peak = None
+    minDrawdown = 0.0
+    lastPeak = 0
+    maxDuration = 0
+    """
+    累计成交金额与交易笔数"""
+    tradeAmt = 0.0
+    tradeNum = 0
+    """
+    最近window个交易日的净值涨幅（CircSeries.RollingWindow对象），为None时不计算滚动指标"""
+    rolling = None
+    """
+    Update已读取的账户净值与交易记录条数"""
+    netValPos = 0
+    tradePos = 0
+
+    def __init__(self, window = None):
+        """
+        构造一个增量绩效指标
+        :param window: 滚动指标的窗口长度（交易日数），为None时不计算滚动指标
+        """
+        self.rolling = CircSeries.RollingWindow(window) if window is not None else None
+
+    def Append(self, netValRow):
+        """
+        加入一个交易日的净值记录
+        :param netValRow: [日期, 基准指数, 基准指数涨幅, 账户净值, 账户净值涨幅]
+        :return:
+        """
+        bm, bmRise, netVal, rise = float(netValRow[1]), float(netValRow[2]), float(netValRow[3]), float(netValRow[4])
+        if self.count == 0:
+            self.firstNetVal = netVal
+            self.firstBm = bm
+            self.peak = netVal
+        self.count += 1
+        self.lastNetVal = netVal
+        self.lastBm = bm
+        self.netValSum += netVal
+        delta = rise - self.riseMean
+        self.riseMean += delta / self.count
+        self.riseM2 += delta * (rise - self.riseMean)
+        self.downSq += min(rise, 0) ** 2
+        active = rise - bmRise
+        delta = active - self.activeMean
+        self.activeMean += delta / self.count
+        self.activeM2 += delta * (active - self.activeMean)
+        if netVal >= self.peak:
+            self.peak = netVal
+            self.lastPeak = self.count - 1
+        else:
+            self.minDrawdown = min(self.minDrawdown, netVal / self.peak - 1)
+            self.maxDuration = max(self.maxDuration, self.count - 1 - self.lastPeak)
+        if self.rolling is not None:
+            self.rolling.Append(rise)
+
+    def AddTrade(self, trade):
+        """
+        加入一条交易记录
+        :param trade: [日期, 股票编码, 股票代码, 数量, 方向, 资金变化, 价格, 复权价格, 备注]
+        :return:
+        """
+        self.tradeAmt += abs(float(trade[3]) * float(trade[6]))
+        self.tradeNum += 1
+
+    def Update(self, act):
+        """
+        从账户中读取上次调用以来新增的净值记录和交易记录
+        :param act: 账户对象
+        :return:
+        """
+        for i in range(self.netValPos, len(act.netValList)):
+            self.Append(act.netValList[i])
+        self.netValPos = len(act.netValList)
+        for i in range(self.tradePos, len(act.tradeRecord)):
+            self.AddTrade(act.tradeRecord[i])
+        self.tradePos = len(act.tradeRecord)
+
+    def GetMetrics(self, riskFree = 0.0):
+        """
+        获取当前的绩效指标
+        :param riskFree: 年化无风险收益率
+        :return: dict类型，与Analytics.GetMetrics相同；设置了滚动窗口时还包括rollingMean（窗口内日均涨幅）与rollingStd（窗口内年化波动率）
+        """
+        n = self.count
+        if n == 0:
+            metrics = dict.fromkeys(METRIC_NAMES, np.nan)
+            metrics['tradeNum'] = self.tradeNum
+            metrics['dayNum'] = 0
+            return metrics
+        years = n / PERIODS
+        totalEar = self.lastNetVal / self.firstNetVal - 1
+        annualEar = np.power(totalEar + 1, 1 / years) - 1
+        annualStd = np.sqrt(self.riseM2 / (n - 1) * PERIODS) if n > 1 else np.nan
+        downside = np.sqrt(self.downSq / n * PERIODS)
+        maxDrawdown = -self.minDrawdown
+        bmTotalEar = self.lastBm / self.firstBm - 1
+        trackingError = np.sqrt(self.activeM2 / (n - 1) * PERIODS) if n > 1 else np.nan
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            metrics = {'totalEar': totalEar, 'annualEar': annualEar, 'annualStd': annualStd,
+                       'sharpe': np.float64(annualEar - riskFree) / annualStd,
+                       'maxDrawdown': maxDrawdown, 'maxDrawdownDays': self.maxDuration,
+                       'sortino': np.float64(annualEar - riskFree) / downside,
+                       'calmar': np.float64(annualEar) / maxDrawdown,
+                       'bmTotalEar': bmTotalEar, 'excessEar': totalEar - bmTotalEar,
+                       'trackingError': trackingError, 'infoRatio': np.float64(self.activeMean * PERIODS) / trackingError,
+                       'turnover': self.tradeAmt / 2 / (self.netValSum / n) / years,
+                       'tradeNum': self.tradeNum, 'dayNum': n}
+        if self.rolling is not None:
+            metrics['rollingMean'] = self.rolling.GetMean()
+            metrics['rollingStd'] = self.rolling.GetStd() * np.sqrt(PERIODS)
+        return metrics
+
+
+def WriteRows(path, rowList):
+    """
+    将二维list写入文本文件，每个元素后跟一个逗号，元素之间以空格分隔，每行以换行符结束
+    （与np.savetxt(path, np.array(rowList), fmt = '%s,', newline = '\\n')的输出相同，但不需要先转换为numpy字符串数组）
+    :param path: 文件路径
+    :param rowList: 二维list
+    :return:
+    """
+    file = open(path, 'w')
+    file.write(''.join(' '.join([str(v) + ',' for v in row]) + '\n' for row in rowList))
+    file.close()
@@ -0,0 +1,445 @@
+import datetime
+import gongcq.DataCache as DataCache
+import gongcq.DbPool as DbPool
+import numpy as np
+import os
+import sqlite3
+import threading
+
+
+class Backend:
+    """
+    数据源后端的基类：设置给DataSource.backend后，DataSource.Fetch不再使用内置的数据库或文本读取逻辑，而是调用后端的Fetch，
+    因此增加新的数据来源时只需实现一个后端类，不需要修改DataSource.GetData。
+    Fetch的返回值与DataSource.Fetch相同，为None（没有数据）或(类型, 内容)：
+    'matrix'为按codeList对齐的整日数组(values, valid)，'block'为第1列为股票编码的数值数组，'records'为数据记录的list，
+    前两种可以直接写入列式存储，不需要逐条处理记录"""
+    """
+    后端类型的名称，用于性能分析器的区间名称"""
+    kind = 'backend'
+
+    def Fetch(self, ds, dateStr):
+        """
+        读取某一日的数据，可以在后台线程中执行
+        :param ds: 数据源对象
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: 读取结果，没有数据时为None
+        """
+        raise NotImplementedError
+
+    def IsReady(self, ds, dateStr):
+        """
+        判断某一日的数据是否已经可以读取
+        :param ds: 数据源对象
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: bool，为None时由DataSource直接读取当日数据来判断
+        """
+        return None
+
+    def GetDateList(self, startDate = None, endDate = None):
+        """
+        获取后端中有数据的日期，可以用于构造Calendar.TradeCalendar
+        :param startDate: 起始日期（含），为None时不限
+        :param endDate: 截止日期（含），为None时不限
+        :return: 按时间顺序排列的'%Y-%m-%d'格式日期字符串list
+        """
+        raise NotImplementedError
+
+    def Put(self, ds, dateStr, values, valid):
+        """
+        写入某一日的数据，用于将历史数据从数据库迁移到本地存储
+        :param ds: 数据源对象
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :param values: shape为(codeCount, fieldNum)的float64数组（第1列为股票编码），即DataSource.GetMatrix的结果
+        :param valid: shape为(codeCount,)的有效性掩码
+        :return:
+        """
+        raise NotImplementedError
+
+
+def FilterDates(dateStrList, startDate, endDate):
+    """
+    按起止日期筛选日期字符串并排序
+    :param dateStrList: '%Y-%m-%d'格式的日期字符串list
+    :param startDate: 起始日期（含），为None时不限
+    :param endDate: 截止日期（含），为None时不限
+    :return: 筛选后按时间顺序排列的list
+    """
+    startStr = None if startDate is None else startDate.strftime('%Y-%m-%d')
+    endStr = None if endDate is None else endDate.strftime('%Y-%m-%d')
+    return sorted(d for d in dateStrList if (startStr is None or d >= startStr) and (endStr is None or d <= endStr))
+
+
+class SqlBackend(Backend):
+    """
+    Oracle或MySQL数据库后端：在指定的数据库中执行数据源的sql语句，可以使同一个数据源改为从另一个数据库（如只读副本）读取数据"""
+    kind = 'db'
+    """
+    数据库链接字符串（Oracle为str类型，MySQL为dict类型）"""
+    connStr = None
+    """
+    sql命令，以{TRADE_DATE}表示日期，为None时使用数据源的sql"""
+    sql = None
+
+    def __init__(self, connStr, sql = None):
+        """
+        构造一个数据库后端
+        :param connStr: 数据库链接字符串
+        :param sql: sql命令，为None时使用数据源的sql
+        """
+        self.connStr = connStr
+        self.sql = sql
+
+    def Fetch(self, ds, dateStr):
+        sql = ds.sql if self.sql is None else self.sql
+        records = DbPool.Query(self.connStr, sql.replace('{TRADE_DATE}', dateStr))
+        if len(records) == 0 or (len(records) == 1 and records[0] is None):
+            return None
+        return 'records', records
+
+
+class TextBackend(Backend):
+    """
+    定宽格式文本文件后端：每日一个'%Y-%m-%d.csv'文件，格式见DataSource.ParseText"""
+    kind = 'text'
+    """
+    文本文件所在目录"""
+    root = None
+
+    def __init__(self, root):
+        """
+        构造一个文本文件后端
+        :param root: 文本文件所在目录
+        """
+        self.root = root
+
+    def Fetch(self, ds, dateStr):
+        path = os.path.join(self.root, dateStr + '.csv')
+        if not os.path.exists(path):
+            return None
+        return 'text', ds.ParseText(path)
+
+    def IsReady(self, ds, dateStr):
+        return os.path.exists(os.path.join(self.root, dateStr + '.csv'))
+
+    def GetDateList(self, startDate = None, endDate = None):
+        return FilterDates([name[: -4] for name in os.listdir(self.root) if name.endswith('.csv')], startDate, endDate)
+
+
+class MemoryBackend(Backend):
+    """
+    内存数组后端：数据以按codeList对齐的整日数组存放在内存中，Fetch直接返回数组的视图，
+    用于测试和参数扫描中以合成数据或预先读取的数据驱动回测，同一后端可以被多个codeList相同的数据源共用"""
+    kind = 'memory'
+    """
+    每日的数据，key为'%Y-%m-%d'格式的日期字符串，value为(values, valid)"""
+    dayDict = None
+
+    def __init__(self, dateStrList = None, values = None, valid = None):
+        """
+        构造一个内存数组后端，可以用面板数据初始化
+        :param dateStrList: '%Y-%m-%d'格式的日期字符串list，与面板的第0维对应，为None时构造一个空的后端
+        :param values: shape为(日期数, codeCount, fieldNum)的float64数组（第1列为股票编码）
+        :param valid: shape为(日期数, codeCount)的bool数组
+        """
+        self.dayDict = dict()
+        if dateStrList is not None:
+            for i, dateStr in enumerate(dateStrList):
+                self.dayDict[dateStr] = (values[i], valid[i])
+
+    def Fetch(self, ds, dateStr):
+        day = self.dayDict.get(dateStr)
+        if day is None or not day[1].any():
+            return None
+        return 'matrix', day
+
+    def IsReady(self, ds, dateStr):
+        return dateStr in self.dayDict
+
+    def GetDateList(self, startDate = None, endDate = None):
+        return FilterDates(self.dayDict.keys(), startDate, endDate)
+
+    def Put(self, ds, dateStr, values, valid):
+        self.dayDict[dateStr] = (values, valid)
+
+
+class NpzBackend(Backend):
+    """
+    本地npz文件后端：每日一个'%Y-%m-%d.npz'文件，其中的block数组即DataSource.FillBlock所用的数值数组（第1列为股票编码，只含有数据的股票），
+    与数据源的codeList无关，读取时只需解压（或直接读取）数组，不需要任何解析"""
+    kind = 'npz'
+    """
+    文件所在目录"""
+    root = None
+    """
+    写入时是否压缩"""
+    compressed = False
+
+    def __init__(self, root, compressed = False):
+        """
+        构造一个npz文件后端
+        :param root: 文件所在目录，不存在时自动创建
+        :param compressed: 写入时是否压缩（压缩后文件更小，但读取更慢）
+        """
+        self.root = root
+        self.compressed = compressed
+        os.makedirs(self.root, exist_ok = True)
+
+    def Fetch(self, ds, dateStr):
+        path = os.path.join(self.root, dateStr + '.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as file:
+            block = file['block']
+        if len(block) == 0:
+            return None
+        return 'block', block
+
+    def IsReady(self, ds, dateStr):
+        return os.path.exists(os.path.join(self.root, dateStr + '.npz'))
+
+    def GetDateList(self, startDate = None, endDate = None):
+        return FilterDates([name[: -4] for name in os.listdir(self.root) if name.endswith('.npz')], startDate, endDate)
+
+    def Put(self, ds, dateStr, values, valid):
+        path = os.path.join(self.root, dateStr + '.npz')
+        tempPath = path + '.' + str(os.getpid()) + '.tmp'
+        file = open(tempPath, 'wb')
+        (np.savez_compressed if self.compressed else np.savez)(file, block = np.ascontiguousarray(values[valid]))
+        file.close()
+        os.replace(tempPath, path)
+
+
+class ArrowBackend(Backend):
+    """
+    本地Parquet或Feather文件后端：每日一个文件，列为数据源的第1至fieldNum-1个字段（第1列为股票编码），便于与其他工具交换数据；
+    需要安装pyarrow，pyarrow在第一次读写时才被导入"""
+    """
+    文件所在目录"""
+    root = None
+    """
+    文件格式，'parquet'或'feather'"""
+    fileFormat = 'parquet'
+    """
+    写入时的列名list（不含第0列日期），为None时为'f1'、'f2'……；读取时按列的顺序对应字段，与列名无关"""
+    columnList = None
+
+    def __init__(self, root, fileFormat = 'parquet', columnList = None):
+        """
+        构造一个Parquet或Feather文件后端
+        :param root: 文件所在目录，不存在时自动创建
+        :param fileFormat: 文件格式，'parquet'或'feather'
+        :param columnList: 写入时的列名list
+        """
+        if fileFormat not in ('parquet', 'feather'):
+            raise ValueError('unsupported file format: ' + str(fileFormat))
+        self.root = root
+        self.fileFormat = fileFormat
+        self.kind = fileFormat
+        self.columnList = columnList
+        os.makedirs(self.root, exist_ok = True)
+
+    def GetPath(self, dateStr):
+        """
+        获取某一日的文件路径
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: 文件路径
+        """
+        return os.path.join(self.root, dateStr + '.' + self.fileFormat)
+
+    def Fetch(self, ds, dateStr):
+        path = self.GetPath(dateStr)
+        if not os.path.exists(path):
+            return None
+        if self.fileFormat == 'parquet':
+            import pyarrow.parquet as pq
+            table = pq.read_table(path)
+        else:
+            import pyarrow.feather as feather
+            table = feather.read_table(path)
+        if table.num_rows == 0:
+            return None
+        block = np.full([table.num_rows, ds.fieldNum], np.nan)
+        for i in range(min(table.num_columns, ds.fieldNum - 1)):
+            block[:, i + 1] = table.column(i).to_numpy(zero_copy_only = False)
+        return 'block', block
+
+    def IsReady(self, ds, dateStr):
+        return os.path.exists(self.GetPath(dateStr))
+
+    def GetDateList(self, startDate = None, endDate = None):
+        suffix = '.' + self.fileFormat
+        return FilterDates([name[: -len(suffix)] for name in os.listdir(self.root) if name.endswith(suffix)], startDate, endDate)
+
+    def Put(self, ds, dateStr, values, valid):
+        import pyarrow as pa
+        block = values[valid]
+        nameList = self.columnList if self.columnList is not None else ['f' + str(i) for i in range(1, ds.fieldNum)]
+        table = pa.table({name: block[:, i + 1] for i, name in enumerate(nameList)})
+        path = self.GetPath(dateStr)
+        tempPath = path + '.' + str(os.getpid()) + '.tmp'
+        if self.fileFormat == 'parquet':
+            import pyarrow.parquet as pq
+            pq.write_table(table, tempPath)
+        else:
+            import pyarrow.feather as feather
+            feather.write_feather(table, tempPath)
+        os.replace(tempPath, path)
+
+
+"""
+SQLite替身数据库的表结构，与Tools中sql语句所用的UPCENTER下的表同名同字段，日期字段以'%Y-%m-%d'格式的字符串存储"""
+SQLITE_SCHEMA = {
+    'STK_BASIC_PRICE_MID': 'TRADE_DATE TEXT, STK_UNI_CODE INTEGER, CLOSE_PRICE REAL, CLOSE_PRICE_RE REAL, RISE_DROP_RANGE_RE REAL, '
+                           'OPEN_PRICE REAL, OPEN_PRICE_RE REAL, STK_TOT_VALUE REAL, STK_CIR_VALUE REAL, TRADE_VOL REAL, TRADE_AMUT REAL, '
+                           'TURNOVER_RATE REAL, ISVALID INTEGER DEFAULT 1',
+    'IND_BASIC_MQ': 'TRADE_DATE TEXT, IND_UNI_CODE INTEGER, CLOSE_PRICE REAL, OPEN_PRICE REAL, CHAN_RATE REAL, ISVALID INTEGER DEFAULT 1',
+    'PUB_EXCH_CALE': 'END_DATE TEXT, IS_TRADE_DATE INTEGER, SEC_MAR_PAR INTEGER',
+    'IND_SAMP_INFO': 'SEC_UNI_CODE INTEGER, IND_ID INTEGER, IN_DATE TEXT, OUT_DATE TEXT, ISVALID INTEGER DEFAULT 1'}
+"""
+SQLite替身数据库的索引"""
+SQLITE_INDEX = {
+    'STK_BASIC_PRICE_MID': 'TRADE_DATE, STK_UNI_CODE',
+    'IND_BASIC_MQ': 'TRADE_DATE, IND_UNI_CODE',
+    'PUB_EXCH_CALE': 'END_DATE'}
+
+
+def ToDate(text, fmt):
+    """
+    SQLite中的TO_DATE函数：日期以'%Y-%m-%d'格式的字符串存储，因此原样返回
+    :param text: 日期字符串
+    :param fmt: 日期格式（忽略）
+    :return: 日期字符串
+    """
+    return text
+
+
+class SqliteBackend(Backend):
+    """
+    SQLite后端，作为Oracle数据库的本地替身：数据库以UPCENTER的名称附加到连接上并注册TO_DATE函数，
+    因此Tools中的sql语句（及数据源的sql）不需要修改即可执行；每个线程使用各自的连接，可以在后台读取线程中执行。
+    列式数据源的结果直接转换为数值数组"""
+    kind = 'sqlite'
+    """
+    数据库文件路径"""
+    path = None
+    """
+    sql命令，以{TRADE_DATE}表示日期，为None时使用数据源的sql"""
+    sql = None
+    """
+    交易日区间sql，以{START_DATE}和{END_DATE}作为区间的起止日期，用于GetDateList"""
+    cldRangeSql = None
+    """
+    各线程的连接"""
+    local = None
+
+    def __init__(self, path, sql = None, cldRangeSql = None):
+        """
+        构造一个SQLite后端
+        :param path: 数据库文件路径
+        :param sql: sql命令，为None时使用数据源的sql
+        :param cldRangeSql: 交易日区间sql，为None时使用Tools.sqlCldRange
+        """
+        self.path = path
+        self.sql = sql
+        self.cldRangeSql = cldRangeSql
+        self.local = threading.local()
+
+    def __getstate__(self):
+        """
+        序列化时不保存数据库连接
+        :return:
+        """
+        state = self.__dict__.copy()
+        state.pop('local', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.local = threading.local()
+
+    def Connect(self):
+        """
+        获取当前线程的数据库连接，不存在时创建
+        :return: sqlite3连接对象
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(':memory:')
+            conn.execute('ATTACH DATABASE ? AS UPCENTER', (self.path,))
+            conn.create_function('TO_DATE', 2, ToDate, deterministic = True)
+            self.local.conn = conn
+        return conn
+
+    def Query(self, sqlText, params = ()):
+        """
+        执行一条查询
+        :param sqlText: sql语句
+        :param params: 查询参数
+        :return: 查询结果的list
+        """
+        return self.Connect().execute(sqlText, params).fetchall()
+
+    def Fetch(self, ds, dateStr):
+        sql = ds.sql if self.sql is None else self.sql
+        records = self.Query(sql.replace('{TRADE_DATE}', dateStr))
+        if len(records) == 0:
+            return None
+        if ds.columnar:
+            block = DataCache.RecordsToBlock(records, ds.fieldNum)
+            if block is not None:
+                return 'block', block
+        date = datetime.datetime.strptime(dateStr, '%Y-%m-%d')
+        return 'records', [(date,) + record[1:] for record in records]
+
+    def GetDateList(self, startDate = None, endDate = None):
+        sql = self.cldRangeSql
+        if sql is None:
+            import gongcq.Tools as Tools
+            sql = Tools.sqlCldRange
+        sql = sql.replace('{START_DATE}', '0000-00-00' if startDate is None else startDate.strftime('%Y-%m-%d'))
+        sql = sql.replace('{END_DATE}', '9999-99-99' if endDate is None else endDate.strftime('%Y-%m-%d'))
+        return [record[0] for record in self.Query(sql)]
+
+    def CreateSchema(self):
+        """
+        在数据库中创建SQLITE_SCHEMA中的表和索引（已存在的不重复创建）
+        :return:
+        """
+        conn = self.Connect()
+        for table, columns in SQLITE_SCHEMA.items():
+            conn.execute('CREATE TABLE IF NOT EXISTS UPCENTER.' + table + ' (' + columns + ')')
+        for table, columns in SQLITE_INDEX.items():
+            conn.execute('CREATE INDEX IF NOT EXISTS UPCENTER.IDX_' + table + ' ON ' + table + ' (' + columns + ')')
+        conn.commit()
+
+    def Insert(self, table, columnList, rowList):
+        """
+        向表中批量插入数据
+        :param table: 表名
+        :param columnList: 列名list
+        :param rowList: 数据行的list，日期字段须为'%Y-%m-%d'格式的字符串
+        :return:
+        """
+        conn = self.Connect()
+        conn.executemany('INSERT INTO UPCENTER.' + table + ' (' + ', '.join(columnList) + ') VALUES (' + ', '.join(['?'] * len(columnList)) + ')',
+                         rowList)
+        conn.commit()
+
+
+def ExportData(ds, backend, dateList):
+    """
+    将数据源在若干日期的数据逐日写入后端，用于将历史数据从生产数据库迁移到本地存储；会改变数据源的当前数据
+    :param ds: 数据源对象
+    :param backend: 支持Put的后端对象
+    :param dateList: 日期list
+    :return: 写入的天数（没有数据的日期不写入）
+    """
+    count = 0
+    for date in dateList:
+        if not ds.GetData(date):
+            continue
+        values, valid = ds.GetMatrix()
+        backend.Put(ds, date.strftime('%Y-%m-%d'), values, valid)
+        count += 1
+    return count
@@ -0,0 +1,618 @@
+import datetime
+import gongcq.Account as Account
+import gongcq.Calendar as Calendar
+import gongcq.CircSeries as CircSeries
+import gongcq.CodeSymbol as CodeSymbol
+import gongcq.Market as Market
+import numpy as np
+import os
+import pandas as pd
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def MakePanel(codeNum, dayNum, seed = 0, suspendRate = 0.02, beginDate = datetime.datetime(2015, 1, 1), extraNum = 0):
+    """
+    生成模拟行情面板（几何随机游走），格式与Sweep.SaveMarketData保存的面板相同，列规范与Market.Market中的说明一致
+    :param codeNum: 股票数量，股票编码为1 ~ codeNum
+    :param dayNum: 交易日数量，交易日为beginDate之后的工作日
+    :param seed: 随机数种子
+    :param suspendRate: 每只股票每日停牌（没有数据记录）的概率
+    :param beginDate: 起始日期（不含）
+    :param extraNum: 行情数据源第7列之后的自定义列数，前5列依次为总市值、流通市值、成交量、成交额、换手率（与Tools.sqlPrc相同），其余为随机数
+    :return: 交易日list，行情面板(dayNum, codeNum, 7 + extraNum)，有效性掩码(dayNum, codeNum)，指数面板(dayNum, 1, 5)，指数有效性掩码(dayNum, 1)
+    """
+    rng = np.random.default_rng(seed)
+    dateList = []
+    date = beginDate
+    while len(dateList) < dayNum:
+        date = date + datetime.timedelta(days = 1)
+        if date.weekday() < 5:
+            dateList.append(date)
+    rise = np.clip(rng.normal(0.0003, 0.025, [dayNum, codeNum]), -0.1, 0.1)
+    gap = rng.normal(0, 0.005, [dayNum, codeNum])
+    closeRe = 10 * np.cumprod(1 + rise, axis = 0)
+    openRe = closeRe / (1 + rise) * (1 + gap)
+    values = np.empty([dayNum, codeNum, 7 + extraNum])
+    values[:, :, 0] = np.nan
+    values[:, :, 1] = np.arange(1, codeNum + 1)
+    values[:, :, 2] = np.round(closeRe, 2)
+    values[:, :, 3] = closeRe
+    values[:, :, 4] = rise
+    values[:, :, 5] = np.round(openRe, 2)
+    values[:, :, 6] = openRe
+    if extraNum > 0:
+        shares = rng.lognormal(20, 1, [codeNum])
+        turnover = rng.lognormal(-4.5, 0.8, [dayNum, codeNum])
+        extra = [values[:, :, 2] * shares, values[:, :, 2] * shares * 0.6, shares * 0.6 * turnover,
+                 values[:, :, 2] * shares * 0.6 * turnover, turnover * 100]
+        for k in range(extraNum):
+            values[:, :, 7 + k] = extra[k] if k < len(extra) else rng.normal(0, 1, [dayNum, codeNum])
+    valid = rng.random([dayNum, codeNum]) >= suspendRate
+    values[~valid, 2:] = np.nan
+    validNum = valid.sum(axis = 1)
+    bmRise = np.where(valid, rise, 0).sum(axis = 1) / np.maximum(validNum, 1)   # 所有股票均停牌的交易日指数涨幅为0
+    bmClose = 1000 * np.cumprod(1 + bmRise)
+    bmValues = np.empty([dayNum, 1, 5])
+    bmValues[:, 0, 0] = np.nan
+    bmValues[:, 0, 1] = 0
+    bmValues[:, 0, 2] = bmClose
+    bmValues[:, 0, 3] = bmClose / (1 + bmRise)
+    bmValues[:, 0, 4] = bmRise
+    bmValid = np.ones([dayNum, 1], dtype = bool)
+    return dateList, values, valid, bmValues, bmValid
+
+
+def MakeMarket(codeNum, dayNum, seed = 0, columnar = False):
+    """
+    创建一个使用模拟行情的Market对象，不访问数据库：行情数据源和指数数据源均挂载模拟面板，交易日历为面板的交易日
+    :param codeNum: 股票数量
+    :param dayNum: 交易日数量
+    :param seed: 随机数种子
+    :param columnar: 数据源是否采用列式存储
+    :return: Market对象，交易日list
+    """
+    dateList, values, valid, bmValues, bmValid = MakePanel(codeNum, dayNum, seed)
+    os.makedirs(os.path.join('.', 'logfile'), exist_ok = True)
+    mkt = Market.Market(None, None, dateList[0] - datetime.timedelta(days = 1))
+    mkt.CreateDataSource(None, 'SYNTHETIC', list(range(1, codeNum + 1)), None, 7, columnar = columnar)
+    mkt.CreateDataSource(None, 'SYNTHETIC', [0], None, 5, 'INDEX', columnar = columnar)
+    dateStrList = [date.strftime('%Y-%m-%d') for date in dateList]
+    mkt.dsList[0].AttachPanel(dateStrList, values, valid)
+    mkt.dsList[1].AttachPanel(dateStrList, bmValues, bmValid)
+    mkt.SetCalendar(Calendar.TradeCalendar(dateList))
+    return mkt, dateList
+
+
+def MakeCodeSymbol(codeNum):
+    """
+    生成模拟的股票编码代码映射，股票编码为1 ~ codeNum，股票代码为600001起的6位数字
+    :param codeNum: 股票数量
+    :return: CodeSymbol.CodeSymbol对象
+    """
+    codeList = list(range(1, codeNum + 1))
+    symbolList = ['%06d' % (600000 + code) for code in codeList]
+    return CodeSymbol.CodeSymbol(None, (codeList, symbolList, ['S' + symbol for symbol in symbolList], [1] * codeNum))
+
+
+def FormatField(value):
+    """
+    将一个数值格式化为定宽文本数据中的字段（宽9个字符），无效值的末字符不是数字
+    :param value: 数值
+    :return: 长度为9的str
+    """
+    if value != value:
+        return '        -'
+    for digits in range(6, -1, -1):   # 在宽度内保留尽量多的小数位
+        text = '%9.*f' % (digits, value)
+        if len(text) <= 9:
+            return text
+    return '%9.3e' % value if abs(value) < 1e100 else '        -'
+
+
+def WriteTextData(path, dateList, values, valid, csMap, dayIndex = None):
+    """
+    将行情面板写为文本数据源所读取的定宽格式文件（每个交易日一个'%Y-%m-%d.csv'文件）：
+    每行前11个字符为日期，第11至18个字符为股票代码，从第20个字符开始每10个字符为一个字段（面板的第2列起）
+    :param path: 保存目录
+    :param dateList: 交易日list
+    :param values: 行情面板
+    :param valid: 有效性掩码
+    :param csMap: 股票编码代码映射对象
+    :param dayIndex: 需要写入的交易日下标list，为None时写入所有交易日
+    :return:
+    """
+    os.makedirs(path, exist_ok = True)
+    for i in (range(len(dateList)) if dayIndex is None else dayIndex):
+        dateStr = dateList[i].strftime('%Y-%m-%d')
+        lineList = []
+        for seq in np.nonzero(valid[i])[0].tolist():
+            row = values[i, seq]
+            lineList.append(dateStr + ' ' + '%8s' % csMap.GetSymbol(int(row[1])) + ' ' + ' '.join(FormatField(v) for v in row[2 :].tolist()) + '\n')
+        file = open(os.path.join(path, dateStr + '.csv'), 'w')
+        file.write(''.join(lineList))
+        file.close()
+
+
+def TimeCall(func, minTime = 0.1, repeat = 3):
+    """
+    测量一个函数每次调用的耗时：自动确定调用次数使每轮耗时不少于minTime，重复repeat轮取最短的一轮
+    :param func: 无参数的函数
+    :param minTime: 每轮的最短耗时（秒）
+    :param repeat: 重复轮数
+    :return: 每次调用的耗时（秒）
+    """
+    number = 1
+    while True:
+        begin = time.perf_counter()
+        for i in range(number):
+            func()
+        elapsed = time.perf_counter() - begin
+        if elapsed >= minTime or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(int(minTime / elapsed * number * 1.2) // number + 1, 100))
+    best = elapsed / number
+    for r in range(repeat - 1):
+        begin = time.perf_counter()
+        for i in range(number):
+            func()
+        best = min(best, (time.perf_counter() - begin) / number)
+    return best
+
+
+def TimeMatch(act, codes, amount, repeat = 3):
+    """
+    测量账户逐个成交买委托和卖委托的耗时：买入codes中的全部股票再全部卖出，重复repeat轮取最短的一轮
+    :param act: 账户对象，当日行情须已读取
+    :param codes: 股票编码list
+    :param amount: 每只股票的委托金额
+    :param repeat: 重复轮数
+    :return: 每个买委托的耗时（秒），每个卖委托的耗时（秒）
+    """
+    capital = act.capital
+    buyTime = sellTime = np.inf
+    for r in range(repeat):
+        begin = time.perf_counter()
+        for code in codes:
+            act.AddDlg(code, None, None, amount, '买', '', 'c')
+        middle = time.perf_counter()
+        for code in codes:
+            act.AddDlg(code, None, None, None, '卖', '', 'c')
+        end = time.perf_counter()
+        buyTime = min(buyTime, (middle - begin) / len(codes))
+        sellTime = min(sellTime, (end - middle) / len(codes))
+        act.ClearInvalidPos()
+        act.RecycleDlg(act.delegateBuy)
+        act.RecycleDlg(act.delegateSell)
+        act.capital = capital
+    return buyTime, sellTime
+
+
+def RunTimingBenchmark(codeNum = 2000, dayNum = 250, holdNum = 100, extraNum = 5, textDays = 5, window = 20, evalAccount = True, seed = 0):
+    """
+    核心循环的耗时基准测试，在模拟数据上分别测量：
+    各类数据源的GetData（面板、列式面板、定宽文本、列式定宽文本）及数据库记录的Fill，
+    dict持仓账户与数组持仓账户的MatchBuyDlg/MatchSellDlg（每个委托）、UpdateVal与NewDayHandler（持有holdNum只股票），
+    CircSeriesNum（容量为dayNum、元素为所有股票的向量）的GetRegionBw/GetRegionFw/GetWindow，以及EvalAccount（净值长度为dayNum）
+    :param codeNum: 股票数量
+    :param dayNum: 交易日数量（回测长度）
+    :param holdNum: 账户持股数
+    :param extraNum: 行情数据源的自定义列数
+    :param textDays: 写入定宽文本文件的交易日数
+    :param window: CircSeriesNum取区间的长度
+    :param evalAccount: 是否测量EvalAccount（需要绘图，耗时较长）
+    :param seed: 随机数种子
+    :return: dict类型的测试结果，key为测试项，value为每次调用的耗时（秒）
+    """
+    result = dict()
+    dateList, values, valid, bmValues, bmValid = MakePanel(codeNum, dayNum, seed, extraNum = extraNum)
+    fieldNum = values.shape[2]
+    dateStrList = [date.strftime('%Y-%m-%d') for date in dateList]
+    codeList = list(range(1, codeNum + 1))
+    csMap = MakeCodeSymbol(codeNum)
+    root = tempfile.mkdtemp(prefix = 'gongcq benchmark ')
+    try:
+        os.makedirs(os.path.join('.', 'logfile'), exist_ok = True)
+        textDays = min(textDays, dayNum)
+        WriteTextData(os.path.join(root, 'text'), dateList, values, valid, csMap, range(textDays))
+        Calendar.TradeCalendar(dateList).Save(os.path.join(root, 'calendar.txt'))
+        # 数据源
+        mkt = Market.Market(None, None, dateList[0] - datetime.timedelta(days = 1))
+        for columnar in (False, True):
+            suffix = '[columnar]' if columnar else ''
+            ds = Market.DataSource(None, 'SYNTHETIC', codeList, csMap, fieldNum, columnar = columnar)
+            ds.AttachPanel(dateStrList, values, valid)
+            counter = [0]
+
+            def GetPanel():
+                ds.GetData(dateList[counter[0] % dayNum])
+                counter[0] += 1
+            result['GetData[panel]' + suffix] = TimeCall(GetPanel)
+            ds = Market.DataSource(os.path.join(root, 'text'), None, codeList, csMap, fieldNum, columnar = columnar)
+
+            def GetText():
+                ds.GetData(dateList[counter[0] % textDays])
+                counter[0] += 1
+            result['GetData[text]' + suffix] = TimeCall(GetText)
+            ds = Market.DataSource(None, 'SYNTHETIC', codeList, csMap, fieldNum, columnar = columnar)
+            records = [(dateList[0], int(row[1])) + tuple(row[2 :].tolist()) for row in values[0][valid[0]]]
+
+            def FillRecords():
+                ds.ClearData()
+                ds.Fill(dateList[0], ('records', records))
+            result['Fill[records]' + suffix] = TimeCall(FillRecords)
+        # 账户
+        mkt = Market.Market(None, None, dateList[0] - datetime.timedelta(days = 1))
+        mkt.CreateDataSource(None, 'SYNTHETIC', codeList, csMap, fieldNum)
+        mkt.CreateDataSource(None, 'SYNTHETIC', [0], None, 5, 'INDEX')
+        mkt.dsList[0].AttachPanel(dateStrList, values, valid)
+        mkt.dsList[1].AttachPanel(dateStrList, bmValues, bmValid)
+        mkt.SetCalendar(Calendar.TradeCalendar(dateList))
+        mkt.SetBatchVal(1)
+        mkt.Run(dateList[0], dateList[0])
+        codes = np.random.default_rng(seed + 1).choice(np.nonzero(valid[0])[0] + 1, min(holdNum, int(valid[0].sum())), replace = False).tolist()
+        for arrayBook in (False, True):
+            suffix = '[array]' if arrayBook else ''
+            act = mkt.CreateAccount(len(mkt.actList), 1e9, csMap, arrayBook = arrayBook)
+            result['MatchBuyDlg' + suffix], result['MatchSellDlg' + suffix] = TimeMatch(act, codes, 1e9 / len(codes) / 2)
+            for code in codes:
+                act.AddDlg(code, None, None, 1e9 / len(codes) / 2, '买', '', 'c')
+            result['UpdateVal' + suffix] = TimeCall(act.UpdateVal)
+            closeRe = mkt.GetPriceVector(3)
+            result['NewDayHandler' + suffix] = TimeCall(lambda: act.NewDayHandler(closeRe))
+            del act.netValList[:]
+        # 循环序列
+        series = CircSeries.CircSeriesNum(dayNum, codeNum)
+        for i in range(dayNum + dayNum // 3):
+            series.Append(values[i % dayNum, :, 3])
+        window = min(window, dayNum)
+        result['CircSeriesNum.GetRegionBw'] = TimeCall(lambda: series.GetRegionBw(0, -window))
+        result['CircSeriesNum.GetRegionFw'] = TimeCall(lambda: series.GetRegionFw(dayNum - window, dayNum))
+        result['CircSeriesNum.GetWindow'] = TimeCall(lambda: series.GetWindow(window))
+        # 绩效评估
+        if evalAccount:
+            act = mkt.actList[0]
+            netVal = 1e9 * np.cumprod(1 + np.nanmean(values[:, :, 4], axis = 1))
+            act.netValList = [[dateList[i], bmValues[i, 0, 2], bmValues[i, 0, 4], netVal[i], netVal[i] / netVal[i - 1] - 1 if i > 0 else 0]
+                              for i in range(dayNum)]
+            begin = time.perf_counter()
+            act.EvalAccount(root, 'benchmark')
+            result['EvalAccount'] = time.perf_counter() - begin
+        mkt.SetBacktest(False)
+    finally:
+        shutil.rmtree(root, ignore_errors = True)
+    return result
+
+
+def RunTimingSuite(codeNumList = (500, 2000, 5000, 10000), dayNumList = (250, 1000), resultPath = None, label = None, **kwargs):
+    """
+    在多种股票数量和回测长度下运行耗时基准测试
+    :param codeNumList: 股票数量list
+    :param dayNumList: 交易日数量list
+    :param resultPath: 结果文件（csv）路径，不为None时将结果追加写入此文件，用于比较不同版本的耗时
+    :param label: 结果的标签（例如版本号），写入结果文件
+    :param kwargs: 传递给RunTimingBenchmark的其他参数
+    :return: pandas.DataFrame类型的结果表，列为label、time、codeNum、dayNum、item、seconds
+    """
+    rowList = []
+    now = datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for codeNum in codeNumList:
+        for dayNum in dayNumList:
+            result = RunTimingBenchmark(codeNum, dayNum, **kwargs)
+            for item, seconds in result.items():
+                rowList.append({'label': label, 'time': now, 'codeNum': codeNum, 'dayNum': dayNum, 'item': item, 'seconds': seconds})
+    frame = pd.DataFrame(rowList, columns = ['label', 'time', 'codeNum', 'dayNum', 'item', 'seconds'])
+    if resultPath is not None:
+        frame.to_csv(resultPath, mode = 'a', header = not os.path.exists(resultPath), index = False)
+    return frame
+
+
+def CompareTiming(resultPath, baseLabel, label):
+    """
+    比较结果文件中两个标签的耗时
+    :param resultPath: 结果文件路径
+    :param baseLabel: 基准标签
+    :param label: 比较的标签
+    :return: pandas.DataFrame类型的比较表，ratio为label的耗时与baseLabel的耗时之比（小于1表示变快），同一标签有多次结果时取最新一次
+    """
+    frame = pd.read_csv(resultPath)
+    frame = frame.sort_values('time').drop_duplicates(['label', 'codeNum', 'dayNum', 'item'], keep = 'last')
+    base = frame[frame['label'] == baseLabel].set_index(['codeNum', 'dayNum', 'item'])['seconds']
+    new = frame[frame['label'] == label].set_index(['codeNum', 'dayNum', 'item'])['seconds']
+    table = pd.DataFrame({'base': base, 'new': new}).dropna()
+    table['ratio'] = table['new'] / table['base']
+    return table.reset_index()
+
+
+"""
+导入耗时基准测试中检查是否被导入的第三方模块"""
+HEAVY_MODULES = ['numpy', 'pandas', 'matplotlib', 'cx_Oracle', 'pymysql']
+
+
+def RunImportBenchmark(moduleList = ('gongcq.Market', 'gongcq.Account', 'gongcq.Sweep', 'gongcq.Checkpoint', 'gongcq.Scheduler'), repeat = 5):
+    """
+    导入耗时基准测试：在新的Python进程中分别导入各模块（与子进程冷启动时的情形相同），测量导入耗时并检查导入了哪些较重的第三方模块
+    :param moduleList: 模块名list
+    :param repeat: 每个模块的测量次数，取中位数
+    :return: pandas.DataFrame类型的结果表，列为module、seconds（导入耗时的中位数）、heavy（被导入的第三方模块）
+    """
+    code = ('import sys, time\n'
+            'begin = time.perf_counter()\n'
+            'import {MODULE}\n'
+            'print(time.perf_counter() - begin)\n'
+            'print(",".join(name for name in ' + repr(HEAVY_MODULES) + ' if name in sys.modules))\n')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path != '')
+    rowList = []
+    for module in moduleList:
+        timeList = []
+        heavy = None
+        for i in range(repeat):
+            output = subprocess.run([sys.executable, '-c', code.replace('{MODULE}', module)], capture_output = True, text = True,
+                                    env = env, check = True).stdout.split('\n')
+            timeList.append(float(output[0]))
+            heavy = output[1]
+        rowList.append({'module': module, 'seconds': float(np.median(timeList)), 'heavy': heavy})
+    return pd.DataFrame(rowList, columns = ['module', 'seconds', 'heavy'])
+
+
+def GetWindowsMemory():
+    """
+    在Windows上通过GetProcessMemoryInfo获取当前进程的工作集
+    :return: (工作集, 峰值工作集)（字节），无法获取时返回(None, None)
+    """
+    try:
+        import ctypes
+        import ctypes.wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', ctypes.wintypes.DWORD), ('PageFaultCount', ctypes.wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        kernel32 = ctypes.windll.kernel32
+        kernel32.GetCurrentProcess.restype = ctypes.wintypes.HANDLE
+        if not ctypes.windll.psapi.GetProcessMemoryInfo(kernel32.GetCurrentProcess(), ctypes.byref(counters), counters.cb):
+            return None, None
+        return counters.WorkingSetSize, counters.PeakWorkingSetSize
+    except (ImportError, AttributeError, OSError):
+        return None, None
+
+
+def GetRss():
+    """
+    获取当前进程的常驻内存（Linux读取/proc/self/statm，Windows为工作集）
+    :return: 常驻内存（字节），无法获取时返回None
+    """
+    if os.name == 'nt':
+        return GetWindowsMemory()[0]
+    try:
+        file = open('/proc/self/statm', 'r')
+        rss = int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        file.close()
+        return rss
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def GetMaxRss():
+    """
+    获取当前进程的峰值常驻内存（Unix使用resource模块，Windows为峰值工作集）
+    :return: 峰值常驻内存（字节），无法获取时返回None
+    """
+    if os.name == 'nt':
+        return GetWindowsMemory()[1]
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxRss if sys.platform == 'darwin' else maxRss * 1024   # macOS的单位为字节，其他Unix为KB
+
+
+def RunMemoryBenchmark(codeNum = 4000, dayNum = 250, accountNum = 10, holdNum = 100, arrayBook = False,
+                       columnar = False, trace = True, seed = 0):
+    """
+    内存基准测试：在模拟的全市场行情上运行多个账户的回测，每个账户每20个交易日全部换仓一次，其余交易日各卖出并买入若干只股票
+    :param codeNum: 股票数量
+    :param dayNum: 交易日数量
+    :param accountNum: 账户数量
+    :param holdNum: 每个账户的持股数
+    :param arrayBook: 是否使用数组持仓账户
+    :param columnar: 数据源是否采用列式存储
+    :param trace: 是否使用tracemalloc统计Python内存分配（会明显降低运行速度）
+    :param seed: 随机数种子
+    :return: dict类型的测试结果：耗时（秒），存活内存块增量，tracemalloc统计的当前及峰值内存（字节），常驻内存及其增量（字节），进程峰值常驻内存（字节）
+    """
+    rssBegin = GetRss()
+    blockBegin = sys.getallocatedblocks()
+    if trace:
+        tracemalloc.start()
+    begin = time.perf_counter()
+    mkt, dateList = MakeMarket(codeNum, dayNum, seed, columnar)
+    if arrayBook:
+        mkt.SetBatchVal(accountNum)
+    actList = [mkt.CreateAccount(i, 1e7, arrayBook = arrayBook) for i in range(accountNum)]
+    rng = np.random.default_rng(seed + 1)
+    codeArr = np.arange(1, codeNum + 1)
+    dayCount = [0]
+
+    def Trade(market):
+        k = dayCount[0]
+        dayCount[0] += 1
+        for act in actList:
+            if k % 20 == 0:
+                act.ClearAll('c')
+                codes = rng.choice(codeArr, holdNum, replace = False)
+                act.AddDlgBatch(codes, amounts = np.full([holdNum], act.capital / holdNum * 0.99))
+            else:
+                held = list(act.position.keys())
+                for code in held[: 5]:
+                    act.AddDlg(code, None, None, None, '卖', '', 'c')
+                for code in rng.choice(codeArr, 5, replace = False).tolist():
+                    act.AddDlg(code, None, None, act.capital / 10, '买', '', 'c')
+
+    mkt.AddAfterCloseReceiver(Trade)
+    mkt.Run(dateList[0], dateList[-1])
+    elapsed = time.perf_counter() - begin
+    result = {'time': elapsed, 'blocks': sys.getallocatedblocks() - blockBegin}
+    if trace:
+        result['traced'], result['tracedPeak'] = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    rss = GetRss()
+    result['rss'] = rss
+    result['rssDelta'] = rss - rssBegin if rss is not None and rssBegin is not None else None
+    result['maxRss'] = GetMaxRss()
+    result['trades'] = sum(len(act.tradeRecord) for act in actList)
+    mkt.SetBacktest(False)
+    return result
+
+
+def RunOverheadBenchmark(dayNum = 2000, backtest = True):
+    """
+    每日固定开销基准测试：在只有一只股票、没有账户和事件接收者的模拟行情上运行，测量每个交易日的平均耗时
+    :param dayNum: 交易日数量
+    :param backtest: 是否以回测模式运行（为False时按实盘的方式逐日调用FetchDate与各阶段事件）
+    :return: 每个交易日的平均耗时（秒）
+    """
+    mkt, dateList = MakeMarket(1, dayNum)
+    begin = time.perf_counter()
+    if backtest:
+        mkt.Run(dateList[0], dateList[-1])
+    else:
+        for i in range(len(dateList)):
+            if not mkt.FetchDate():
+                break
+            mkt.BeforeOpen()
+            mkt.Open()
+            mkt.Close()
+            mkt.AfterClose()
+    elapsed = time.perf_counter() - begin
+    mkt.SetBacktest(False)
+    return elapsed / len(dateList)
+
+
+def CheckRollingWindow(window = 20, width = 50, length = 600, nanRate = 0.3, emaSpan = 10, seed = 0):
+    """
+    以pandas的rolling和ewm为基准检查CircSeries.RollingWindow的统计量：数据中随机含有nan，且部分股票有连续超过窗口长度的nan（模拟停牌），
+    每加入一个元素都与基准比较一次
+    :param window: 窗口长度
+    :param width: 向量长度（股票数）
+    :param length: 序列长度
+    :param nanRate: 随机缺失值的比例
+    :param emaSpan: 指数移动平均的跨度
+    :param seed: 随机数种子
+    :return: dict类型的各统计量与基准的最大绝对误差（nan位置不一致时为inf），以及结果中出现的±inf个数
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.normal(0, 1, [length, width]) * rng.lognormal(0, 2, [width])
+    data[rng.random([length, width]) < nanRate] = np.nan
+    for k in range(0, width, 5):   # 连续缺失的区间
+        begin = rng.integers(0, length - 2 * window)
+        data[begin : begin + int(rng.integers(window, 2 * window)), k] = np.nan
+    data[: window + 5, 0] = np.nan   # 开头即缺失
+    frame = pd.DataFrame(data)
+    rolling = frame.rolling(window, min_periods = 1)
+    expectDict = {'sum': rolling.sum().fillna(0).values, 'mean': rolling.mean().values, 'std': rolling.std().values,
+                  'min': rolling.min().values, 'max': rolling.max().values,
+                  'ema': frame.ewm(span = emaSpan, adjust = False, ignore_na = True).mean().ffill().values}
+    rw = CircSeries.RollingWindow(window, width, emaSpan)
+    errDict = {name: 0.0 for name in expectDict}
+    infNum = 0
+    for t in range(length):
+        rw.Append(data[t])
+        actualDict = {'sum': rw.GetSum(), 'mean': rw.GetMean(), 'std': rw.GetStd(), 'min': rw.GetMin(), 'max': rw.GetMax(), 'ema': rw.GetEma()}
+        for name, actual in actualDict.items():
+            expect = expectDict[name][t]
+            infNum += int(np.isinf(actual).sum())
+            if (np.isnan(actual) != np.isnan(expect)).any():
+                errDict[name] = np.inf
+                continue
+            both = ~np.isnan(expect)
+            if both.any():
+                errDict[name] = max(errDict[name], float(np.abs(actual[both] - expect[both]).max() / max(1.0, np.abs(expect[both]).max())))
+    errDict['inf'] = infNum
+    return errDict
+
+
+def CheckBatchOrder(codeNum = 300, dayNum = 60, accountNum = 5, orderNum = 15, seed = 0):
+    """
+    检查批量委托与逐个委托的一致性：在同一模拟行情上以相同的委托分别调用AddDlgBatch和逐个调用AddDlg，
+    委托包括按数量（含非整数数量）买入、按金额买入和卖出部分持仓，比较两者的成交记录、资金和净值
+    :param codeNum: 股票数量
+    :param dayNum: 交易日数量
+    :param accountNum: 账户数量
+    :param orderNum: 每个账户每日的买入委托数
+    :param seed: 随机数种子
+    :return: dict类型，key为'account'、'arrayBook'，value为(成交记录不一致的条数, 资金的最大绝对差, 净值的最大绝对差, 非整数数量的成交数, 成交总数)
+    """
+    rng = np.random.default_rng(seed)
+    codeArr = np.arange(1, codeNum + 1)
+    orderList = [[(rng.choice(codeArr, orderNum, replace = False), rng.choice([100, 250.5, 333.3, 1000, 77], orderNum),
+                   rng.uniform(1e4, 9e4, orderNum)) for i in range(accountNum)] for k in range(dayNum)]
+
+    def Run(arrayBook, batch):
+        mkt, dateList = MakeMarket(codeNum, dayNum, seed)
+        actList = [mkt.CreateAccount(i, 1e6, arrayBook = arrayBook) for i in range(accountNum)]
+        dayCount = [0]
+
+        def Trade(market):
+            k = dayCount[0]
+            dayCount[0] += 1
+            for i, act in enumerate(actList):
+                codes, nums, amounts = orderList[k][i]
+                kind = (k + i) % 3
+                if kind == 0:
+                    codes = np.array(sorted(code for code, pos in act.position.items() if pos.stockCode is not None)[: orderNum // 2], dtype = np.int64)
+                    nums, amounts, drct = None, None, '卖'
+                elif kind == 1:
+                    amounts, drct = None, '买'
+                else:
+                    nums, drct = None, '买'
+                if batch:
+                    act.AddDlgBatch(codes, nums, amounts, drct, str(kind), 'c')
+                else:
+                    for j, code in enumerate(codes.tolist()):
+                        act.AddDlg(code, nums.tolist()[j] if nums is not None else None, None,
+                                   amounts.tolist()[j] if amounts is not None else None, drct, str(kind), 'c')
+
+        mkt.AddAfterCloseReceiver(Trade)
+        mkt.Run(dateList[0], dateList[-1])
+        mkt.SetBacktest(False)
+        return actList
+
+    result = dict()
+    for arrayBook in (False, True):
+        batchList = Run(arrayBook, True)
+        singleList = Run(arrayBook, False)
+        diffNum = 0
+        for batchAct, singleAct in zip(batchList, singleList):
+            diffNum += abs(len(batchAct.tradeRecord) - len(singleAct.tradeRecord))
+            for x, y in zip(batchAct.tradeRecord, singleAct.tradeRecord):
+                if x[: 5] != y[: 5] or abs(x[5] - y[5]) > 1e-6:
+                    diffNum += 1
+        capDiff = float(max(abs(b.capital - a.capital) for b, a in zip(batchList, singleList)))
+        valDiff = float(max(abs(b.netValList[t][3] - a.netValList[t][3]) for b, a in zip(batchList, singleList) for t in range(len(a.netValList))))
+        fracNum = sum(1 for act in batchList for record in act.tradeRecord if record[3] != int(record[3]))
+        result['arrayBook' if arrayBook else 'account'] = (diffNum, capDiff, valDiff, fracNum, sum(len(act.tradeRecord) for act in batchList))
+    return result
+
+
+if __name__ == '__main__':
+    print('RollingWindow vs pandas: ' + ', '.join(k + '=' + str(v) for k, v in CheckRollingWindow().items()))
+    print('AddDlgBatch vs AddDlg: ' + ', '.join(k + '=' + str(v) for k, v in CheckBatchOrder().items()))
+    print(RunImportBenchmark().to_string(index = False))
+    print(RunTimingSuite(dayNumList = (250,), evalAccount = False).pivot_table(index = 'item', columns = 'codeNum', values = 'seconds').to_string())
+    for backtest in (False, True):
+        print('backtest=' + str(backtest) + ', overhead per day=' + '%.1f' % (RunOverheadBenchmark(backtest = backtest) * 1e6) + 'us')
+    for arrayBook in (False, True):
+        result = RunMemoryBenchmark(arrayBook = arrayBook)
+        print('arrayBook=' + str(arrayBook) + ', ' + ', '.join(k + '=' + str(v) for k, v in result.items()))
@@ -0,0 +1,179 @@
+import bisect
+import datetime
+import gongcq.DbPool as DbPool
+import os
+
+
+def ToDateTime(date):
+    """
+    将日期统一转换为datetime.datetime类型（时间部分为0点）
+    :param date: datetime.datetime或datetime.date类型的日期
+    :return: datetime.datetime类型的日期
+    """
+    return datetime.datetime(date.year, date.month, date.day)
+
+
+class TradeCalendar:
+    """
+    交易日历类，一次性加载一个区间内的所有交易日，并通过二分查找回答前后交易日及区间查询，
+    可以将加载的区间保存到本地文件中，以便离线回测"""
+    """
+    有序的交易日list，元素为datetime.datetime类型"""
+    dateList = None
+    """
+    日历所覆盖区间的起止日期（含），区间内不在dateList中的日期均为非交易日"""
+    beginDate = None
+    endDate = None
+
+    def __init__(self, dateList = None, beginDate = None, endDate = None):
+        """
+        构造一个交易日历
+        :param dateList: 交易日list，可以为None
+        :param beginDate: 日历覆盖区间的起始日期，为None时取dateList中的第一个日期
+        :param endDate: 日历覆盖区间的截止日期，为None时取dateList中的最后一个日期
+        """
+        self.dateList = sorted(set(ToDateTime(d) for d in dateList)) if dateList is not None else []
+        if beginDate is not None:
+            self.beginDate = ToDateTime(beginDate)
+        elif len(self.dateList) > 0:
+            self.beginDate = self.dateList[0]
+        if endDate is not None:
+            self.endDate = ToDateTime(endDate)
+        elif len(self.dateList) > 0:
+            self.endDate = self.dateList[-1]
+
+    def Load(self, connStr, sql, beginDate, endDate):
+        """
+        从数据库中加载一个区间内的所有交易日
+        :param connStr: 数据库连接字符串
+        :param sql: 交易日区间sql，以{START_DATE}和{END_DATE}作为区间的起止日期（含头含尾），结果集的第0列为交易日
+        :param beginDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :return: 加载的交易日数
+        """
+        recordSet = DbPool.Query(connStr, sql.replace('{START_DATE}', beginDate.strftime('%Y-%m-%d'))
+                                             .replace('{END_DATE}', endDate.strftime('%Y-%m-%d')))
+        self.dateList = sorted(set(ToDateTime(record[0]) for record in recordSet if record is not None and record[0] is not None))
+        self.beginDate = ToDateTime(beginDate)
+        self.endDate = ToDateTime(endDate)
+        return len(self.dateList)
+
+    def Save(self, path):
+        """
+        将日历保存到本地文件，第一行为覆盖区间的起止日期，其后每行一个交易日
+        :param path: 文件路径
+        :return:
+        """
+        tempPath = path + '.tmp'
+        file = open(tempPath, 'w')
+        file.write(self.beginDate.strftime('%Y-%m-%d') + ',' + self.endDate.strftime('%Y-%m-%d') + '\n')
+        for date in self.dateList:
+            file.write(date.strftime('%Y-%m-%d') + '\n')
+        file.close()
+        os.replace(tempPath, path)
+
+    def LoadFile(self, path):
+        """
+        从本地文件加载日历
+        :param path: 文件路径
+        :return: 加载的交易日数
+        """
+        file = open(path, 'r')
+        lines = file.read().split()
+        file.close()
+        beginStr, endStr = lines[0].split(',')
+        self.beginDate = datetime.datetime.strptime(beginStr, '%Y-%m-%d')
+        self.endDate = datetime.datetime.strptime(endStr, '%Y-%m-%d')
+        self.dateList = [datetime.datetime.strptime(line, '%Y-%m-%d') for line in lines[1:]]
+        return len(self.dateList)
+
+    def LoadCached(self, connStr, sql, beginDate, endDate, path):
+        """
+        优先从本地文件加载日历，文件不存在或覆盖区间不足时从数据库加载并保存到文件
+        :param connStr: 数据库连接字符串
+        :param sql: 交易日区间sql
+        :param beginDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :param path: 本地文件路径
+        :return: 加载的交易日数
+        """
+        if os.path.exists(path):
+            self.LoadFile(path)
+            if self.beginDate <= ToDateTime(beginDate) and self.endDate >= ToDateTime(endDate):
+                return len(self.dateList)
+        count = self.Load(connStr, sql, beginDate, endDate)
+        self.Save(path)
+        return count
+
+    def Covers(self, date):
+        """
+        判断日期是否在日历覆盖的区间内
+        :param date: 日期
+        :return: bool
+        """
+        if self.beginDate is None or self.endDate is None:
+            return False
+        date = ToDateTime(date)
+        return self.beginDate <= date <= self.endDate
+
+    def IsTradeDate(self, date):
+        """
+        判断是否为交易日
+        :param date: 日期
+        :return: 是否为交易日，日期不在覆盖区间内时返回None
+        """
+        if not self.Covers(date):
+            return None
+        date = ToDateTime(date)
+        i = bisect.bisect_left(self.dateList, date)
+        return i < len(self.dateList) and self.dateList[i] == date
+
+    def Next(self, date):
+        """
+        获取指定日期之后的第一个交易日
+        :param date: 日期
+        :return: 交易日，如果超出日历覆盖的区间则返回None
+        """
+        date = ToDateTime(date)
+        if self.beginDate is None or date < self.beginDate - datetime.timedelta(days = 1):
+            return None
+        i = bisect.bisect_right(self.dateList, date)
+        return self.dateList[i] if i < len(self.dateList) else None
+
+    def Prev(self, date):
+        """
+        获取指定日期之前的最后一个交易日
+        :param date: 日期
+        :return: 交易日，如果超出日历覆盖的区间则返回None
+        """
+        date = ToDateTime(date)
+        if self.endDate is None or date > self.endDate + datetime.timedelta(days = 1):
+            return None
+        i = bisect.bisect_left(self.dateList, date)
+        return self.dateList[i - 1] if i > 0 else None
+
+    def Range(self, beginDate, endDate):
+        """
+        获取区间内的所有交易日
+        :param beginDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :return: 交易日list
+        """
+        i = bisect.bisect_left(self.dateList, ToDateTime(beginDate))
+        j = bisect.bisect_right(self.dateList, ToDateTime(endDate))
+        return self.dateList[i : j]
+
+    def Append(self, date):
+        """
+        在日历末尾追加一个交易日（例如从数据库中读取到的超出覆盖区间的交易日），覆盖区间随之延长
+        :param date: 交易日，必须晚于日历中已有的所有日期
+        :return:
+        """
+        date = ToDateTime(date)
+        if len(self.dateList) > 0 and date <= self.dateList[-1]:
+            return
+        self.dateList.append(date)
+        if self.beginDate is None:
+            self.beginDate = date
+        if self.endDate is None or date > self.endDate:
+            self.endDate = date
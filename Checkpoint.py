@@ -0,0 +1,311 @@
+import io
+import os
+import pickle
+import struct
+import zlib
+
+
+class Checkpoint:
+    """
+    增量检查点，用于保存和恢复Market对象与策略对象的状态。
+    每隔若干次保存写入一次完整快照（snapshot），其余每次只在日志文件中追加当日的增量：
+    新增的交易记录、净值、基准指数，有变化的持仓，资金，数据源当日的历史数据以及策略对象状态中有变化的项。
+    每条日志记录带有长度和校验和，写入后立即落盘，快照先写入临时文件再原子替换，
+    因此任何时刻中断都可以恢复到最近一次成功保存的状态，每日保存的耗时与历史长度无关。
+    策略对象可以实现GetState()与SetState(state)方法来指定需要保存的状态（dict类型），否则保存其__dict__；
+    状态按项序列化后与上次保存时比较，日志中只记录有变化和被删除的项（不同项之间共享的对象在恢复后不再共享）；
+    策略状态中对Market对象、账户和数据源的引用在日志中以引用的形式保存，恢复时指向快照中恢复出的对象"""
+    """
+    检查点目录"""
+    root = None
+    """
+    快照间隔（保存次数）"""
+    interval = 20
+    """
+    当前快照的序号，日志文件与快照一一对应"""
+    seq = 0
+    """
+    当前快照之后已追加的增量数"""
+    count = 0
+    """
+    当前日志文件"""
+    logFile = None
+    """
+    上次保存时的状态，用于计算增量：基准指数的条数，每个账户的交易记录条数、净值条数和持仓状态"""
+    bmLen = 0
+    tradeLen = None
+    netValLen = None
+    posState = None
+    """
+    上次保存时策略状态各项的序列化结果，key为状态的项名"""
+    stgState = None
+
+    def __init__(self, root, interval = 20):
+        """
+        构造一个检查点
+        :param root: 检查点目录，不存在时自动创建
+        :param interval: 快照间隔，每保存interval次写入一次完整快照
+        """
+        self.root = root
+        self.interval = interval
+        self.seq = 0
+        self.count = 0
+        self.logFile = None
+        self.tradeLen = []
+        self.netValLen = []
+        self.posState = []
+        self.stgState = dict()
+        os.makedirs(self.root, exist_ok = True)
+
+    def GetSnapshotPath(self):
+        """
+        获取快照文件路径
+        :return:
+        """
+        return os.path.join(self.root, 'snapshot.pkl')
+
+    def GetLogPath(self, seq):
+        """
+        获取日志文件路径
+        :param seq: 快照序号
+        :return:
+        """
+        return os.path.join(self.root, 'delta ' + str(seq) + '.log')
+
+    def Save(self, mkt, stg):
+        """
+        保存检查点：距离上次快照已达到快照间隔时写入完整快照，否则追加一条增量
+        :param mkt: Market对象
+        :param stg: 策略对象
+        :return:
+        """
+        if self.logFile is None or self.count >= self.interval - 1:
+            self.Snapshot(mkt, stg)
+        else:
+            self.Append(mkt, stg)
+
+    def Snapshot(self, mkt, stg):
+        """
+        写入完整快照，并开始一个新的日志文件
+        :param mkt: Market对象
+        :param stg: 策略对象
+        :return:
+        """
+        seq = self.seq + 1
+        path = self.GetSnapshotPath()
+        tempPath = path + '.tmp'
+        file = open(tempPath, 'wb')
+        pickle.dump({'seq': seq, 'date': mkt.crtDate, 'mkt': mkt, 'stg': stg}, file, pickle.HIGHEST_PROTOCOL)
+        file.flush()
+        os.fsync(file.fileno())
+        file.close()
+        os.replace(tempPath, path)
+        if self.logFile is not None:
+            self.logFile.close()
+        self.logFile = open(self.GetLogPath(seq), 'wb')
+        for name in os.listdir(self.root):
+            if name.startswith('delta ') and name != os.path.basename(self.GetLogPath(seq)):
+                os.remove(os.path.join(self.root, name))
+        self.seq = seq
+        self.count = 0
+        self.Mark(mkt, stg)
+
+    def Append(self, mkt, stg):
+        """
+        在日志文件中追加自上次保存以来的增量
+        :param mkt: Market对象
+        :param stg: 策略对象
+        :return:
+        """
+        refDict = GetRefDict(mkt, stg)
+        stgState = self.DumpState(stg, refDict)
+        delta = {'date': mkt.crtDate, 'bm': mkt.bmList[self.bmLen :], 'act': [], 'history': dict(),
+                 'stg': {key: data for key, data in stgState.items() if self.stgState.get(key) != data},
+                 'stgRemoved': [key for key in self.stgState if key not in stgState]}
+        for i, act in enumerate(mkt.actList):
+            if i >= len(self.tradeLen):   # 快照之后新建的账户
+                raise Exception('Checkpoint：上次快照之后新建了账户，需要重新写入快照')
+            posState = act.GetPosState()
+            posDelta = dict()
+            for code, pos in posState.items():
+                if self.posState[i].get(code) != pos:
+                    posDelta[code] = pos
+            for code in self.posState[i]:
+                if code not in posState:
+                    posDelta[code] = None
+            delta['act'].append({'trade': act.tradeRecord[self.tradeLen[i] :],
+                                 'netVal': act.netValList[self.netValLen[i] :],
+                                 'capital': act.capital,
+                                 'netValue': act.netVal,
+                                 'pos': posDelta,
+                                 'posOrder': list(posState.keys())})
+            self.posState[i] = posState
+        for k, ds in enumerate(mkt.dsList):
+            if ds.history is not None:
+                delta['history'][k] = ds.history.GetLast().copy()
+        buffer = io.BytesIO()
+        RefPickler(buffer, refDict).dump(delta)
+        data = buffer.getvalue()
+        self.logFile.write(struct.pack('<QI', len(data), zlib.crc32(data)) + data)
+        self.logFile.flush()
+        os.fsync(self.logFile.fileno())
+        self.count += 1
+        self.bmLen = len(mkt.bmList)
+        for i, act in enumerate(mkt.actList):
+            self.tradeLen[i] = len(act.tradeRecord)
+            self.netValLen[i] = len(act.netValList)
+        self.stgState = stgState
+
+    def Mark(self, mkt, stg):
+        """
+        记录当前状态，作为计算下一次增量的基准
+        :param mkt: Market对象
+        :param stg: 策略对象
+        :return:
+        """
+        self.bmLen = len(mkt.bmList)
+        self.tradeLen = [len(act.tradeRecord) for act in mkt.actList]
+        self.netValLen = [len(act.netValList) for act in mkt.actList]
+        self.posState = [act.GetPosState() for act in mkt.actList]
+        self.stgState = self.DumpState(stg, GetRefDict(mkt, stg))
+
+    @staticmethod
+    def GetState(stg):
+        """
+        获取策略对象需要保存的状态
+        :param stg: 策略对象
+        :return: dict类型的状态
+        """
+        state = stg.GetState() if hasattr(stg, 'GetState') else stg.__dict__
+        if not isinstance(state, dict):
+            raise Exception('Checkpoint：策略对象的GetState()须返回dict类型的状态')
+        return state
+
+    def DumpState(self, stg, refDict):
+        """
+        将策略状态按项序列化（对Market对象、账户和数据源的引用以引用编号保存）
+        :param stg: 策略对象
+        :param refDict: GetRefDict生成的引用对象
+        :return: dict类型，key为状态的项名，value为序列化结果
+        """
+        result = dict()
+        for key, value in self.GetState(stg).items():
+            buffer = io.BytesIO()
+            RefPickler(buffer, refDict).dump(value)
+            result[key] = buffer.getvalue()
+        return result
+
+    def Load(self):
+        """
+        从检查点恢复状态：读取快照并依次应用其后的增量，日志末尾不完整的记录会被截去，此后可以继续保存
+        :return: Market对象，策略对象；没有检查点时均为None
+        """
+        path = self.GetSnapshotPath()
+        if not os.path.exists(path):
+            return None, None
+        file = open(path, 'rb')
+        snapshot = pickle.load(file)
+        file.close()
+        mkt = snapshot['mkt']
+        stg = snapshot['stg']
+        self.seq = snapshot['seq']
+        self.count = 0
+        logPath = self.GetLogPath(self.seq)
+        raw = b''
+        if os.path.exists(logPath):
+            file = open(logPath, 'rb')
+            raw = file.read()
+            file.close()
+        refList = list(GetRefDict(mkt, stg).values())
+        stgState = dict(self.GetState(stg))
+        pos = 0
+        while pos + 12 <= len(raw):
+            size, crc = struct.unpack('<QI', raw[pos : pos + 12])
+            data = raw[pos + 12 : pos + 12 + size]
+            if len(data) < size or zlib.crc32(data) != crc:
+                break
+            delta = RefUnpickler(io.BytesIO(data), refList).load()
+            self.ApplyDelta(mkt, delta)
+            for key, value in delta['stg'].items():
+                stgState[key] = RefUnpickler(io.BytesIO(value), refList).load()
+            for key in delta['stgRemoved']:
+                stgState.pop(key, None)
+            pos += 12 + size
+            self.count += 1
+        if self.count > 0:
+            if hasattr(stg, 'SetState'):
+                stg.SetState(stgState)
+            else:
+                stg.__dict__.clear()
+                stg.__dict__.update(stgState)
+        # 截去不完整的记录，继续在日志末尾追加
+        self.logFile = open(logPath, 'ab')
+        self.logFile.truncate(pos)
+        self.Mark(mkt, stg)
+        return mkt, stg
+
+    def ApplyDelta(self, mkt, delta):
+        """
+        将一条增量应用到Market对象上（策略状态的增量由Load累积后一次性设置）
+        :param mkt: Market对象
+        :param delta: 增量
+        :return:
+        """
+        mkt.crtDate = delta['date']
+        mkt.bmList.extend(delta['bm'])
+        for act, actDelta in zip(mkt.actList, delta['act']):
+            act.tradeRecord.extend(actDelta['trade'])
+            act.netValList.extend(actDelta['netVal'])
+            act.capital = actDelta['capital']
+            act.netVal = actDelta['netValue']
+            posState = act.GetPosState()
+            for code, pos in actDelta['pos'].items():
+                if pos is None:
+                    posState.pop(code, None)
+                else:
+                    posState[code] = pos
+            act.SetPosState({code: posState[code] for code in actDelta['posOrder']})
+        for k, row in delta['history'].items():
+            mkt.dsList[k].history.Append(row)
+
+    def Close(self):
+        """
+        关闭日志文件
+        :return:
+        """
+        if self.logFile is not None:
+            self.logFile.close()
+            self.logFile = None
+
+
+def GetRefDict(mkt, stg):
+    """
+    生成增量中以引用形式保存的对象：Market对象、策略对象、各账户和各数据源
+    :param mkt: Market对象
+    :param stg: 策略对象
+    :return: dict类型，key为对象的id，value为对象，按引用编号排列
+    """
+    refDict = dict()
+    for obj in [mkt, stg] + list(mkt.actList) + list(mkt.dsList):
+        refDict[id(obj)] = obj
+    return refDict
+
+
+class RefPickler(pickle.Pickler):
+    """将指定的对象序列化为引用编号"""
+    def __init__(self, file, refDict):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.refIndex = {key: i for i, key in enumerate(refDict.keys())}
+
+    def persistent_id(self, obj):
+        return self.refIndex.get(id(obj))
+
+
+class RefUnpickler(pickle.Unpickler):
+    """将引用编号还原为对象"""
+    def __init__(self, file, refList):
+        super().__init__(file)
+        self.refList = refList
+
+    def persistent_load(self, pid):
+        return self.refList[pid]
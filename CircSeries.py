@@ -2,27 +2,26 @@ import numpy as np
 
 class CircSeriesNum:
     '''
-    容量固定的循环序列，元素为数值类型
+    容量固定的循环序列，元素为数值类型（或等长的数值向量，例如所有股票的当日数值）
     '''
     loc = -1
     capacity = 0
     series = None
 
-    def __init__(self, capacity):
+    def __init__(self, capacity, width = None):
         '''
         初始化一个循环序列
         :param capacity: 容量
+        :param width: 元素为向量时的向量长度，为None时元素为单个数值
         '''
         self.loc = -1
         self.capacity = capacity
-        self.series = np.array(list(range(0, capacity, 1)), dtype = float)
-        for i in range(0, capacity, 1):
-            self.series[i] = np.nan
+        self.series = np.full([capacity] if width is None else [capacity, width], np.nan)
 
     def Append(self, num):
         '''
         加入一个数值
-        :param num: 数值
+        :param num: 数值（元素为向量时为长度为width的数组）
         :return:
         '''
         self.loc = (self.loc + 1) % self.capacity
@@ -51,6 +50,28 @@ class CircSeriesNum:
         '''
         return self.series[(index + self.loc + 1) % self.capacity]
 
+    def GetSlices(self, head, num):
+        '''
+        获取从指定的存储位置开始、按时间顺序排列的num个元素，不复制数据
+        :param head: 起始的存储位置（series中的下标）
+        :param num: 元素个数，不超过容量
+        :return: 1个或2个series的切片视图组成的tuple，按顺序拼接即为所需的元素
+        '''
+        head %= self.capacity
+        if head + num <= self.capacity:
+            return (self.series[head : head + num],)
+        return (self.series[head :], self.series[: head + num - self.capacity])
+
+    def GetWindow(self, num):
+        '''
+        获取最近的num个元素，按时间顺序（由旧到新）排列，不复制数据
+        :param num: 元素个数，不超过容量
+        :return: 1个或2个series的切片视图组成的tuple
+        '''
+        if num <= 0 or num > self.capacity:
+            raise Exception('CircSeriesNum类中的GetWindow方法索引越界')
+        return self.GetSlices(self.loc + 1 - num, num)
+
     def GetRegionBw(self, head, tail):
         '''
         获取指定区间的数值组成的数组（反向索引），含头不含尾
@@ -60,10 +81,9 @@ class CircSeriesNum:
         '''
         if head > 0 or tail < -self.capacity or head <= tail:
             raise Exception('CircSeriesNum类中的GetRegionBw方法索引越界')
-        indexList = [None] * (head - tail)
-        for i in range(len(indexList)):
-            indexList[i] = (self.loc + head - i) % self.capacity
-        return self.series[indexList]
+        slices = self.GetSlices(self.loc + tail + 1, head - tail)
+        region = slices[0] if len(slices) == 1 else np.concatenate(slices)
+        return region[::-1].copy()
 
     def GetRegionFw(self, head, tail):
         '''
@@ -74,18 +94,224 @@ class CircSeriesNum:
         '''
         if head < 0 or tail > self.capacity or head >= tail:
             raise Exception('CircSeriesNum类中的GetRegionFw方法索引越界')
-        indexList = [None] * (tail - head)
-        for i in range(len(indexList)):
-            indexList[i] = (self.loc + 1 + head + i) % self.capacity
-        return self.series[indexList]
+        slices = self.GetSlices(self.loc + 1 + head, tail - head)
+        return slices[0].copy() if len(slices) == 1 else np.concatenate(slices)
 
-class CircSeriesObj:
+
+class RollingWindow:
     '''
-    容量固定的循环序列，元素为任意类型
+    基于循环序列的滚动窗口统计，元素可以是单个数值或等长的数值向量（例如所有股票的当日数值，各股票独立统计），
+    每加入一个元素以O(1)（均摊）的计算量更新窗口内的和、平方和、最小值、最大值以及指数移动平均，nan视为缺失值。
+    最小值和最大值采用分块的前缀/后缀极值（van Herk/Gil-Werman算法）：以窗口长度为块长，
+    窗口总是由上一块的一个后缀和当前块的一个前缀组成，每块结束时计算一次该块的后缀极值，不需要逐元素维护单调队列，因而可以对向量整体运算；
+    和与平方和在每块结束时按窗口内的数据重新计算一次，避免浮点累积误差
+    '''
+    window = 0
+    series = None       # 存放窗口数据的循环序列
+    count = 0           # 已加入的元素个数
+    sum = None          # 窗口内有效值的和
+    sumSq = None        # 窗口内有效值的平方和
+    validNum = None     # 窗口内有效值的个数
+    preMin = None       # 当前块的前缀最小值
+    preMax = None       # 当前块的前缀最大值
+    sufMin = None       # 上一块的后缀最小值，shape与series相同
+    sufMax = None       # 上一块的后缀最大值，shape与series相同
+    alpha = None        # 指数移动平均的平滑系数
+    ema = None          # 指数移动平均
+
+    def __init__(self, window, width = None, emaSpan = None):
+        '''
+        初始化一个滚动窗口
+        :param window: 窗口长度
+        :param width: 元素为向量时的向量长度，为None时元素为单个数值
+        :param emaSpan: 指数移动平均的跨度，平滑系数为2 / (emaSpan + 1)，为None时取窗口长度
+        '''
+        self.window = window
+        self.series = CircSeriesNum(window, width)
+        self.count = 0
+        shape = [] if width is None else [width]
+        self.sum = np.zeros(shape)
+        self.sumSq = np.zeros(shape)
+        self.validNum = np.zeros(shape, dtype = np.int64)
+        self.preMin = np.full(shape, np.nan)
+        self.preMax = np.full(shape, np.nan)
+        self.sufMin = np.full([window] + shape, np.nan)
+        self.sufMax = np.full([window] + shape, np.nan)
+        self.alpha = 2 / ((window if emaSpan is None else emaSpan) + 1)
+        self.ema = np.full(shape, np.nan)
+
+    def Append(self, num):
+        '''
+        加入一个元素并更新统计量
+        :param num: 数值（元素为向量时为长度为width的数组）
+        :return:
+        '''
+        num = np.asarray(num, dtype = float)
+        series = self.series
+        pos = (series.loc + 1) % self.window
+        # 移出最旧的元素
+        old = series.series[pos]
+        oldValid = ~np.isnan(old)
+        self.sum -= np.where(oldValid, old, 0)
+        self.sumSq -= np.where(oldValid, old * old, 0)
+        self.validNum -= oldValid
+        # 加入新元素
+        series.Append(num)
+        valid = ~np.isnan(num)
+        self.sum += np.where(valid, num, 0)
+        self.sumSq += np.where(valid, num * num, 0)
+        self.validNum += valid
+        # 窗口内没有有效值时将和与平方和归零，消除逐次加减残留的浮点误差
+        empty = self.validNum == 0
+        self.sum = np.where(empty, 0.0, self.sum)
+        self.sumSq = np.where(empty, 0.0, self.sumSq)
+        self.ema = np.where(valid, np.where(np.isnan(self.ema), num, self.alpha * num + (1 - self.alpha) * self.ema), self.ema)
+        # 更新当前块的前缀极值，窗口跨越上一块的部分由上一块的后缀极值给出
+        if pos == 0:
+            self.preMin = num.copy()
+            self.preMax = num.copy()
+        else:
+            self.preMin = np.fmin(self.preMin, num)
+            self.preMax = np.fmax(self.preMax, num)
+        self.count += 1
+        if pos == self.window - 1:  # 一块结束，此时series中恰好按顺序存放此块，计算其后缀极值并重新计算和与平方和
+            data = series.series
+            self.sufMin = np.fmin.accumulate(data[::-1], axis = 0)[::-1].copy()
+            self.sufMax = np.fmax.accumulate(data[::-1], axis = 0)[::-1].copy()
+            self.sum = np.nansum(data, axis = 0)
+            self.sumSq = np.nansum(data * data, axis = 0)
+            self.validNum = np.sum(~np.isnan(data), axis = 0)
+
+    def GetWindow(self):
+        '''
+        获取窗口内的数据，按时间顺序排列，不复制数据
+        :return: 1个或2个切片视图组成的tuple
+        '''
+        return self.series.GetWindow(min(max(self.count, 1), self.window))
+
+    def GetSum(self):
+        '''
+        获取窗口内有效值的和
+        :return:
+        '''
+        return self.sum.copy()
+
+    def GetMean(self):
+        '''
+        获取窗口内有效值的均值，没有有效值时为nan
+        :return:
+        '''
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            return np.where(self.validNum > 0, self.sum / self.validNum, np.nan)
+
+    def GetStd(self, ddof = 1):
+        '''
+        获取窗口内有效值的标准差，有效值个数不超过ddof时为nan
+        :param ddof: 自由度修正
+        :return:
+        '''
+        with np.errstate(invalid = 'ignore', divide = 'ignore'):
+            var = (self.sumSq - self.sum * self.sum / self.validNum) / (self.validNum - ddof)
+            var = np.where(self.validNum > ddof, np.maximum(var, 0), np.nan)
+        return np.sqrt(var)
+
+    def GetMin(self):
+        '''
+        获取窗口内有效值的最小值，没有有效值时为nan
+        :return:
+        '''
+        pos = self.series.loc
+        if pos == self.window - 1:
+            return self.sufMin[0].copy()
+        return np.fmin(self.sufMin[pos + 1], self.preMin)
+
+    def GetMax(self):
+        '''
+        获取窗口内有效值的最大值，没有有效值时为nan
+        :return:
+        '''
+        pos = self.series.loc
+        if pos == self.window - 1:
+            return self.sufMax[0].copy()
+        return np.fmax(self.sufMax[pos + 1], self.preMax)
+
+    def GetEma(self):
+        '''
+        获取指数移动平均（以第一个有效值为初值，缺失值不更新）
+        :return:
+        '''
+        return self.ema.copy()
+
+
+class CircSeriesMatrix:
+    '''
+    容量固定的二维循环序列（时间×股票×字段），每个元素为所有股票某一日的数据，股票按数据源中的序号排列。
+    采用镜像双缓冲存储：每个元素同时写入两个相隔capacity的位置，因此任意长度不超过容量的最近窗口都是一个连续的切片，
+    按时间顺序取出时不需要拼接或复制
     '''
     loc = -1
     capacity = 0
-    series = None
+    count = 0           # 已加入的元素个数
+    series = None       # shape为(2 * capacity, width)或(2 * capacity, width, fieldNum)的数组
+
+    def __init__(self, capacity, width, fieldNum = None):
+        '''
+        初始化一个二维循环序列
+        :param capacity: 容量（天数）
+        :param width: 股票数量
+        :param fieldNum: 字段数，为None时每个元素为一维向量
+        '''
+        self.loc = -1
+        self.capacity = capacity
+        self.count = 0
+        self.series = np.full([2 * capacity, width] if fieldNum is None else [2 * capacity, width, fieldNum], np.nan)
+
+    def Append(self, mat):
+        '''
+        加入一日的数据
+        :param mat: shape为(width,)或(width, fieldNum)的数组
+        :return:
+        '''
+        self.loc = (self.loc + 1) % self.capacity
+        self.series[self.loc] = mat
+        self.series[self.loc + self.capacity] = mat
+        self.count += 1
+
+    def GetLast(self):
+        '''
+        获取最后一日的数据
+        :return: 最后一日数据的视图，没有数据时为None
+        '''
+        return self.series[self.loc] if self.loc >= 0 else None
+
+    def GetElmBw(self, index):
+        '''
+        获取指定日的数据（反向索引）
+        :param index: 指定的位置（非正数），0表示倒数第1个元素，-1表示倒数第2个元素…………
+        :return: 指定日数据的视图
+        '''
+        return self.series[(index + self.loc) % self.capacity]
+
+    def GetWindow(self, num, field = None):
+        '''
+        获取最近num日的数据，按时间顺序（由旧到新）排列，返回的是连续存储的视图，不应修改
+        :param num: 天数，不超过容量，不足num日时较早的部分为nan
+        :param field: 字段下标，为None时返回所有字段
+        :return: shape为(num, width)或(num, width, fieldNum)的数组视图
+        '''
+        if num <= 0 or num > self.capacity:
+            raise Exception('CircSeriesMatrix类中的GetWindow方法索引越界')
+        end = self.loc + self.capacity + 1
+        if field is None:
+            return self.series[end - num : end]
+        return self.series[end - num : end, :, field]
+
+
+class CircSeriesObj:
+    '''
+    容量固定的循环序列，元素为任意类型
+    '''
+    __slots__ = ('loc', 'capacity', 'series')
 
     def __init__(self, capacity):
         '''
@@ -1,4 +1,5 @@
-import cx_Oracle as co
+import gongcq.DbPool as DbPool
+import numpy as np
 import sys
 
 
@@ -8,14 +9,11 @@ def GetAllCode(dbStr):
     :param dbStr: 数据库链接字符串
     :return: 股票编码，股票代码，股票简称，市场代码
     """
-    db = co.connect(dbStr)
     sql = 'SELECT STK_UNI_CODE, STK_CODE, STK_SHORT_NAME, SEC_MAR_PAR FROM UPCENTER.STK_BASIC_INFO ' \
           'WHERE ISVALID = 1 AND (SEC_MAR_PAR = 1 OR SEC_MAR_PAR = 2) AND STK_TYPE_PAR = 1 AND ' \
           '      END_DATE IS NULL AND LIST_DATE IS NOT NULL ' \
           'ORDER BY STK_UNI_CODE '
-    cursor = db.cursor()
-    cursor.execute(sql)
-    infoList = cursor.fetchall()
+    infoList = DbPool.Query(dbStr, sql)
     codeList = [None] * len(infoList)
     symbolList = [None] * len(infoList)
     nameList = [None] * len(infoList)
@@ -28,12 +26,16 @@ def GetAllCode(dbStr):
     return codeList, symbolList, nameList, marketList
 
 class CodeSymbol:
-    def __init__(self, connStr):
+    def __init__(self, connStr, infoList = None):
         """
         创建一个CodeSymbol对象
         :param connStr: 数据库链接字符串
+        :param infoList: 不访问数据库时直接指定的(股票编码list, 股票代码list, 股票简称list, 市场代码list)，为None时从数据库读取
         """
-        self.codeList, self.symbolList, self.nameList, self.marketList = GetAllCode(connStr)
+        if infoList is None:
+            self.codeList, self.symbolList, self.nameList, self.marketList = GetAllCode(connStr)
+        else:
+            self.codeList, self.symbolList, self.nameList, self.marketList = [list(info) for info in infoList]
         self.minCode = sys.maxsize
         self.maxCode = 0
         self.minSymbol = sys.maxsize
@@ -56,6 +58,9 @@ class CodeSymbol:
             symbolSeq = int(self.symbolList[i]) - self.minSymbol
             self.codeToSymbol[codeSeq] = i
             self.symbolToCode[symbolSeq] = i
+        # 用于向量化查找的数组版本，-1表示没有对应的信息
+        self.codeArr = np.array(self.codeList, dtype = np.int64)
+        self.symbolSeqArr = np.array([-1 if seq is None else seq for seq in self.symbolToCode], dtype = np.int64)
 
     def GetCode(self, symbol):
         """
@@ -66,6 +71,20 @@ class CodeSymbol:
         seq = self.symbolToCode[int(symbol) - self.minSymbol]
         return self.codeList[seq] if (seq is not None and seq >= 0 and seq < len(self.codeList)) else None
 
+    def GetCodeArray(self, symbols):
+        """
+        向量化地通过股票代码获取股票编码
+        :param symbols: 股票代码的整数数组（例如600000）
+        :return: 股票编码数组（int64），没有找到对应代码信息的位置为-1
+        """
+        symbols = np.asarray(symbols, dtype = np.int64)
+        inRange = (symbols >= self.minSymbol) & (symbols <= self.maxSymbol)
+        seqs = np.full(symbols.shape, -1, dtype = np.int64)
+        seqs[inRange] = self.symbolSeqArr[symbols[inRange] - self.minSymbol]
+        codes = np.full(symbols.shape, -1, dtype = np.int64)
+        codes[seqs >= 0] = self.codeArr[seqs[seqs >= 0]]
+        return codes
+
     def GetSymbol(self, code):
         """
         通过股票编码获取股票代码，如果没有找到对应的编码信息则返回None
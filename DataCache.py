@@ -0,0 +1,166 @@
+import datetime
+import hashlib
+import numpy as np
+import os
+import time
+
+
+class DataCache:
+    """
+    数据源查询结果的本地磁盘缓存，以(sql语句, 日期, 股票编码list)为key，
+    每个数据源对应一个目录，每日的结果以二进制列式文件（.npy）存储，读取时使用内存映射，不需要任何解析"""
+    """
+    缓存根目录"""
+    root = None
+    """
+    缓存有效期（秒），为None时永不过期"""
+    ttl = None
+    """
+    缓存版本，更改版本即可使此前的所有缓存失效"""
+    version = 0
+    """
+    统计信息：命中次数、未命中次数、写入次数"""
+    hitNum = 0
+    missNum = 0
+    putNum = 0
+
+    def __init__(self, root, ttl = None, version = 0):
+        """
+        构造一个磁盘缓存
+        :param root: 缓存根目录，不存在时自动创建
+        :param ttl: 缓存有效期（秒），为None时永不过期
+        :param version: 缓存版本
+        """
+        self.root = root
+        self.ttl = ttl
+        self.version = version
+        self.hitNum = 0
+        self.missNum = 0
+        self.putNum = 0
+        os.makedirs(self.root, exist_ok = True)
+
+    def GetSourceDir(self, ds):
+        """
+        获取数据源对应的缓存目录，目录名由sql语句、股票编码list和缓存版本生成
+        :param ds: 数据源对象
+        :return: 目录路径
+        """
+        if ds.cacheDir is None:
+            sha = hashlib.sha1()
+            sha.update(str(self.version).encode('utf-8'))
+            sha.update(ds.sql.encode('utf-8'))
+            sha.update(np.array(ds.codeList, dtype = np.int64).tobytes())
+            sha.update(str(ds.fieldNum).encode('utf-8'))
+            ds.cacheDir = os.path.join(self.root, sha.hexdigest()[: 20])
+            os.makedirs(ds.cacheDir, exist_ok = True)
+        return ds.cacheDir
+
+    def IsFresh(self, path):
+        """
+        判断缓存文件是否存在且未过期
+        :param path: 文件路径
+        :return: bool
+        """
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        return self.ttl is None or time.time() - mtime <= self.ttl
+
+    def Get(self, ds, dateStr):
+        """
+        读取某一日的缓存
+        :param ds: 数据源对象
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: shape为(记录数, fieldNum)的只读float64数组（第0列为nan，第1列为股票编码），未命中时返回None
+        """
+        path = os.path.join(self.GetSourceDir(ds), dateStr + '.npy')
+        if not self.IsFresh(path):
+            self.missNum += 1
+            return None
+        try:
+            block = np.load(path, mmap_mode = 'r')
+        except ValueError:  # 空数组无法内存映射
+            block = np.load(path)
+        self.hitNum += 1
+        return block
+
+    def Put(self, ds, dateStr, records):
+        """
+        写入某一日的缓存，写入过程是原子的
+        :param ds: 数据源对象
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :param records: 数据记录的list，每个记录的第1个元素为股票编码，第2个及以后的元素为数值
+        :return: 是否写入成功（含非数值字段的记录无法缓存）
+        """
+        block = RecordsToBlock(records, ds.fieldNum)
+        if block is None:
+            return False
+        block = block[ds.GetSeqArray(block[:, 1]) >= 0] if len(block) > 0 else block
+        path = os.path.join(self.GetSourceDir(ds), dateStr + '.npy')
+        tempPath = path + '.' + str(os.getpid()) + '.tmp'
+        file = open(tempPath, 'wb')
+        np.save(file, block)
+        file.close()
+        os.replace(tempPath, path)
+        self.putNum += 1
+        return True
+
+    def HasRange(self, ds, startStr, endStr):
+        """
+        判断某个日期区间是否已经被完整缓存：区间标记未过期，且标记中记录的各日缓存文件都存在且未过期
+        （各日的缓存文件早于区间标记写入，有效期可能先于标记结束）
+        :param ds: 数据源对象
+        :param startStr: 起始日期字符串（含）
+        :param endStr: 截止日期字符串（含）
+        :return: bool
+        """
+        directory = self.GetSourceDir(ds)
+        path = os.path.join(directory, 'range ' + startStr + ' ' + endStr)
+        if not self.IsFresh(path):
+            return False
+        file = open(path, 'r')
+        lines = file.read().splitlines()
+        file.close()
+        if len(lines) < 2 or lines[1] != 'dates':   # 旧格式的标记没有记录日期，视为未缓存
+            return False
+        return all(self.IsFresh(os.path.join(directory, dateStr + '.npy')) for dateStr in lines[2 :])
+
+    def PutRange(self, ds, startStr, endStr, dateStrList):
+        """
+        标记某个日期区间已经被完整缓存（区间内没有缓存文件的日期在读取时查询数据库）
+        :param ds: 数据源对象
+        :param startStr: 起始日期字符串（含）
+        :param endStr: 截止日期字符串（含）
+        :param dateStrList: 区间内写入了缓存文件的日期字符串list
+        :return:
+        """
+        file = open(os.path.join(self.GetSourceDir(ds), 'range ' + startStr + ' ' + endStr), 'w')
+        file.write(str(datetime.datetime.now()) + '\ndates\n')
+        for dateStr in dateStrList:
+            file.write(dateStr + '\n')
+        file.close()
+
+    def GetStat(self):
+        """
+        获取缓存的统计信息
+        :return: dict类型的统计信息
+        """
+        return {'hit': self.hitNum, 'miss': self.missNum, 'put': self.putNum}
+
+
+def RecordsToBlock(records, fieldNum):
+    """
+    将数据记录转换为数值数组，第0列（日期）固定为nan
+    :param records: 数据记录的list
+    :param fieldNum: 字段数
+    :return: shape为(记录数, fieldNum)的float64数组，含有非数值字段时返回None
+    """
+    block = np.full([len(records), fieldNum], np.nan)
+    if len(records) == 0:
+        return block
+    try:
+        block[:, 1:] = np.array([record[1:] for record in records], dtype = object).astype(float)
+    except (TypeError, ValueError):
+        return None
+    return block
@@ -0,0 +1,296 @@
+import threading
+import time
+
+
+class ConnPool:
+    """
+    数据库连接池，按连接字符串（Oracle）或连接参数dict（MySQL）复用数据库连接，
+    提供连接健康检查、失败重连、显式关闭以及连接数与等待时间的统计"""
+    """
+    数据库链接字符串（Oracle为str类型，MySQL为dict类型）"""
+    connStr = None
+    """
+    最大连接数"""
+    maxSize = 4
+    """
+    连接空闲超过此秒数后，再次使用前先进行健康检查"""
+    pingInterval = 60
+    """
+    空闲连接列表，每个元素为[连接对象, 最近使用时间]"""
+    idleList = None
+    """
+    正在被使用的连接数"""
+    activeNum = 0
+    """
+    条件变量，用于线程间同步"""
+    cond = None
+    """
+    是否已关闭"""
+    closed = False
+    """
+    统计信息：创建连接数、关闭连接数、重连次数、获取连接次数、累计等待时间（秒）、最大等待时间（秒）"""
+    createNum = 0
+    closeNum = 0
+    reconnectNum = 0
+    acquireNum = 0
+    waitTime = 0.0
+    maxWaitTime = 0.0
+
+    def __init__(self, connStr, maxSize = 4, pingInterval = 60):
+        """
+        构造一个连接池
+        :param connStr: 数据库连接字符串，Oracle为str类型，MySQL为dict类型
+        :param maxSize: 最大连接数
+        :param pingInterval: 连接空闲超过此秒数后，再次使用前先进行健康检查
+        """
+        self.connStr = connStr
+        self.maxSize = maxSize
+        self.pingInterval = pingInterval
+        self.idleList = []
+        self.activeNum = 0
+        self.cond = threading.Condition()
+        self.closed = False
+        self.createNum = 0
+        self.closeNum = 0
+        self.reconnectNum = 0
+        self.acquireNum = 0
+        self.waitTime = 0.0
+        self.maxWaitTime = 0.0
+
+    def Connect(self):
+        """
+        新建一个数据库连接（数据库驱动在第一次连接时才被导入，不访问数据库的进程不需要安装驱动）
+        :return: 连接对象
+        """
+        if isinstance(self.connStr, dict):  # mysql
+            import pymysql
+            conn = pymysql.connect(**self.connStr)
+        else:                               # Oracle
+            import cx_Oracle
+            conn = cx_Oracle.connect(self.connStr)
+        with self.cond:
+            self.createNum += 1
+        return conn
+
+    def GetConnErrors(self):
+        """
+        获取数据库驱动的连接类异常（连接断开、网络故障等），只有这些异常才需要换一个连接重试，sql本身的错误重试也不会成功
+        :return: 异常类型的tuple
+        """
+        if isinstance(self.connStr, dict):  # mysql
+            import pymysql
+            return pymysql.err.OperationalError, pymysql.err.InterfaceError
+        else:                               # Oracle
+            import cx_Oracle
+            return cx_Oracle.OperationalError, cx_Oracle.InterfaceError
+
+    def Discard(self, conn):
+        """
+        关闭并丢弃一个连接
+        :param conn: 连接对象
+        :return:
+        """
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self.cond:
+            self.closeNum += 1
+
+    def IsAlive(self, conn):
+        """
+        健康检查
+        :param conn: 连接对象
+        :return: 连接是否可用
+        """
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    def Acquire(self, timeout = None, check = False):
+        """
+        从连接池获取一个连接，连接数已达上限时等待其他线程归还连接
+        :param timeout: 最长等待秒数，None表示一直等待
+        :param check: 是否无论空闲时间长短都对复用的连接进行健康检查
+        :return: 连接对象
+        """
+        begin = time.perf_counter()
+        with self.cond:
+            while True:
+                if self.closed:
+                    raise Exception('ConnPool已关闭')
+                if len(self.idleList) > 0 or self.activeNum < self.maxSize:
+                    break
+                remain = None if timeout is None else timeout - (time.perf_counter() - begin)
+                if remain is not None and remain <= 0:
+                    raise Exception('ConnPool获取连接超时')
+                self.cond.wait(remain)
+            self.activeNum += 1
+            idle = self.idleList.pop() if len(self.idleList) > 0 else None
+            wait = time.perf_counter() - begin
+            self.acquireNum += 1
+            self.waitTime += wait
+            self.maxWaitTime = max(self.maxWaitTime, wait)
+        try:
+            if idle is None:
+                return self.Connect()
+            conn, lastUse = idle
+            if (check or time.time() - lastUse > self.pingInterval) and not self.IsAlive(conn):
+                self.Discard(conn)
+                with self.cond:
+                    self.reconnectNum += 1
+                return self.Connect()
+            return conn
+        except Exception:
+            with self.cond:
+                self.activeNum -= 1
+                self.cond.notify()
+            raise
+
+    def Release(self, conn, broken = False):
+        """
+        将连接归还连接池
+        :param conn: 连接对象
+        :param broken: 连接是否已损坏，损坏的连接会被关闭而不是放回连接池
+        :return:
+        """
+        with self.cond:
+            self.activeNum -= 1
+            if broken or self.closed:
+                self.Discard(conn)
+            else:
+                self.idleList.append([conn, time.time()])
+            self.cond.notify()
+
+    def Query(self, sqlText, fetchOne = False, retry = 1):
+        """
+        使用连接池中的连接执行一条查询，因连接类异常执行失败时丢弃该连接，并在健康检查后用可用的连接重试，其他异常（如sql错误）直接抛出
+        :param sqlText: sql语句
+        :param fetchOne: 是否只读取一条记录
+        :param retry: 失败后的重试次数
+        :return: fetchOne为True时返回一条记录，否则返回记录的list
+        """
+        check = False
+        while True:
+            conn = self.Acquire(check = check)
+            try:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(sqlText)
+                    result = cursor.fetchone() if fetchOne else cursor.fetchall()
+                finally:
+                    cursor.close()
+            except self.GetConnErrors():
+                self.Release(conn, broken = True)
+                if retry <= 0:
+                    raise
+                retry -= 1
+                check = True
+                continue
+            except Exception:
+                self.Release(conn)
+                raise
+            self.Release(conn)
+            return result
+
+    def Close(self):
+        """
+        关闭连接池及其中所有的空闲连接，正在使用的连接会在归还时关闭
+        :return:
+        """
+        with self.cond:
+            self.closed = True
+            for conn, lastUse in self.idleList:
+                self.Discard(conn)
+            self.idleList = []
+            self.cond.notify_all()
+
+    def GetStat(self):
+        """
+        获取连接池的统计信息
+        :return: dict类型的统计信息
+        """
+        with self.cond:
+            return {'create': self.createNum,
+                    'close': self.closeNum,
+                    'reconnect': self.reconnectNum,
+                    'active': self.activeNum,
+                    'idle': len(self.idleList),
+                    'acquire': self.acquireNum,
+                    'waitTime': self.waitTime,
+                    'maxWaitTime': self.maxWaitTime}
+
+
+"""
+所有连接池，key由连接字符串或连接参数dict生成"""
+poolDict = dict()
+poolLock = threading.Lock()
+"""
+新建连接池时使用的默认最大连接数"""
+defaultMaxSize = 4
+
+
+def GetPoolKey(connStr):
+    """
+    根据连接字符串或连接参数dict生成连接池的key
+    :param connStr: 数据库连接字符串或连接参数dict
+    :return: 可哈希的key
+    """
+    if isinstance(connStr, dict):
+        return tuple(sorted((k, str(v)) for k, v in connStr.items()))
+    return connStr
+
+
+def GetPool(connStr):
+    """
+    获取连接字符串对应的共享连接池，不存在或已关闭时新建一个
+    :param connStr: 数据库连接字符串（Oracle）或连接参数dict（MySQL）
+    :return: ConnPool对象
+    """
+    key = GetPoolKey(connStr)
+    with poolLock:
+        pool = poolDict.get(key)
+        if pool is None or pool.closed:
+            pool = ConnPool(connStr, defaultMaxSize)
+            poolDict[key] = pool
+        return pool
+
+
+def Query(connStr, sqlText, fetchOne = False):
+    """
+    使用共享连接池执行一条查询
+    :param connStr: 数据库连接字符串（Oracle）或连接参数dict（MySQL）
+    :param sqlText: sql语句
+    :param fetchOne: 是否只读取一条记录
+    :return: fetchOne为True时返回一条记录，否则返回记录的list
+    """
+    return GetPool(connStr).Query(sqlText, fetchOne)
+
+
+def ShutdownAll():
+    """
+    关闭所有共享连接池
+    :return:
+    """
+    with poolLock:
+        for pool in poolDict.values():
+            pool.Close()
+        poolDict.clear()
+
+
+def GetAllStat():
+    """
+    获取所有共享连接池的统计信息
+    :return: dict类型，key为连接池的key（MySQL连接参数中的密码不会被输出），value为该连接池的统计信息
+    """
+    with poolLock:
+        statDict = dict()
+        for key, pool in poolDict.items():
+            if isinstance(key, tuple):
+                key = ','.join(k + '=' + v for k, v in key if k not in ('password', 'passwd'))
+            elif '/' in key and '@' in key:
+                key = key[: key.index('/')] + key[key.index('@'):]
+            statDict[key] = pool.GetStat()
+        return statDict
@@ -0,0 +1,238 @@
+import json
+import os
+import pickle
+import queue
+import struct
+import threading
+import time
+
+"""
+日志级别"""
+LOG_DEBUG = 10
+LOG_INFO = 20
+LOG_WARN = 30
+LOG_ERROR = 40
+LEVEL_NAME = {LOG_DEBUG: 'DEBUG', LOG_INFO: 'INFO', LOG_WARN: 'WARN', LOG_ERROR: 'ERROR'}
+
+
+class EventLog:
+    """
+    结构化事件日志：调用方只把事件（时间戳、级别、类型、名称和字段dict）放入队列，
+    格式化和写文件都在后台线程中批量完成，因此记录日志的开销与磁盘速度无关。
+    事件分为两类：'event'为一般事件（如日志消息），'span'为计时区间（如各阶段、各数据源读取数据和各事件接收者的耗时，单位为微秒）。
+    输出格式为JSON lines（每行一个JSON对象），或者二进制格式（每条记录为长度前缀加pickle数据，写入和读取更快），可以用ReadEvents读取"""
+    """
+    日志文件路径"""
+    path = None
+    """
+    是否采用二进制格式"""
+    binary = False
+    """
+    日志级别，低于此级别的事件不被记录"""
+    level = LOG_INFO
+    """
+    是否记录计时区间"""
+    tracing = True
+    """
+    事件队列"""
+    eventQueue = None
+    """
+    后台写入线程"""
+    writer = None
+    """
+    后台线程写入的间隔（秒），间隔内的事件一次性批量写入，避免后台线程频繁唤醒与主线程争用GIL"""
+    flushInterval = 0.2
+    """
+    停止信号"""
+    stopEvent = None
+
+    def __init__(self, path, level = LOG_INFO, binary = False, tracing = True, flushInterval = 0.2):
+        """
+        构造一个事件日志，并启动后台写入线程
+        :param path: 日志文件路径（追加写入），所在目录不存在时自动创建
+        :param level: 日志级别
+        :param binary: 是否采用二进制格式，为False时为JSON lines格式
+        :param tracing: 是否记录计时区间
+        :param flushInterval: 后台线程写入的间隔（秒）
+        """
+        self.path = path
+        self.level = level
+        self.binary = binary
+        self.tracing = tracing
+        self.flushInterval = flushInterval
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok = True)
+        self.eventQueue = queue.SimpleQueue()
+        self.stopEvent = threading.Event()
+        self.writer = threading.Thread(target = self.WriteLoop, args = (open(path, 'ab' if binary else 'a', encoding = None if binary else 'utf-8'),),
+                                       name = 'EventLog', daemon = True)
+        self.writer.start()
+
+    @staticmethod
+    def Now():
+        """
+        获取计时起点，与Span配合使用
+        :return: 单调时钟的纳秒数
+        """
+        return time.perf_counter_ns()
+
+    def Event(self, name, level = LOG_INFO, **fields):
+        """
+        记录一个一般事件
+        :param name: 事件名称
+        :param level: 日志级别
+        :param fields: 事件的字段，值须可以被JSON序列化（日期时间类型会被转换为字符串）或pickle
+        :return:
+        """
+        if level >= self.level:
+            self.eventQueue.put((time.time(), level, 'event', name, None, fields))
+
+    def Span(self, name, begin, **fields):
+        """
+        记录一个计时区间，区间从begin开始到此时结束
+        :param name: 区间名称
+        :param begin: 由Now()得到的计时起点
+        :param fields: 区间的字段
+        :return:
+        """
+        if self.tracing:
+            self.eventQueue.put((time.time(), LOG_DEBUG, 'span', name, (time.perf_counter_ns() - begin) // 1000, fields))
+
+    def Trace(self, name, **fields):
+        """
+        用于with语句的计时区间，例如：with eventLog.Trace('Rebalance', account = 1): ...
+        :param name: 区间名称
+        :param fields: 区间的字段
+        :return: 上下文管理器
+        """
+        return SpanContext(self, name, fields)
+
+    def WriteLoop(self, file):
+        """
+        后台写入线程：每隔flushInterval秒取出队列中的全部事件一次性写入并刷新，收到停止信号时写完剩余事件后结束
+        :param file: 日志文件
+        :return:
+        """
+        running = True
+        while running:
+            running = not self.stopEvent.wait(self.flushInterval)
+            batch = []
+            while True:
+                try:
+                    batch.append(self.eventQueue.get_nowait())
+                except queue.Empty:
+                    break
+            if len(batch) == 0:
+                continue
+            try:
+                if self.binary:
+                    file.write(b''.join([EncodeBinary(event) for event in batch]))
+                else:
+                    file.write(''.join([EncodeJson(event) for event in batch]))
+                file.flush()
+            except Exception:
+                pass  # 写日志失败不影响主流程
+        file.close()
+
+    def Close(self):
+        """
+        写完队列中剩余的事件并关闭日志文件
+        :return:
+        """
+        if self.writer is not None:
+            self.stopEvent.set()
+            self.writer.join()
+            self.writer = None
+
+
+class SpanContext:
+    """EventLog.Trace返回的上下文管理器"""
+    __slots__ = ('eventLog', 'name', 'fields', 'begin')
+
+    def __init__(self, eventLog, name, fields):
+        self.eventLog = eventLog
+        self.name = name
+        self.fields = fields
+        self.begin = None
+
+    def __enter__(self):
+        self.begin = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        if excType is not None:
+            self.fields['error'] = excType.__name__
+        self.eventLog.Span(self.name, self.begin, **self.fields)
+        return False
+
+
+def ToRecord(event):
+    """
+    将队列中的事件转换为dict
+    :param event: (时间戳, 级别, 类型, 名称, 耗时, 字段)
+    :return: dict类型的记录
+    """
+    ts, level, kind, name, duration, fields = event
+    record = {'time': ts, 'level': LEVEL_NAME.get(level, level), 'kind': kind, 'name': name}
+    if duration is not None:
+        record['us'] = duration
+    record.update(fields)
+    return record
+
+
+def EncodeJson(event):
+    """
+    将事件编码为一行JSON
+    :param event: 队列中的事件
+    :return: str
+    """
+    return json.dumps(ToRecord(event), ensure_ascii = False, default = str) + '\n'
+
+
+def EncodeBinary(event):
+    """
+    将事件编码为长度前缀加pickle数据
+    :param event: 队列中的事件
+    :return: bytes
+    """
+    data = pickle.dumps(ToRecord(event), pickle.HIGHEST_PROTOCOL)
+    return struct.pack('<I', len(data)) + data
+
+
+def ReadEvents(path, binary = None):
+    """
+    读取事件日志
+    :param path: 日志文件路径
+    :param binary: 是否为二进制格式，为None时根据文件首字节判断
+    :return: dict类型记录的生成器
+    """
+    file = open(path, 'rb')
+    raw = file.read()
+    file.close()
+    if binary is None:
+        binary = len(raw) > 0 and raw[: 1] != b'{'
+    if not binary:
+        for line in raw.decode('utf-8').splitlines():
+            if line.strip() != '':
+                yield json.loads(line)
+        return
+    pos = 0
+    while pos + 4 <= len(raw):
+        size = struct.unpack('<I', raw[pos : pos + 4])[0]
+        if pos + 4 + size > len(raw):
+            break
+        yield pickle.loads(raw[pos + 4 : pos + 4 + size])
+        pos += 4 + size
+
+
+def GetReceiverName(rcv):
+    """
+    获取事件接收者的名称，用于计时区间的字段
+    :param rcv: 事件接收者（函数或绑定方法）
+    :return: str
+    """
+    name = getattr(rcv, '__qualname__', None)
+    if name is None:
+        name = type(rcv).__name__
+    return getattr(rcv, '__module__', '') + '.' + name if getattr(rcv, '__module__', None) else name
@@ -1,95 +1,52 @@
 ﻿import numpy as np
 import datetime
-import time
 import os
-import shutil
-import ZODB.FileStorage as fs
-import ZODB
-import transaction as ts
 import warnings
 import sys
-import pymysql as ms
+import gongcq.Checkpoint as Checkpoint
+import gongcq.DbPool as DbPool
+import gongcq.EventLog as EventLog
+import gongcq.Scheduler as Scheduler
+import gongcq.Tools as Tools
 sys.setrecursionlimit(10000)  # 设置最大递归深度
 warnings.filterwarnings("ignore")  # 关闭警告
 os.environ['NLS_LANG'] = 'SIMPLIFIED CHINESE_CHINA.UTF8'
 
-def GetRoot(path):
-    strg = fs.FileStorage(path)
-    zDb = ZODB.DB(strg)
-    zConn = zDb.open()
-    return zConn.root(), zDb
-
 # 尝试从已保存的状态恢复
-tempMaxDir = 0
-drRoot = os.path.join('.', 'DataRepeater')
-for subDir in os.listdir(drRoot):
-    if os.path.isfile(os.path.join(drRoot, subDir)):
-        os.remove(os.path.join(drRoot, subDir))
-        continue
-    try:
-        datetime.datetime.strptime(subDir, "%Y%m%d")
-        subDirNum = int(subDir)
-        if subDirNum > tempMaxDir:
-            tempMaxDir = subDirNum
-    except:
-        shutil.rmtree(os.path.join(drRoot, subDir))
-if tempMaxDir > 0:
-    root, db = GetRoot(os.path.join(drRoot, str(tempMaxDir), 'DataRepeater'))
-    mkt = root['mkt']
-    stg = root['stg']
-    db.close()
-else:
+ckp = Checkpoint.Checkpoint(os.path.join('.', 'Checkpoint'))
+mkt, stg = ckp.Load()
+if mkt is None:
     from Init import mkt
     from Init import stg
 # 再次更新各对象的数据库链接属性（因为可能因为更改数据库地址而重启程序）----
 # -------------------------------------------------------------
-while mkt.FetchDate():
+mkt.StartPrefetch()  # 在后台并发读取各数据源的数据
+mkt.SetEventLog(EventLog.EventLog(os.path.join('.', 'logfile', 'events.jsonl')))  # 日志及各阶段耗时由后台线程写入
+
+
+def SaveCheckpoint(market):
     print('--------------------------------------', end = '')
     print(datetime.datetime.now())
-    if datetime.datetime.now() < mkt.crtDate + datetime.timedelta(hours = 16, minutes=30):
-        break
-    while datetime.datetime.now() < mkt.crtDate + datetime.timedelta(hours = 16, minutes=30):
-        time.sleep(300)
-    print(mkt.crtDate)
-    mkt.BeforeOpen()
-    mkt.Open()
-    mkt.Close()
-    mkt.AfterClose()
+    print(market.crtDate)
+    market.WriteLog('Begin to save checkpoint')
+    ckp.Save(market, stg)
+    market.WriteLog('Success to save checkpoint')
 
-    mkt.WriteLog('Begin to save status in ZODB')
-    lf = mkt.logFile
-    mkt.logFile = None  # 文件对象不能序列化，在保存状态之前先置空，下次在FetchDate中恢复
-    # # 保存状态-------------------------------------------
-    # dtStr = mkt.crtDate.strftime('%Y%m%d')
-    # # drPathTemp = drRoot + '_' + dtStr + '\\'
-    # # drPath = drRoot + dtStr + '\\'
-    # drPathTemp = os.path.join(drRoot, '_' + dtStr)
-    # drPath = os.path.join(drRoot, dtStr)
-    # if os.path.exists(drPathTemp):
-    #     shutil.rmtree(drPathTemp)
-    # if os.path.exists(drPath):
-    #     shutil.rmtree(drPath)
-    # os.mkdir(drPathTemp)
-    # # root, db = GetRoot(drPathTemp + 'DataRepeater')
-    # root, db = GetRoot(os.path.join(drPathTemp, 'DataRepeater'))
-    # root['mkt'] = mkt
-    # root['stg'] = stg
-    # root['saveTime'] = datetime.datetime.now()
-    # ts.commit()
-    # db.close()
-    # # 重命名路径，去掉日期字符串前的下划线，以表示状态已经成功保存
-    # os.rename(drPathTemp, drPath)
-    # # 删除旧的状态记录
-    # for subDir in os.listdir(drRoot):
-    #     if subDir != dtStr:
-    #         # fullPath = drRoot + subDir
-    #         fullPath = os.path.join(drRoot, subDir)
-    #         if os.path.isfile(fullPath):
-    #             os.remove(fullPath)
-    #         elif os.path.isdir(fullPath):
-    #             shutil.rmtree(fullPath)
-    # # ------------------------------------------------------
-    mkt.logFile = lf  # 恢复日志
-    mkt.WriteLog('Success to save status in ZODB')
 
+# 按交易日历和各阶段的时间触发事件，收盘后行情数据一旦就绪即触发收盘后事件（须有readySql才能判断是否就绪）
+if mkt.dsList[0].sql == Tools.sqlPrc and mkt.dsList[0].readySql is None:
+    mkt.dsList[0].readySql = Tools.sqlPrcReady
+sch = Scheduler.Scheduler(mkt)
+sch.AddDayHandler(SaveCheckpoint)
+try:
+    sch.Run()
+finally:
+    # 异常退出时也要关闭事件日志，否则后台线程中尚未写入的日志会丢失
+    try:
+        ckp.Close()
+        mkt.StopPrefetch()
+        mkt.WriteLog('Connection pool stat: ' + str(DbPool.GetAllStat()))
+        DbPool.ShutdownAll()
+    finally:
+        mkt.eventLog.Close()
 hah=0
\ No newline at end of file
@@ -1,10 +1,22 @@
-import cx_Oracle
+import concurrent.futures
 import datetime
 import gongcq.Account as Account
+import gongcq.Backend as Backend
+import gongcq.Calendar as Calendar
+import gongcq.CircSeries as CircSeries
+import gongcq.DataCache as DataCache
+import gongcq.DbPool as DbPool
+import gongcq.EventLog as EventLog
 import os
-import pymysql
 import numpy as np
 
+"""
+日志级别"""
+LOG_DEBUG = EventLog.LOG_DEBUG
+LOG_INFO = EventLog.LOG_INFO
+LOG_WARN = EventLog.LOG_WARN
+LOG_ERROR = EventLog.LOG_ERROR
+
 class DataSource:
     """
     数据源类，用于从数据库中按时间顺序读取数据，并将数据记录对应到股票"""
@@ -12,15 +24,9 @@ class DataSource:
     数据库链接字符串"""
     dbStr = None
     """
-    数据库链接对象"""
-    db = None
-    """
     sql命令"""
     sql = None
     """
-    读取结果集的游标"""
-    cursor = None
-    """
     股票编码的list，不属于此list的股票的数据将被忽略"""
     codeList = None
     """
@@ -44,8 +50,68 @@ class DataSource:
     """
     标记信息"""
     label = None
+    """
+    是否采用列式存储，如果为True，则数据存放于values与valid两个预分配的数组中，data为其上的记录视图"""
+    columnar = False
+    """
+    列式存储的数值数组，shape为(codeCount, fieldNum)，类型为float64，无效值为nan（第0列日期不存储，固定为nan）"""
+    values = None
+    """
+    列式存储的有效性掩码，shape为(codeCount,)，True表示对应股票有数据记录"""
+    valid = None
+    """
+    列式存储中当前数据的日期"""
+    dataDate = None
+    """
+    seq的numpy数组版本，用于向量化地将股票编码映射到股票序号"""
+    seqArr = None
+    """
+    按日期区间查询的sql命令，以{START_DATE}和{END_DATE}作为区间的起止日期（含头含尾），用于预加载"""
+    rangeSql = None
+    """
+    预加载的数据，key为'%Y-%m-%d'格式的日期字符串，value为当日的数据记录list，数据被读取后即从中移除"""
+    preloadDict = None
+    """
+    预加载区间的起止日期（'%Y-%m-%d'格式的字符串）"""
+    preloadStart = None
+    preloadEnd = None
+    """
+    最近一次从预加载数据中读取的日期及记录，用于同一日期被重复读取的情形"""
+    preloadLastKey = None
+    preloadLastRecords = None
+    """
+    本地磁盘缓存（DataCache.DataCache对象），为None时不使用缓存"""
+    cache = None
+    """
+    此数据源在磁盘缓存中的目录，由DataCache生成"""
+    cacheDir = None
+    """
+    面板数据（多日数据的三维数组，可以是内存映射的只读数组），设置后GetData直接从面板中读取数据：
+    panelIndex为日期字符串到面板下标的dict，panelValues的shape为(日期数, codeCount, fieldNum)，panelValid的shape为(日期数, codeCount)"""
+    panelIndex = None
+    panelValues = None
+    panelValid = None
+    """
+    历史数据（CircSeries.CircSeriesMatrix对象，shape为(天数, codeCount, 字段数)），为None时不保留历史数据；
+    historyCols为历史数据中保留的列号list"""
+    history = None
+    historyCols = None
+    """
+    后台读取（Prefetch）中的日期及其concurrent.futures.Future对象"""
+    pendingDate = None
+    pendingFuture = None
+    """
+    判断某日数据是否已入库的sql语句（以{TRADE_DATE}表示日期，结果集第0行第0列大于0表示已入库），
+    为None时直接读取当日数据来判断"""
+    readySql = None
+    """
+    性能分析器（Profiler.Profiler对象），设置后GetData分别统计等待后台读取、读取和写入data的耗时"""
+    profiler = None
+    """
+    数据源后端（Backend.Backend对象），设置后Fetch从后端读取数据，不再使用内置的数据库或文本读取逻辑"""
+    backend = None
 
-    def __init__(self, connStr, sql, codeList, csMap, filedNum, label = None):
+    def __init__(self, connStr, sql, codeList, csMap, filedNum, label = None, columnar = False, rangeSql = None):
         """
         构造一个数据源
         :param connStr: 数据库连接字符串，如果是Oracle数据库，则为包含连接信息的str类型；如果是mysql数据库，则为dict类型；如果是文本数据源，则为表示文本所在目录的str类型
@@ -54,20 +120,30 @@ class DataSource:
         :param csMap: 股票编码和股票代码映射对象
         :param filedNum: 结果集的字段数
         :param label: 标记信息
+        :param columnar: 是否采用列式存储（要求除第0列日期外的所有字段均为数值类型）
+        :param rangeSql: 按日期区间查询的sql语句，用于预加载，可以为None
         """
         self.dbStr = connStr
         self.sql = sql
+        self.rangeSql = rangeSql
         self.codeList = codeList
         self.minCode = min(codeList)
         self.maxCode = max(codeList)
         self.codeCount = len(codeList)
-        self.data = [None] * self.codeCount
         self.csMap = csMap
         self.fieldNum = filedNum
         self.label = label
         self.seq = [-1] * (self.maxCode - self.minCode + 1)
         for i in range(self.codeCount):
             self.seq[self.codeList[i] - self.minCode] = i
+        self.seqArr = np.array(self.seq, dtype = np.int64)
+        self.columnar = columnar
+        if self.columnar:
+            self.values = np.full([self.codeCount, self.fieldNum], np.nan)
+            self.valid = np.zeros([self.codeCount], dtype = bool)
+            self.data = ColumnarData(self)
+        else:
+            self.data = [None] * self.codeCount
 
     def GetSeq(self, code):
         """
@@ -79,6 +155,18 @@ class DataSource:
             return -1
         return self.seq[code - self.minCode]
 
+    def GetSeqArray(self, codes):
+        """
+        向量化地根据股票编码获取股票序号
+        :param codes: 股票编码数组
+        :return: 股票序号数组（int64），不在codeList中的编码对应-1
+        """
+        codes = np.asarray(codes, dtype = np.int64)
+        inRange = (codes >= self.minCode) & (codes <= self.maxCode)
+        seqs = np.full(codes.shape, -1, dtype = np.int64)
+        seqs[inRange] = self.seqArr[codes[inRange] - self.minCode]
+        return seqs
+
     def GetCode(self, seq):
         """
         根据股票序号获取股票编码
@@ -89,6 +177,132 @@ class DataSource:
             return -1
         return self.codeList[seq]
 
+    def GetRow(self, seq):
+        """
+        从列式存储中构造一条数据记录（列式模式下data视图的元素）
+        :param seq: 股票序号
+        :return: 数据记录的tuple对象（第0个元素为日期，第1个元素为股票编码，nan被还原为None），如果没有相应记录则返回None
+        """
+        if not self.valid[seq]:
+            return None
+        row = self.values[seq].tolist()
+        row[0] = self.dataDate
+        row[1] = self.codeList[seq]
+        for i in range(2, self.fieldNum, 1):
+            if row[i] != row[i]:
+                row[i] = None
+        return tuple(row)
+
+    def GetColumn(self, col, seqs = None):
+        """
+        获取所有股票（或指定股票）某一列的数值
+        :param col: 列号
+        :param seqs: 股票序号数组，为None时获取所有股票
+        :return: 长度为codeCount（或len(seqs)）的float64数组，没有数据记录或值为空的位置为nan
+        """
+        if self.columnar:
+            return self.values[:, col].copy() if seqs is None else self.values[seqs, col]
+        seqList = range(self.codeCount) if seqs is None else seqs
+        column = np.full([len(seqList)], np.nan)
+        for i, seq in enumerate(seqList):
+            record = self.data[seq]
+            if record is not None and record[col] is not None:
+                column[i] = record[col]
+        return column
+
+    def GetMatrix(self):
+        """
+        以数组形式获取当前数据
+        :return: shape为(codeCount, fieldNum)的float64数组（第0列为nan，第1列为股票编码，无效值为nan），shape为(codeCount,)的有效性掩码
+        """
+        if self.columnar:
+            return self.values.copy(), self.valid.copy()
+        matrix = np.full([self.codeCount, self.fieldNum], np.nan)
+        valid = np.zeros([self.codeCount], dtype = bool)
+        for seq in range(self.codeCount):
+            record = self.data[seq]
+            if record is None:
+                continue
+            valid[seq] = True
+            matrix[seq, 1:] = [np.nan if v is None else v for v in record[1:]]
+        return matrix, valid
+
+    def __getstate__(self):
+        """
+        序列化时（如保存检查点）不保存后台读取中的Future对象、性能分析器、预加载数据和当日数据（恢复后为空，与ClearData之后相同）；
+        面板数据为.npy文件的内存映射时只保存文件路径，恢复时重新映射，否则不保存（恢复后须重新AttachPanel）
+        :return:
+        """
+        state = self.__dict__.copy()
+        for name in ('pendingDate', 'pendingFuture', 'profiler', 'preloadDict', 'preloadStart', 'preloadEnd', 'preloadLastKey',
+                     'preloadLastRecords', 'data', 'values', 'valid', 'dataDate', 'panelIndex', 'panelValues', 'panelValid'):
+            state.pop(name, None)
+        if self.panelIndex is not None:
+            valuesFile, validFile = GetMemmapFile(self.panelValues), GetMemmapFile(self.panelValid)
+            if valuesFile is not None and validFile is not None:
+                state['panelFiles'] = (self.panelIndex, valuesFile, validFile, self.panelValues.shape, self.panelValid.shape)
+        return state
+
+    def __setstate__(self, state):
+        """
+        反序列化后重新分配当日数据的存储，并重新映射面板数据文件
+        :param state:
+        :return:
+        """
+        panelFiles = state.pop('panelFiles', None)
+        self.__dict__.update(state)
+        if self.columnar:
+            self.values = np.full([self.codeCount, self.fieldNum], np.nan)
+            self.valid = np.zeros([self.codeCount], dtype = bool)
+            self.data = ColumnarData(self)
+        else:
+            self.data = [None] * self.codeCount
+        if panelFiles is not None and os.path.exists(panelFiles[1]) and os.path.exists(panelFiles[2]):
+            values, valid = np.load(panelFiles[1], mmap_mode = 'r'), np.load(panelFiles[2], mmap_mode = 'r')
+            if values.shape == panelFiles[3] and valid.shape == panelFiles[4]:   # 原数组为整个文件（而不是其切片）时才恢复
+                self.panelIndex, self.panelValues, self.panelValid = panelFiles[0], values, valid
+
+    def KeepHistory(self, capacity, cols = None):
+        """
+        开始保留最近若干日的历史数据，此后每次Market.AfterClose读取数据后都会将当日的数据加入历史数据（没有数据的股票为nan）
+        :param capacity: 保留的天数
+        :param cols: 保留的列号list，为None时保留除第0列（交易日期，不是数值）以外的所有列
+        :return:
+        """
+        self.historyCols = list(range(1, self.fieldNum)) if cols is None else list(cols)
+        self.history = CircSeries.CircSeriesMatrix(capacity, self.codeCount, len(self.historyCols))
+
+    def AppendHistory(self):
+        """
+        将当前数据加入历史数据
+        :return:
+        """
+        if self.columnar:
+            self.history.Append(self.values[:, self.historyCols])
+        else:
+            self.history.Append(self.GetMatrix()[0][:, self.historyCols])
+
+    def GetHistory(self, col, num):
+        """
+        获取某一列最近num日的历史数据
+        :param col: 列号，必须在保留的列中
+        :param num: 天数
+        :return: shape为(num, codeCount)、按时间顺序排列的视图（不应修改），没有数据的位置为nan
+        """
+        return self.history.GetWindow(num, self.historyCols.index(col))
+
+    def AttachPanel(self, dateStrList, values, valid):
+        """
+        设置面板数据，此后GetData只从面板中读取数据，不再访问数据库或文本文件
+        :param dateStrList: '%Y-%m-%d'格式的日期字符串list，与面板的第0维对应
+        :param values: shape为(日期数, codeCount, fieldNum)的float64数组
+        :param valid: shape为(日期数, codeCount)的bool数组
+        :return:
+        """
+        self.panelIndex = {dateStr: i for i, dateStr in enumerate(dateStrList)}
+        self.panelValues = values
+        self.panelValid = valid
+
     def GetRecord(self, code):
         """
         获取数据记录
@@ -103,64 +317,461 @@ class DataSource:
 
     def GetData(self, date):
         """
-        获取指定日期的数据并存入data变量中，data本身为list类型，每个元素代表一个记录（tuple类型或None）
+        获取指定日期的数据并存入data变量中，data本身为list类型，每个元素代表一个记录（tuple类型或None）；
+        如果已经通过Prefetch在后台读取了该日的数据，则直接使用后台读取的结果
         :param date: 日期
         :return:
         """
         self.ClearData()
+        profiler = self.profiler
+        payload = None
+        fetched = False
+        if self.pendingFuture is not None:
+            pendingDate, future = self.pendingDate, self.pendingFuture
+            self.pendingDate = None
+            self.pendingFuture = None
+            if profiler is not None:
+                profiler.Begin('Wait')
+            try:
+                result = future.result()   # 后台读取的异常在此处抛出；日期不符时也等待其结束，避免与下面的读取并发
+            finally:
+                if profiler is not None:
+                    profiler.End()
+            if pendingDate == date:
+                payload = result
+                # 当日及以后的空结果可能只是后台读取时数据尚未入库，重新读取
+                fetched = payload is not None or date.strftime('%Y-%m-%d') < datetime.date.today().strftime('%Y-%m-%d')
+        if profiler is None:
+            if not fetched:
+                payload = self.Fetch(date)
+            return self.Fill(date, payload)
+        if not fetched:
+            profiler.Begin('Fetch[' + ('panel' if self.panelIndex is not None else self.backend.kind if self.backend is not None else
+                                       'text' if self.sql is None else 'db') + ']')
+            try:
+                payload = self.Fetch(date)
+            finally:
+                profiler.End()
+        profiler.Begin('Fill')
+        try:
+            return self.Fill(date, payload)
+        finally:
+            profiler.End()
+
+    def Prefetch(self, executor, date):
+        """
+        在后台线程中读取指定日期的数据，读取结果由之后对同一日期的GetData使用
+        :param executor: concurrent.futures.Executor对象
+        :param date: 日期
+        :return:
+        """
+        if self.pendingFuture is not None:
+            if self.pendingDate == date:
+                return
+            self.pendingFuture.result()
+        self.pendingDate = date
+        self.pendingFuture = executor.submit(self.Fetch, date)
+
+    def IsReady(self, date):
+        """
+        判断指定日期的数据是否已经可以读取：设置了后端时由后端判断；文本数据源判断文件是否存在；数据库数据源在指定了readySql时执行readySql，
+        否则直接读取当日数据，读取到的数据会被保留，之后对同一日期的GetData不再重复读取
+        :param date: 日期
+        :return: bool
+        """
+        if self.panelIndex is not None:
+            return True
+        if self.pendingFuture is not None and self.pendingDate == date:
+            if not self.pendingFuture.done():  # 后台读取尚未完成
+                return False
+            if self.pendingFuture.exception() is None and self.pendingFuture.result() is not None:
+                return True
+        dateStr = date.strftime('%Y-%m-%d')
+        if self.backend is not None:
+            ready = self.backend.IsReady(self, dateStr)
+            if ready is not None:
+                return ready
+        elif self.sql is None:
+            return os.path.exists(os.path.join(self.dbStr, dateStr + '.csv'))
+        elif self.readySql is not None:
+            return self.CheckReadySql(dateStr)
+        if self.pendingFuture is not None and self.pendingDate != date:  # 等待其他日期的后台读取结束，避免并发读取
+            concurrent.futures.wait([self.pendingFuture])
+        payload = self.Fetch(date)
+        if payload is None:
+            return False
+        future = concurrent.futures.Future()
+        future.set_result(payload)
+        self.pendingDate = date
+        self.pendingFuture = future
+        return True
+
+    def HasReadyCheck(self):
+        """
+        判断此数据源是否有低成本且能确认数据完整的就绪判断：面板数据、文本数据源（判断文件是否存在）、
+        实现了IsReady的后端，或指定了readySql的数据库数据源；否则IsReady只能读取当日的全部数据来判断，既不便宜也不能确认数据完整
+        :return: bool
+        """
+        if self.panelIndex is not None:
+            return True
+        if self.backend is not None:
+            return type(self.backend).IsReady is not Backend.Backend.IsReady
+        return self.sql is None or self.readySql is not None
+
+    def CheckReadySql(self, dateStr):
+        """
+        执行readySql判断某日数据是否已经完整入库
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: bool
+        """
+        record = DbPool.Query(self.dbStr, self.readySql.replace('{TRADE_DATE}', dateStr), fetchOne = True)
+        return record is not None and record[0] is not None and record[0] > 0
+
+    def IsCacheable(self, dateStr):
+        """
+        判断某日的查询结果是否可以写入磁盘缓存：只有今日以前的数据，或由readySql确认已经完整入库的数据才被缓存，
+        避免将尚未入库完毕的部分数据永久保存在缓存中
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: bool
+        """
+        if dateStr < datetime.date.today().strftime('%Y-%m-%d'):
+            return True
+        return self.readySql is not None and self.CheckReadySql(dateStr)
+
+    def Fetch(self, date):
+        """
+        读取指定日期的数据（只访问面板数据、后端、数据库、磁盘缓存、预加载数据或文本文件，不修改data），可以在后台线程中执行
+        :param date: 日期
+        :return: 读取结果，没有数据时为None，由Fill写入data
+        """
+        dateStr = date.strftime('%Y-%m-%d')
+        if self.panelIndex is not None:   # panel data
+            i = self.panelIndex.get(dateStr)
+            if i is None or not self.panelValid[i].any():
+                return None
+            return 'panel', i
+        if self.backend is not None:
+            return self.backend.Fetch(self, dateStr)
         if self.sql is not None:   # database source
-            if isinstance(self.dbStr, dict): # mysql
-                self.db = pymysql.connect(**self.dbStr)
-            else:                            # Oracle
-                self.db = cx_Oracle.connect(self.dbStr)
-            self.cursor = self.db.cursor()
-            self.cursor.execute(self.sql.replace('{TRADE_DATE}', date.strftime('%Y-%m-%d')))
-            tempData = self.cursor.fetchall()
+            if self.cache is not None:
+                block = self.cache.Get(self, dateStr)
+                if block is not None:
+                    return 'block', block
+            # 设置了磁盘缓存时，预加载的数据大多写入了缓存，缓存未命中（如已过期）的日期须重新查询，而不是视为没有数据
+            if self.preloadDict is not None and self.preloadStart <= dateStr <= self.preloadEnd and \
+                    (self.cache is None or dateStr in self.preloadDict or dateStr == self.preloadLastKey):
+                tempData = self.GetPreloaded(dateStr)
+            else:
+                tempData = self.Query(self.sql.replace('{TRADE_DATE}', dateStr))
+                if len(tempData) == 1 and tempData[0] is None:
+                    tempData = []
+                # 今日及以后的数据可能尚未入库完毕，除非readySql确认已经完整入库，否则不写入缓存
+                if self.cache is not None and self.IsCacheable(dateStr):
+                    self.cache.Put(self, dateStr, tempData)
             if len(tempData) == 0 or (tempData[0] is None and len(tempData) == 1):
-                return False
-            for i in range(0, len(tempData), 1):
-                seq = self.GetSeq(tempData[i][1])
+                return None
+            return 'records', tempData
+        else:   # text source
+            path = os.path.join(self.dbStr, dateStr + '.csv')
+            if not os.path.exists(path):
+                return None
+            return 'text', self.ParseText(path)
+
+    def Fill(self, date, payload):
+        """
+        将Fetch的读取结果写入data
+        :param date: 日期
+        :param payload: Fetch的读取结果
+        :return: 是否有数据
+        """
+        if payload is None:
+            self.dataDate = date
+            return False
+        kind, content = payload
+        if kind == 'panel':
+            kind, content = 'matrix', (self.panelValues[content], self.panelValid[content])
+        if kind == 'matrix':
+            values, valid = content
+            if self.columnar:
+                self.values[:] = values
+                self.valid[:] = valid
+                self.dataDate = date
+                return True
+            return self.FillBlock(values[valid], date)
+        elif kind == 'block':
+            return self.FillBlock(content, date)
+        elif kind == 'records':
+            if self.columnar:
+                self.FillColumnar(content, date)
+                return True
+            for i in range(0, len(content), 1):
+                seq = self.GetSeq(content[i][1])
                 if seq >= 0:
-                    self.data[seq] = tempData[i]
+                    self.data[seq] = content[i]
             return True
-        else:   # text source
-            path = os.path.join(self.dbStr, date.strftime('%Y-%m-%d') + '.csv')
-            if os.path.exists(path):
-                file = open(path, 'r')
-            else:
-                return False
-            lines = file.readlines()
-            file.close()
-            for line in lines:
-                lineLen = len(line)
-                symbol = line[11 : 19]
-                code = self.csMap.GetCode(symbol)
-                if code is None:
-                    continue
-                seq = self.GetSeq(code)
-                if seq < 0:
+        else:   # text
+            self.FillBlock(content, date, nanAsNone = False)
+            return True
+
+    def ParseText(self, path):
+        """
+        一次性读取并解析定宽格式的文本数据文件：
+        每行第11至18个字符为股票代码，从第20个字符开始每10个字符为一个字段（字段宽9个字符，末字符不是数字时视为空值）
+        :param path: 文件路径
+        :return: shape为(记录数, fieldNum)的float64数组，第1列为股票编码（没有对应编码的记录为-1）
+        """
+        file = open(path, 'rb')
+        raw = file.read()
+        file.close()
+        raw = raw.replace(b'\r\n', b'\n')
+        firstLen = raw.find(b'\n')
+        buffer = np.frombuffer(raw, dtype = np.uint8)
+        if firstLen > 0 and len(raw) % (firstLen + 1) == 0 and (buffer[firstLen :: firstLen + 1] == 10).all():
+            # 所有行等长，直接将文件内容视为二维字符数组，不做拷贝
+            lineNum = len(raw) // (firstLen + 1)
+            mat = buffer.reshape(lineNum, firstLen + 1)
+            lineLen = np.full([lineNum], firstLen)
+        else:
+            lines = raw.split(b'\n')
+            # 与逐行读取的规则保持一致：末行没有换行符时，其最后一个字符不参与字段解析
+            lastLen = len(lines[-1]) - 1
+            if len(lines[-1]) == 0:
+                lines.pop()
+                lastLen = None
+            lineNum = len(lines)
+            if lineNum == 0:
+                return np.full([0, self.fieldNum], np.nan)
+            mat = np.array(lines, dtype = bytes)
+            mat = mat.view(np.uint8).reshape(lineNum, mat.dtype.itemsize)
+            lineLen = np.fromiter((len(line) for line in lines), dtype = np.int64, count = lineNum)
+            if lastLen is not None:
+                lineLen[-1] = lastLen
+        fieldCount = np.maximum((lineLen - 29 + 9) // 10, 0)
+        nField = min(int(fieldCount.max()), self.fieldNum - 2)
+        width = max(19, 29 + 10 * (nField - 1))
+        if mat.shape[1] < width:
+            mat = np.concatenate([mat, np.zeros([lineNum, width - mat.shape[1]], dtype = np.uint8)], axis = 1)
+        # 解析股票代码
+        symbolT = np.ascontiguousarray(mat[:, 11 : 19].T)
+        symbols = np.zeros([lineNum], dtype = np.int64)
+        hasDigit = np.zeros([lineNum], dtype = bool)
+        for char in symbolT:
+            digit = char - np.uint8(48)
+            isDigit = digit < 10
+            symbols = np.where(isDigit, symbols * 10 + digit, symbols)
+            hasDigit |= isDigit
+        block = np.full([lineNum, self.fieldNum], np.nan)
+        block[:, 1] = np.where((lineLen >= 19) & hasDigit, self.csMap.GetCodeArray(symbols), -1)
+        # 解析数值字段
+        if nField > 0:
+            cols = (20 + 10 * np.arange(nField)[:, None] + np.arange(9)[None, :]).ravel()
+            fieldMat = mat[:, cols].reshape(lineNum * nField, 9)
+            lastChar = fieldMat[:, 8]
+            fieldOk = ((lastChar >= 48) & (lastChar <= 57)).reshape(lineNum, nField) & (np.arange(nField)[None, :] < fieldCount[:, None])
+            block[:, 2 : 2 + nField] = ParseDecimal(fieldMat, fieldOk.ravel()).reshape(lineNum, nField)
+        return block[block[:, 1] >= 0]
+
+    def Query(self, sqlText):
+        """
+        使用共享连接池在数据源对应的数据库中执行一条查询
+        :param sqlText: sql语句
+        :return: 查询结果的list
+        """
+        return DbPool.Query(self.dbStr, sqlText)
+
+    def Preload(self, startDate, endDate, chunkDays = 366):
+        """
+        按日期区间一次性（或分块）读取数据并缓存在内存中，此后区间内的GetData直接从内存中获取数据，不再访问数据库；
+        如果设置了磁盘缓存，则今日以前的数据按日写入磁盘缓存而不驻留内存，且区间已被完整缓存（区间内的缓存文件均未过期）时不再访问数据库
+        :param startDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :param chunkDays: 每次查询覆盖的自然日天数，用于控制单次查询的结果集大小
+        :return: 预加载的记录数
+        """
+        if self.sql is None:
+            raise Exception('DataSource.Preload只适用于数据库数据源')
+        if self.rangeSql is None:
+            raise Exception('DataSource.Preload需要指定rangeSql，' + str(self.label))
+        self.preloadDict = dict()
+        self.preloadStart = startDate.strftime('%Y-%m-%d')
+        self.preloadEnd = endDate.strftime('%Y-%m-%d')
+        self.preloadLastKey = None
+        self.preloadLastRecords = None
+        if self.cache is not None and self.cache.HasRange(self, self.preloadStart, self.preloadEnd):
+            return 0
+        count = 0
+        allCached = True
+        cachedList = []
+        todayStr = datetime.date.today().strftime('%Y-%m-%d')
+        chunkBegin = startDate
+        while chunkBegin <= endDate:
+            chunkEnd = min(chunkBegin + datetime.timedelta(days = chunkDays - 1), endDate)
+            tempData = self.Query(self.rangeSql.replace('{START_DATE}', chunkBegin.strftime('%Y-%m-%d'))
+                                               .replace('{END_DATE}', chunkEnd.strftime('%Y-%m-%d')))
+            chunkDict = dict()
+            for record in tempData:
+                if record is None:
                     continue
-                record = [np.nan] * self.fieldNum
-                record[0] = date
-                record[1] = code
-                i = 0
-                begin = 20
-                end = 29
-                interval = 10
-                while end + i * interval < lineLen - 1:
-                    valueStr = line[begin + i * interval : end + i * interval]
-                    value = float(valueStr) if str.isnumeric(valueStr[-1]) else np.nan
-                    record[2 + i] = value
-                    i += 1
-                self.data[seq] = record
+                key = record[0].strftime('%Y-%m-%d')
+                if key in chunkDict:
+                    chunkDict[key].append(record)
+                else:
+                    chunkDict[key] = [record]
+                count += 1
+            for key, records in chunkDict.items():
+                if self.cache is not None and key < todayStr and self.cache.Put(self, key, records):
+                    cachedList.append(key)
+                else:
+                    self.preloadDict[key] = records
+                    allCached = False
+            chunkBegin = chunkEnd + datetime.timedelta(days = 1)
+        # 包含今日及以后的区间可能尚未入库完毕，不标记为已完整缓存
+        if self.cache is not None and allCached and self.preloadEnd < todayStr:
+            self.cache.PutRange(self, self.preloadStart, self.preloadEnd, cachedList)
+        return count
+
+    def GetPreloaded(self, dateStr):
+        """
+        从预加载的数据中取出某一日的数据记录，取出后即释放该日数据占用的内存
+        :param dateStr: '%Y-%m-%d'格式的日期字符串
+        :return: 数据记录的list，没有数据时为空list
+        """
+        if dateStr == self.preloadLastKey:
+            return self.preloadLastRecords
+        records = self.preloadDict.pop(dateStr, [])
+        self.preloadLastKey = dateStr
+        self.preloadLastRecords = records
+        return records
+
+    def FillColumnar(self, records, date):
+        """
+        将一组数据记录一次性写入列式存储
+        :param records: 数据记录的序列，每个记录的第1个元素为股票编码，第2个及以后的元素为数值（None视为nan）
+        :param date: 数据日期
+        :return:
+        """
+        block = DataCache.RecordsToBlock(records, self.fieldNum)
+        if block is None:
+            raise Exception('DataSource的列式存储只支持数值字段，' + str(self.label))
+        self.FillBlock(block, date)
+
+    def FillBlock(self, block, date, nanAsNone = True):
+        """
+        将数值数组形式的数据一次性写入data（列式模式下写入values与valid）
+        :param block: shape为(记录数, fieldNum)的float64数组，第1列为股票编码
+        :param date: 数据日期
+        :param nanAsNone: 非列式模式下是否将nan还原为None并以tuple存储记录，为False时记录为保留nan的list（文本数据源的格式）
+        :return: 是否有数据
+        """
+        self.dataDate = date
+        if len(block) == 0:
+            return False
+        seqs = self.GetSeqArray(block[:, 1])
+        keep = seqs >= 0
+        if self.columnar:
+            self.values[seqs[keep], 1:] = block[keep, 1:]
+            self.valid[seqs[keep]] = True
             return True
+        for row, seq in zip(block[keep].tolist(), seqs[keep].tolist()):
+            row[0] = date
+            row[1] = int(row[1])
+            if nanAsNone:
+                for i in range(2, self.fieldNum, 1):
+                    if row[i] != row[i]:
+                        row[i] = None
+                row = tuple(row)
+            self.data[seq] = row
+        return True
 
     def ClearData(self):
         """
-        清空所有数据
+        清空所有数据，列式模式下原地重置预分配的数组
         :return:
         """
-        self.data = [None] * self.codeCount
+        if self.columnar:
+            self.values.fill(np.nan)
+            self.valid.fill(False)
+            self.dataDate = None
+        else:
+            self.data = [None] * self.codeCount
+
+
+"""
+定宽十进制数值字符串中允许出现的字符：空白、'+'、'-'、'.'和数字"""
+DECIMAL_CHAR = np.zeros([256], dtype = bool)
+DECIMAL_CHAR[[0, 32, 43, 45, 46] + list(range(48, 58))] = True
+
+
+def ParseDecimal(charMat, mask):
+    """
+    向量化地解析定宽的十进制数值字符串（形如'  -12.345'），
+    对于只包含空白、符号、数字和一个小数点的字符串直接按数位计算，其余的字符串（如科学计数法）逐个按float解析
+    :param charMat: shape为(字符串数, 宽度)的uint8字符数组
+    :param mask: shape为(字符串数,)的bool数组，只解析为True的位置
+    :return: shape为(字符串数,)的float64数组，未解析的位置为nan
+    """
+    count, width = charMat.shape
+    charT = np.ascontiguousarray(charMat.T)
+    mantissa = np.zeros([count], dtype = np.int64)
+    fracNum = np.zeros([count], dtype = np.uint8)
+    dotNum = np.zeros([count], dtype = np.uint8)
+    negNum = np.zeros([count], dtype = np.uint8)
+    other = np.zeros([count], dtype = bool)
+    for char in charT:
+        digit = char - np.uint8(48)
+        isDigit = digit < 10
+        mantissa *= np.where(isDigit, np.int64(10), np.int64(1))
+        digit[~isDigit] = 0
+        mantissa += digit
+        fracNum += isDigit & (dotNum > 0)
+        dotNum += char == 46
+        negNum += char == 45
+        other |= ~np.take(DECIMAL_CHAR, char)
+    # 两个可精确表示的数相除的结果是正确舍入的，与按字符串解析的结果一致
+    value = mantissa / np.power(10.0, fracNum)
+    value[negNum > 0] *= -1
+    value[~mask] = np.nan
+    other = mask & (other | (dotNum > 1) | (negNum > 1))
+    if other.any():
+        value[other] = np.ascontiguousarray(charMat[other]).view('S' + str(width)).ravel().astype(float)
+    return value
+
+
+def GetMemmapFile(arr):
+    """
+    获取以np.load(mmap_mode = ...)映射整个.npy文件得到的数组的文件路径
+    :param arr: 数组
+    :return: 文件路径，不是此类数组时返回None
+    """
+    if isinstance(arr, np.memmap) and arr.filename is not None and str(arr.filename).endswith('.npy'):
+        return str(arr.filename)
+    return None
+
+
+class ColumnarData:
+    """
+    列式存储之上的记录视图，按股票序号索引时返回与非列式模式相同格式的记录（tuple或None），
+    使GetRecord、data[seq]等原有用法在列式模式下保持可用"""
+    """
+    所属的数据源"""
+    ds = None
+
+    def __init__(self, ds):
+        """
+        构造一个记录视图
+        :param ds: 列式模式的数据源
+        """
+        self.ds = ds
+
+    def __len__(self):
+        return self.ds.codeCount
+
+    def __getitem__(self, seq):
+        return self.ds.GetRow(seq)
+
+    def __iter__(self):
+        for seq in range(self.ds.codeCount):
+            yield self.ds.GetRow(seq)
 
 
 class Market:
@@ -199,6 +810,39 @@ class Market:
     """
     基准指数，此list中的每个元素都是一个长度为3的list，第0个表示日期，第1个表示基准指数的值，第2个表示基准指数的涨跌幅"""
     bmList = None
+    """
+    交易日历（Calendar.TradeCalendar对象），为None时每次推进交易日都从数据库读取"""
+    calendar = None
+    """
+    当日共享的行情列向量，key为行情数据源的列号，value为按股票序号排列的只读数组，行情数据变化时清空"""
+    priceDict = None
+    """
+    数组持仓账户的持仓簿矩阵（Account.BookMatrix对象），为None时各账户单独估值"""
+    bookMatrix = None
+    """
+    后台读取数据的线程池（concurrent.futures.ThreadPoolExecutor对象），为None时不预读取"""
+    executor = None
+    """
+    日志级别，低于此级别的日志不被写入"""
+    logLevel = LOG_DEBUG
+    """
+    回测模式：日志不按日写入单独的文件，而是缓存在logBuffer中，积累logBufferSize条后批量写入同一个文件，
+    日志时间为当前交易日而不是系统时间"""
+    backtest = False
+    logBuffer = None
+    logBufferSize = 1000
+    """
+    回测模式的日志文件路径，参数扫描的各子进程应使用各自的路径"""
+    backtestLogPath = os.path.join('.', 'logfile', 'backtest.txt')
+    """
+    结构化事件日志（EventLog.EventLog对象），设置后日志写入事件日志，并记录各阶段、各数据源读取数据和各事件接收者的耗时"""
+    eventLog = None
+    """
+    性能分析器（Profiler.Profiler对象），设置后统计各阶段、各数据源和各事件接收者的墙钟时间、CPU时间和内存块数变化"""
+    profiler = None
+    """
+    是否记录各阶段的耗时（设置了事件日志或性能分析器时为True）"""
+    tracing = False
 
     def __init__(self, connStr, cldSql, initDate):
         """
@@ -217,96 +861,435 @@ class Market:
         self.closeRcvList = []
         self.afterCloseRcvList = []
         self.bmList = []
-        self.logFile = open(os.path.join('.', 'logfile', 'default.txt'), 'w')
+        self.priceDict = dict()
+        self.logFile = None   # 第一次FetchDate之前的日志在写入时才打开logfile/default.txt（追加），构造Market对象本身不会覆盖已有的日志
+
+    def __getstate__(self):
+        """
+        序列化时不保存日志文件、事件日志、性能分析器、线程池和当日共享的行情向量（日志文件在下次FetchDate时重新打开）
+        :return:
+        """
+        state = self.__dict__.copy()
+        state['logFile'] = None
+        state['executor'] = None
+        state['eventLog'] = None
+        state['profiler'] = None
+        state['tracing'] = False
+        state['priceDict'] = dict()
+        return state
 
-    def WriteLog(self, logStr):
+    def __setstate__(self, state):
+        """
+        反序列化后恢复数组持仓账户的持仓簿与bookMatrix之间的视图关系
+        :param state:
+        :return:
+        """
+        self.__dict__.update(state)
+        if self.bookMatrix is not None:
+            for act in self.actList:
+                if act.bookRow is not None:
+                    self.bookMatrix.AttachBook(act.book, act.bookRow)
+
+    def WriteLog(self, logStr, level = LOG_INFO):
         """
         写入一条日志
         :param logStr: 日志内容
+        :param level: 日志级别
         :return:
         """
+        if level < self.logLevel:
+            return
+        if self.eventLog is not None:
+            self.eventLog.Event('Log', level, date = self.crtDate, msg = logStr)
+            return
+        if self.backtest:
+            self.logBuffer.append('[' + str(self.crtDate) + ']' + logStr + '\n')
+            if len(self.logBuffer) >= self.logBufferSize:
+                self.FlushLog()
+            return
         if self.logFile is None:
-            self.logFile = open(os.path.join('.', 'logfile', 'log' + str(self.crtDate.date()) + '.txt'), 'w')
+            self.logFile = open(os.path.join('.', 'logfile', 'default.txt'), 'a')
         self.logFile.write('[' + str(datetime.datetime.now()) + ']' + '\n\r\n' + logStr + '\n\r\n')
         self.logFile.flush()
 
+    def FlushLog(self):
+        """
+        将回测模式下缓存的日志写入文件
+        :return:
+        """
+        if self.logBuffer is None or len(self.logBuffer) == 0:
+            return
+        if self.logFile is None:
+            self.logFile = open(self.backtestLogPath, 'a')
+        self.logFile.write(''.join(self.logBuffer))
+        self.logFile.flush()
+        self.logBuffer.clear()
+
+    def SetEventLog(self, eventLog):
+        """
+        设置结构化事件日志，为None时恢复写入日志文件
+        :param eventLog: EventLog.EventLog对象
+        :return:
+        """
+        self.eventLog = eventLog
+        self.tracing = self.eventLog is not None or self.profiler is not None
+
+    def SetProfiler(self, profiler):
+        """
+        设置性能分析器（同时设置给所有数据源），为None时关闭性能分析
+        :param profiler: Profiler.Profiler对象
+        :return:
+        """
+        self.profiler = profiler
+        for ds in self.dsList:
+            ds.profiler = profiler
+        self.tracing = self.eventLog is not None or self.profiler is not None
+
+    def BeginSpan(self, name):
+        """
+        开始一个计时区间（只在tracing为True时调用）
+        :param name: 性能分析器中的区间名称
+        :return: 计时起点
+        """
+        if self.profiler is not None:
+            self.profiler.Begin(name)
+        return EventLog.EventLog.Now()
+
+    def EndSpan(self, name, begin, **fields):
+        """
+        结束一个计时区间，计入性能分析器并写入事件日志
+        :param name: 事件日志中的区间名称
+        :param begin: BeginSpan返回的计时起点
+        :param fields: 事件日志中区间的字段
+        :return:
+        """
+        if self.profiler is not None:
+            self.profiler.End()
+        if self.eventLog is not None:
+            self.eventLog.Span(name, begin, date = self.crtDate, **fields)
+
+    def Notify(self, phase, rcvList):
+        """
+        依次调用事件接收者，tracing为True时记录每个接收者的耗时
+        :param phase: 阶段名称
+        :param rcvList: 事件接收者列表
+        :return:
+        """
+        if not self.tracing:
+            for rcv in rcvList:
+                rcv(self)
+            return
+        for rcv in rcvList:
+            name = EventLog.GetReceiverName(rcv)
+            begin = self.BeginSpan(name)
+            try:
+                rcv(self)
+            finally:
+                self.EndSpan('Receiver', begin, phase = phase, receiver = name)
+
+    def SetBacktest(self, backtest = True, logLevel = LOG_INFO, logPath = None):
+        """
+        设置回测模式：回测模式下FetchDate不再按日打开日志文件，日志缓存后批量写入backtestLogPath（默认为logfile/backtest.txt）
+        :param backtest: 是否为回测模式
+        :param logLevel: 日志级别
+        :param logPath: 回测模式的日志文件路径，为None时不改变
+        :return:
+        """
+        if self.backtest:
+            self.FlushLog()
+        if self.logFile is not None:
+            self.logFile.close()
+            self.logFile = None
+        self.backtest = backtest
+        self.logLevel = logLevel
+        self.logBuffer = []
+        if logPath is not None:
+            self.backtestLogPath = logPath
+
+    def Run(self, startDate, endDate):
+        """
+        以回测模式运行一个日期区间内的所有交易日（尚未进入回测模式时以默认的日志级别进入回测模式）
+        :param startDate: 起始日期（含），当前日期已经晚于此日期时从当前日期的下一个交易日开始
+        :param endDate: 截止日期（含）
+        :return: 运行的交易日数
+        """
+        if not self.backtest:
+            self.SetBacktest()
+        if self.crtDate < startDate - datetime.timedelta(days = 1):
+            self.crtDate = startDate - datetime.timedelta(days = 1)
+        dayNum = 0
+        try:
+            while True:
+                # 交易日历已覆盖截止日期时，超出交易日历即结束，不再访问数据库
+                if self.calendar is not None and self.calendar.Covers(endDate) and self.calendar.Next(self.crtDate) is None:
+                    break
+                lastDate = self.crtDate
+                if not self.FetchDate():
+                    break
+                if self.crtDate > endDate:
+                    self.crtDate = lastDate
+                    break
+                self.BeforeOpen()
+                self.Open()
+                self.Close()
+                self.AfterClose()
+                dayNum += 1
+        finally:
+            self.FlushLog()   # 出现异常时也写出缓存的日志，其中往往有说明异常原因的记录
+        return dayNum
+
     def FetchDate(self):
         """
         向前推进一个交易日
         :return:
         """
+        begin = self.BeginSpan('FetchDate') if self.tracing else None
+        ok = False
         try:
-            db = cx_Oracle.connect(self.dbStr)
-            cursor = db.cursor()
-            cursor.execute(self.cldSql.replace("{LAST_DATE}", self.crtDate.strftime("%Y-%m-%d")))
-            nextDate = cursor.fetchone()
-        except Exception as exc:
-            self.WriteLog(str(self.crtDate) + "," + "Fail to read next trade date in Market.FetchDate()," + str(exc))
-            return False
-        if len(nextDate) == 0 or nextDate is None or nextDate[0] is None:
-            self.WriteLog(str(self.crtDate) + "," + "An empty trade date is got in Market.FetchDate()")
-            return False
+            nextDate = self.calendar.Next(self.crtDate) if self.calendar is not None else None
+            if nextDate is None:  # 没有交易日历或超出交易日历的覆盖区间，从数据库读取
+                try:
+                    record = DbPool.Query(self.dbStr, self.cldSql.replace("{LAST_DATE}", self.crtDate.strftime("%Y-%m-%d")), fetchOne = True)
+                except Exception as exc:
+                    self.WriteLog(str(self.crtDate) + "," + "Fail to read next trade date in Market.FetchDate()," + str(exc), LOG_ERROR)
+                    return False
+                if record is None or len(record) == 0 or record[0] is None:
+                    self.WriteLog(str(self.crtDate) + "," + "An empty trade date is got in Market.FetchDate()", LOG_WARN)
+                    return False
+                nextDate = record[0]
+                if self.calendar is not None and self.calendar.Covers(self.crtDate):
+                    self.calendar.Append(nextDate)
+            if self.logLevel <= LOG_DEBUG:
+                self.WriteLog("Success to get next trade date in Market.FetchDate(): " + str(nextDate), LOG_DEBUG)
+            self.crtDate = nextDate
+            if not self.backtest:
+                if self.logFile is not None:
+                    self.logFile.close()
+                self.logFile = open(os.path.join('.', 'logfile', 'log' + str(self.crtDate.date()) + '.txt'), 'w')
+            # 只提前读取历史日期，当日及以后的数据可能尚未入库完毕，部分数据会被IsReady和GetData直接采用
+            if self.executor is not None and self.crtDate.date() < datetime.date.today():
+                self.Prefetch(self.crtDate)
+            ok = True
+            return True
+        finally:
+            if begin is not None:
+                self.EndSpan('FetchDate', begin, ok = ok)
+
+    def StartPrefetch(self, workers = None):
+        """
+        开启后台预读取：此后FetchDate得到新的（历史）交易日后即开始在后台线程中读取所有数据源当日的数据，
+        收盘后事件中所有数据源的数据并发读取，并在交易日历已知下一个交易日（且为历史日期）时提前读取下一个交易日的数据，
+        使数据库等待时间与策略计算相互重叠
+        :param workers: 线程数，为None时取数据源的个数
+        :return:
+        """
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(max_workers = workers if workers is not None else max(len(self.dsList), 1),
+                                                                  thread_name_prefix = 'Prefetch')
+
+    def StopPrefetch(self):
+        """
+        关闭后台预读取，等待正在进行的读取结束并丢弃其结果
+        :return:
+        """
+        if self.executor is None:
+            return
+        for ds in self.dsList:
+            if ds.pendingFuture is not None:
+                try:
+                    ds.pendingFuture.result()
+                except Exception:
+                    pass
+                ds.pendingDate = None
+                ds.pendingFuture = None
+        self.executor.shutdown(wait = True)
+        self.executor = None
+
+    def Prefetch(self, date):
+        """
+        在后台线程中并发读取所有数据源指定日期的数据
+        :param date: 日期
+        :return:
+        """
+        for ds in self.dsList:
+            ds.Prefetch(self.executor, date)
+
+    def SetCalendar(self, calendar):
+        """
+        设置交易日历，此后FetchDate优先从交易日历中获取下一个交易日，超出其覆盖区间时才访问数据库
+        :param calendar: Calendar.TradeCalendar对象
+        :return:
+        """
+        self.calendar = calendar
+
+    def LoadCalendar(self, cldRangeSql, beginDate, endDate, cachePath = None):
+        """
+        一次性加载交易日历并设置给此Market对象
+        :param cldRangeSql: 交易日区间sql，以{START_DATE}和{END_DATE}作为区间的起止日期
+        :param beginDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :param cachePath: 本地缓存文件路径，为None时不使用本地缓存
+        :return: 交易日历对象
+        """
+        calendar = Calendar.TradeCalendar()
+        if cachePath is None:
+            calendar.Load(self.dbStr, cldRangeSql, beginDate, endDate)
         else:
-            self.WriteLog("Success to get next trade date in Market.FetchDate(): " + str(nextDate[0]))
-            self.crtDate = nextDate[0]
-        if self.logFile is not None:
-            self.logFile.close()
-        self.logFile = open(os.path.join('.', 'logfile', 'log' + str(self.crtDate.date()) + '.txt'), 'w')
-        return True
+            calendar.LoadCached(self.dbStr, cldRangeSql, beginDate, endDate, cachePath)
+        self.SetCalendar(calendar)
+        return calendar
 
     def BeforeOpen(self):
-        # 所有数据源清空数据
-        for ds in self.dsList:
-            ds.ClearData()
-        # 触发开盘前事件
-        for rcv in self.beforeOpenRcvList:
-            rcv(self)
+        begin = self.BeginSpan('BeforeOpen') if self.tracing else None
+        try:
+            # 所有数据源清空数据
+            for ds in self.dsList:
+                ds.ClearData()
+            self.priceDict.clear()
+            # 触发开盘前事件
+            self.Notify('BeforeOpen', self.beforeOpenRcvList)
+        finally:
+            if begin is not None:
+                self.EndSpan('BeforeOpen', begin)
 
     def Open(self):
-        # 触发开盘事件
-        for rcv in self.openRcvList:
-            rcv(self)
+        begin = self.BeginSpan('Open') if self.tracing else None
+        try:
+            # 触发开盘事件
+            self.Notify('Open', self.openRcvList)
+        finally:
+            if begin is not None:
+                self.EndSpan('Open', begin)
 
     def Close(self):
-        # 触发收盘事件
-        for rcv in self.closeRcvList:
-            rcv(self)
+        begin = self.BeginSpan('Close') if self.tracing else None
+        try:
+            # 触发收盘事件
+            self.Notify('Close', self.closeRcvList)
+        finally:
+            if begin is not None:
+                self.EndSpan('Close', begin)
 
     def AfterClose(self):
-        # 每个数据源都获取新的数据
-        for ds in self.dsList:
-            ds.GetData(self.crtDate)
-        # 更新指数行情
-        if self.dsList[-1].label == 'INDEX' and self.dsList[-1].data[0] is not None:
-            self.bmList.append([self.crtDate, self.dsList[-1].data[0][2], self.dsList[-1].data[0][4]])
-        else:
-            self.bmList.append([self.crtDate, 1, 0])
-        # 触发收盘后事件
-        for rcv in self.afterCloseRcvList:
-            rcv(self)
-        # 通知所有账户
-        for act in self.actList:
-            act.NewDayHandler()
+        tracing = self.tracing
+        begin = self.BeginSpan('AfterClose') if tracing else None
+        try:
+            # 每个数据源都获取新的数据（开启预读取时各数据源并发读取）
+            if self.executor is not None:
+                self.Prefetch(self.crtDate)
+            for k, ds in enumerate(self.dsList):
+                dsBegin = self.BeginSpan('GetData[' + (str(ds.label) if ds.label is not None else 'ds' + str(k)) + ']') if tracing else None
+                try:
+                    ds.GetData(self.crtDate)
+                    if ds.history is not None:
+                        ds.AppendHistory()
+                finally:
+                    if dsBegin is not None:
+                        self.EndSpan('GetData', dsBegin, ds = k, label = ds.label)
+            self.priceDict.clear()
+            # 提前读取下一个交易日的数据，与之后的策略计算重叠（只读取历史日期，当日及以后的数据可能尚未入库）
+            if self.executor is not None and self.calendar is not None:
+                nextDate = self.calendar.Next(self.crtDate)
+                if nextDate is not None and nextDate.date() < datetime.date.today():
+                    self.Prefetch(nextDate)
+            # 更新指数行情
+            if self.dsList[-1].label == 'INDEX' and self.dsList[-1].data[0] is not None:
+                self.bmList.append([self.crtDate, self.dsList[-1].data[0][2], self.dsList[-1].data[0][4]])
+            else:
+                self.bmList.append([self.crtDate, 1, 0])
+            # 触发收盘后事件
+            self.Notify('AfterClose', self.afterCloseRcvList)
+            # 通知所有账户，持仓簿位于bookMatrix中的账户一次性批量估值；收盘复权价格向量只在需要时生成，
+            # 没有bookMatrix时由数组持仓账户在估值时通过GetPriceVector获取（当日共享），字典持仓账户仍逐个读取持仓股票的行情
+            valBegin = self.BeginSpan('UpdateVal') if tracing else None
+            try:
+                posValArr = self.bookMatrix.MarkToMarket(self.GetPriceVector(3)) if self.bookMatrix is not None else None
+                for act in self.actList:
+                    posVal = posValArr[act.bookRow] if posValArr is not None and act.bookRow is not None else None
+                    act.NewDayHandler(None, posVal)
+            finally:
+                if valBegin is not None:
+                    self.EndSpan('UpdateVal', valBegin, accounts = len(self.actList))
+        finally:
+            if begin is not None:
+                self.EndSpan('AfterClose', begin)
+
+    def GetPriceVector(self, col):
+        """
+        获取行情数据源某一列在当日的数值向量，同一日内所有账户共享同一个数组，只在第一次获取时从数据源读取
+        :param col: 行情数据源的列号
+        :return: 按股票序号排列的只读float64数组，无效值为nan
+        """
+        vec = self.priceDict.get(col)
+        if vec is None:
+            vec = self.dsList[0].GetColumn(col)
+            vec.setflags(write = False)
+            self.priceDict[col] = vec
+        return vec
 
-    def CreateDataSource(self, connStr, sql, codeList, csMap, fieldNum, label = None):
+    def SetBatchVal(self, maxAccountNum):
+        """
+        开启批量估值：此后创建的数组持仓账户（arrayBook为True）的持仓簿均位于同一个矩阵中，收盘后一次性计算所有账户的持仓市值，
+        需要在创建行情数据源之后、创建账户之前调用
+        :param maxAccountNum: 最大账户数
+        :return:
+        """
+        self.bookMatrix = Account.BookMatrix(maxAccountNum, self.dsList[0].codeCount)
+
+    def CreateDataSource(self, connStr, sql, codeList, csMap, fieldNum, label = None, columnar = False, rangeSql = None, history = 0, backend = None):
         """
         创建一个数据源
         :param connStr: 数据源的数据库链接
         :param sql: 数据源的查询语句
         :param codeList: 代码列表
+        :param columnar: 是否采用列式存储
+        :param rangeSql: 按日期区间查询的sql语句，用于预加载
+        :param history: 保留的历史数据天数，为0时不保留
+        :param backend: 数据源后端（Backend.Backend对象），为None时使用内置的数据库或文本读取逻辑
         :return """
-        ds = DataSource(connStr, sql, codeList, csMap, fieldNum, label)
+        ds = DataSource(connStr, sql, codeList, csMap, fieldNum, label, columnar, rangeSql)
+        ds.profiler = self.profiler
+        ds.backend = backend
+        if history > 0:
+            ds.KeepHistory(history)
         self.dsList.append(ds)
 
-    def CreateAccount(self, actId, cap, csMap = None):
+    def SetCache(self, cache):
+        """
+        为所有数据库数据源（未设置后端的）设置本地磁盘缓存
+        :param cache: DataCache.DataCache对象，为None时取消缓存
+        :return:
+        """
+        for ds in self.dsList:
+            if ds.sql is not None and ds.backend is None:
+                ds.cache = cache
+
+    def Preload(self, startDate, endDate, chunkDays = 366):
+        """
+        为所有指定了rangeSql且未设置后端的数据源预加载一个日期区间的数据
+        :param startDate: 起始日期（含）
+        :param endDate: 截止日期（含）
+        :param chunkDays: 每次查询覆盖的自然日天数
+        :return:
+        """
+        for ds in self.dsList:
+            if ds.sql is not None and ds.rangeSql is not None and ds.backend is None:
+                count = ds.Preload(startDate, endDate, chunkDays)
+                self.WriteLog('Preload ' + str(ds.label) + ' from ' + str(startDate) + ' to ' + str(endDate) + ': ' + str(count) + ' records')
+
+    def CreateAccount(self, actId, cap, csMap = None, arrayBook = False):
         """
         创建一个账户
         :param actId: 账户ID
         :param cap: 初始资金
         :param csMap: 编码代码映射对象
+        :param arrayBook: 是否以数组形式持仓（Account.ArrayAccount），需要在创建行情数据源之后调用
         :return:
         """
-        act = Account.Account(actId, cap, self, csMap)
+        if arrayBook:
+            act = Account.ArrayAccount(actId, cap, self, csMap)
+        else:
+            act = Account.Account(actId, cap, self, csMap)
         self.actList.append(act)
         return act
 
@@ -0,0 +1,257 @@
+import datetime
+import gongcq.DbPool as DbPool
+import numpy as np
+
+
+"""
+没有剔除日期（仍在指数中）的区间所用的剔除日序号"""
+MAX_DAY = datetime.date.max.toordinal() + 1
+
+
+def ToDay(date):
+    """
+    将日期转换为日序号（公历序数），用于区间比较
+    :param date: datetime.datetime、datetime.date或'%Y-%m-%d'格式的字符串，为None时返回MAX_DAY
+    :return: int
+    """
+    if date is None:
+        return MAX_DAY
+    if isinstance(date, str):
+        date = datetime.datetime.strptime(date[: 10], '%Y-%m-%d')
+    return date.toordinal()
+
+
+class Membership:
+    """
+    指数成分股的时点索引：一次性加载所有成分股的纳入、剔除区间（区间含纳入日、不含剔除日，与Tools.sqlScale的条件一致），
+    以有序数组存放，此后任意日期的成分股查询都不再访问数据库，以代替每日执行一次sqlScale；
+    需要按日、按股票频繁查询时，用Compile生成与数据源的seq对齐的MembershipTable"""
+    """
+    各指数的区间，key为指数，value为按纳入日排序的(股票编码数组, 纳入日序号数组, 剔除日序号数组)"""
+    intervalDict = None
+
+    def __init__(self, intervalList = None):
+        """
+        构造一个成分股索引
+        :param intervalList: (指数, 股票编码, 纳入日期, 剔除日期)的list，剔除日期为None表示仍在指数中，可以为None
+        """
+        self.intervalDict = dict()
+        if intervalList is not None:
+            self.SetIntervals(intervalList)
+
+    def SetIntervals(self, intervalList):
+        """
+        设置成分股区间，替换已有的区间
+        :param intervalList: (指数, 股票编码, 纳入日期, 剔除日期)的list
+        :return: 区间数
+        """
+        groupDict = dict()
+        for index, code, inDate, outDate in intervalList:
+            if code is None or inDate is None:
+                continue
+            groupDict.setdefault(index, []).append((int(code), ToDay(inDate), ToDay(outDate)))
+        self.intervalDict = dict()
+        for index, group in groupDict.items():
+            arr = np.array(group, dtype = np.int64).reshape(len(group), 3)
+            arr = arr[np.argsort(arr[:, 1], kind = 'stable')]
+            self.intervalDict[index] = (arr[:, 0].copy(), arr[:, 1].copy(), arr[:, 2].copy())
+        return sum(len(group) for group in groupDict.values())
+
+    def Load(self, connStr, sql = None, indexMap = None):
+        """
+        从数据库中一次性加载成分股区间
+        :param connStr: 数据库连接字符串
+        :param sql: 区间sql，结果集为(股票编码, 指数, 纳入日期, 剔除日期)，为None时使用Tools.sqlScaleInterval
+        :param indexMap: 将结果集中的指数映射为索引中的指数的dict，不在其中的记录被忽略；
+                         为None且sql为None时将Tools.scaleIndList中的IND_ID映射为规模序号0 ~ 3（与Tools.GetScaleStockCode相同），否则不映射
+        :return: 区间数
+        """
+        if sql is None:
+            import gongcq.Tools as Tools
+            sql = Tools.sqlScaleInterval
+            if indexMap is None:
+                indexMap = {indId: scale for scale, indId in enumerate(Tools.scaleIndList)}
+        recordSet = DbPool.Query(connStr, sql)
+        intervalList = []
+        for record in recordSet:
+            if record is None:
+                continue
+            index = record[1] if indexMap is None else indexMap.get(record[1])
+            if index is not None:
+                intervalList.append((index, record[0], record[2], record[3]))
+        return self.SetIntervals(intervalList)
+
+    def GetIndexList(self):
+        """
+        获取索引中的所有指数
+        :return: list
+        """
+        return list(self.intervalDict.keys())
+
+    def GetMembers(self, index, date):
+        """
+        获取某一日指数的成分股（不与数据源对齐，逐个区间判断）
+        :param index: 指数
+        :param date: 日期
+        :return: 排序后的股票编码数组（int64）
+        """
+        item = self.intervalDict.get(index)
+        if item is None:
+            return np.zeros([0], dtype = np.int64)
+        codes, inDays, outDays = item
+        day = ToDay(date)
+        end = np.searchsorted(inDays, day, 'right')   # 纳入日晚于date的区间不需要判断
+        return np.unique(codes[: end][outDays[: end] > day])
+
+    def GetScaleStockCode(self, date):
+        """
+        获取某一日各规模指数的成分股，结果格式与Tools.GetScaleStockCode相同，要求以默认参数Load
+        :param date: 日期
+        :return: 4个股票编码list组成的list
+        """
+        return [self.GetMembers(scale, date).tolist() for scale in range(4)]
+
+    def Compile(self, ds, snapStep = 64):
+        """
+        生成与数据源的seq对齐的成分股表
+        :param ds: 数据源对象（只使用其codeList），不在codeList中的股票被忽略
+        :param snapStep: 每隔多少个变动日保存一次全部股票的状态，越小则随机日期查询越快、占用内存越多
+        :return: MembershipTable对象
+        """
+        return MembershipTable(self, ds, snapStep)
+
+
+class MembershipTable:
+    """
+    与数据源的seq对齐的成分股表：每个指数的区间被展开为按日期排序的变动（纳入+1、剔除-1），每隔snapStep个变动日保存一次各股票的状态，
+    查询某一日时先二分查找变动日，再从当前状态（按时间顺序逐日查询时只差一两个变动日）或最近的状态快照补上其间的变动，
+    因此单次查询的代价为O(log n)加上至多snapStep个变动日的变动数，与区间总数无关"""
+    """
+    股票数量，即数据源的codeCount"""
+    codeCount = 0
+    """
+    股票编码数组，下标为股票序号"""
+    codeArr = None
+    """
+    保存状态快照的间隔（变动日数）"""
+    snapStep = 64
+    """
+    各指数的变动表，key为指数，value为(变动日序号数组, 各变动日的变动在变动数组中的起始位置（长度多1）, 变动的股票序号数组, 变动值数组, 状态快照数组)，
+    状态快照的shape为(快照数, codeCount)，第j个快照为前j * snapStep个变动日的变动累加后的状态"""
+    eventDict = None
+    """
+    各指数的当前状态，key为指数，value为[已累加的变动日数, shape为(codeCount,)的成分计数数组]"""
+    cursorDict = None
+
+    def __init__(self, membership, ds, snapStep = 64):
+        """
+        构造一个成分股表
+        :param membership: Membership对象
+        :param ds: 数据源对象
+        :param snapStep: 保存状态快照的间隔（变动日数）
+        """
+        self.codeCount = ds.codeCount
+        self.codeArr = np.array(ds.codeList, dtype = np.int64)
+        self.snapStep = snapStep
+        self.eventDict = dict()
+        self.cursorDict = dict()
+        for index, (codes, inDays, outDays) in membership.intervalDict.items():
+            seqs = ds.GetSeqArray(codes)
+            keep = seqs >= 0
+            seqs = np.concatenate([seqs[keep], seqs[keep]])
+            days = np.concatenate([inDays[keep], outDays[keep]])
+            deltas = np.concatenate([np.ones([keep.sum()], dtype = np.int32), np.full([keep.sum()], -1, dtype = np.int32)])
+            order = np.argsort(days, kind = 'stable')
+            days, seqs, deltas = days[order], seqs[order], deltas[order]
+            eventDays, eventPos = np.unique(days, return_index = True)
+            eventPos = np.append(eventPos, len(days))
+            counts = np.zeros([self.codeCount], dtype = np.int32)
+            snapList = []
+            for j in range(0, len(eventDays), snapStep):
+                snapList.append(counts.copy())
+                end = eventPos[min(j + snapStep, len(eventDays))]
+                np.add.at(counts, seqs[eventPos[j] : end], deltas[eventPos[j] : end])
+            snaps = np.array(snapList, dtype = np.int32).reshape(len(snapList), self.codeCount)
+            self.eventDict[index] = (eventDays, eventPos, seqs, deltas, snaps)
+            self.cursorDict[index] = [0, np.zeros([self.codeCount], dtype = np.int32)]
+
+    def MoveTo(self, index, date):
+        """
+        将指数的当前状态移动到指定日期
+        :param index: 指数
+        :param date: 日期
+        :return: 当前状态的成分计数数组（内部数组，不应修改），指数不存在时返回None
+        """
+        item = self.eventDict.get(index)
+        if item is None:
+            return None
+        eventDays, eventPos, seqs, deltas, snaps = item
+        cursor = self.cursorDict[index]
+        k = int(np.searchsorted(eventDays, ToDay(date), 'right'))
+        pos, counts = cursor
+        if k == pos:
+            return counts
+        if abs(k - pos) > self.snapStep:
+            base = min(k // self.snapStep, len(snaps) - 1)
+            counts[:] = snaps[base]
+            pos = base * self.snapStep
+        if k > pos:
+            np.add.at(counts, seqs[eventPos[pos] : eventPos[k]], deltas[eventPos[pos] : eventPos[k]])
+        elif k < pos:
+            np.subtract.at(counts, seqs[eventPos[k] : eventPos[pos]], deltas[eventPos[k] : eventPos[pos]])
+        cursor[0] = k
+        return counts
+
+    def GetMask(self, index, date):
+        """
+        获取某一日指数成分股的掩码
+        :param index: 指数
+        :param date: 日期
+        :return: shape为(codeCount,)的bool数组，与数据源的seq对齐，指数不存在时全为False
+        """
+        counts = self.MoveTo(index, date)
+        if counts is None:
+            return np.zeros([self.codeCount], dtype = bool)
+        return counts > 0
+
+    def IsMember(self, index, date, seq):
+        """
+        判断某只股票某一日是否为指数的成分股，按日期顺序逐日、逐股票查询时只在换日时补上当日的变动
+        :param index: 指数
+        :param date: 日期
+        :param seq: 股票序号
+        :return: bool
+        """
+        counts = self.MoveTo(index, date)
+        return counts is not None and 0 <= seq < self.codeCount and bool(counts[seq] > 0)
+
+    def GetDiff(self, index, prevDate, date):
+        """
+        获取两个日期之间指数成分股的变化，只检查其间有变动的股票
+        :param index: 指数
+        :param prevDate: 前一日期
+        :param date: 后一日期
+        :return: (纳入的股票序号数组, 剔除的股票序号数组)，均为排序后的int64数组
+        """
+        item = self.eventDict.get(index)
+        empty = np.zeros([0], dtype = np.int64)
+        if item is None:
+            return empty, empty
+        eventDays, eventPos, seqs = item[0], item[1], item[2]
+        k0 = int(np.searchsorted(eventDays, ToDay(prevDate), 'right'))
+        k1 = int(np.searchsorted(eventDays, ToDay(date), 'right'))
+        if k0 == k1:
+            return empty, empty
+        touched = np.unique(seqs[eventPos[min(k0, k1)] : eventPos[max(k0, k1)]])
+        before = self.MoveTo(index, prevDate)[touched] > 0
+        after = self.MoveTo(index, date)[touched] > 0
+        return touched[after & ~before], touched[before & ~after]
+
+    def GetCodes(self, index, date):
+        """
+        获取某一日指数成分股中属于数据源codeList的股票编码
+        :param index: 指数
+        :param date: 日期
+        :return: 股票编码数组（按股票序号排列）
+        """
+        return self.codeArr[self.GetMask(index, date)]
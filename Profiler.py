@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import tracemalloc
+
+
+class Profiler:
+    """
+    分阶段的性能分析器：以嵌套区间（栈）的方式记录各阶段、各数据源和各事件接收者的墙钟时间、CPU时间（当前线程）和内存块数变化，
+    按调用路径汇总，运行结束后可以输出汇总表（Summary/Report）和火焰图所用的折叠栈格式（WriteFoldedStack，
+    可直接用于flamegraph.pl、speedscope等工具）。
+    内存块数变化为sys.getallocatedblocks()之差，即区间内净新增的存活内存块数；traceMalloc为True时还统计tracemalloc记录的净分配字节数（会明显降低运行速度）"""
+    """
+    区间栈，每个元素为[名称, 开始墙钟时间, 开始CPU时间, 开始内存块数, 开始分配字节数, 子区间墙钟时间, 子区间CPU时间]"""
+    stack = None
+    """
+    按调用路径汇总的统计，key为区间名称的tuple，value为[次数, 墙钟时间, CPU时间, 内存块数变化, 分配字节数变化, 自身墙钟时间, 自身CPU时间]，时间单位为纳秒"""
+    stat = None
+    """
+    是否使用tracemalloc统计分配字节数"""
+    traceMalloc = False
+
+    def __init__(self, traceMalloc = False):
+        """
+        构造一个性能分析器
+        :param traceMalloc: 是否使用tracemalloc统计分配字节数（未启动tracemalloc时自动启动）
+        """
+        self.stack = []
+        self.stat = dict()
+        self.traceMalloc = traceMalloc
+        if traceMalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def Begin(self, name):
+        """
+        开始一个区间，须与End成对调用
+        :param name: 区间名称
+        :return:
+        """
+        self.stack.append([name, time.perf_counter_ns(), time.thread_time_ns(), sys.getallocatedblocks(),
+                           tracemalloc.get_traced_memory()[0] if self.traceMalloc else 0, 0, 0])
+
+    def End(self):
+        """
+        结束最近开始的区间，并计入以当前调用路径为key的统计
+        :return:
+        """
+        wall = time.perf_counter_ns()
+        cpu = time.thread_time_ns()
+        blocks = sys.getallocatedblocks()
+        mem = tracemalloc.get_traced_memory()[0] if self.traceMalloc else 0
+        frame = self.stack.pop()
+        wall -= frame[1]
+        cpu -= frame[2]
+        path = tuple(f[0] for f in self.stack) + (frame[0],)
+        item = self.stat.get(path)
+        if item is None:
+            item = [0, 0, 0, 0, 0, 0, 0]
+            self.stat[path] = item
+        item[0] += 1
+        item[1] += wall
+        item[2] += cpu
+        item[3] += blocks - frame[3]
+        item[4] += mem - frame[4]
+        item[5] += wall - frame[5]
+        item[6] += cpu - frame[6]
+        if len(self.stack) > 0:
+            self.stack[-1][5] += wall
+            self.stack[-1][6] += cpu
+
+    def Trace(self, name):
+        """
+        用于with语句的区间，例如：with profiler.Trace('Rebalance'): ...
+        :param name: 区间名称
+        :return: 上下文管理器
+        """
+        return ProfileContext(self, name)
+
+    def Reset(self):
+        """
+        清空已有的统计
+        :return:
+        """
+        self.stack = []
+        self.stat = dict()
+
+    def Summary(self, byName = False):
+        """
+        生成汇总表
+        :param byName: 为True时按区间名称（而不是调用路径）汇总，同名区间的总时间只计算最外层的区间
+        :return: pandas.DataFrame类型的汇总表，按墙钟时间降序排列，时间单位为毫秒
+        """
+        import pandas as pd
+        rowList = []
+        if byName:
+            merged = dict()
+            for path, item in self.stat.items():
+                name = path[-1]
+                row = merged.get(name)
+                if row is None:
+                    row = [0, 0, 0, 0, 0, 0, 0]
+                    merged[name] = row
+                nested = name in path[: -1]   # 递归嵌套的同名区间不重复计入总时间
+                for i in range(7):
+                    if not nested or i >= 5:
+                        row[i] += item[i]
+            items = [(name, row) for name, row in merged.items()]
+        else:
+            items = [(';'.join(path), item) for path, item in self.stat.items()]
+        for name, item in items:
+            rowList.append({'name': name, 'count': item[0], 'wall': item[1] / 1e6, 'cpu': item[2] / 1e6,
+                            'selfWall': item[5] / 1e6, 'selfCpu': item[6] / 1e6, 'wallPerCall': item[1] / 1e6 / max(item[0], 1),
+                            'blocks': item[3], 'bytes': item[4] if self.traceMalloc else None})
+        frame = pd.DataFrame(rowList, columns = ['name', 'count', 'wall', 'cpu', 'selfWall', 'selfCpu', 'wallPerCall', 'blocks', 'bytes'])
+        return frame.sort_values('wall', ascending = False).reset_index(drop = True)
+
+    def Report(self, byName = False, top = None):
+        """
+        生成文本格式的汇总表
+        :param byName: 是否按区间名称汇总
+        :param top: 只输出墙钟时间最长的前top行，为None时输出全部
+        :return: str
+        """
+        frame = self.Summary(byName)
+        if top is not None:
+            frame = frame.head(top)
+        return frame.to_string(index = False, float_format = lambda v: '%.3f' % v)
+
+    def WriteFoldedStack(self, path, cpu = False):
+        """
+        以折叠栈格式（每行为“以分号分隔的调用路径 自身时间”）写入火焰图数据，时间单位为微秒
+        :param path: 文件路径
+        :param cpu: 为True时使用CPU时间，否则使用墙钟时间
+        :return:
+        """
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok = True)
+        file = open(path, 'w', encoding = 'utf-8')
+        for stackPath, item in self.stat.items():
+            value = (item[6] if cpu else item[5]) // 1000
+            if value > 0:
+                file.write(';'.join(name.replace(';', ',').replace(' ', '_') for name in stackPath) + ' ' + str(value) + '\n')
+        file.close()
+
+
+class ProfileContext:
+    """Profiler.Trace返回的上下文管理器"""
+    __slots__ = ('profiler', 'name')
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.Begin(self.name)
+        return self
+
+    def __exit__(self, excType, excValue, tb):
+        self.profiler.End()
+        return False
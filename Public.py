@@ -1,12 +1,31 @@
 import os
 import datetime as dt
 import fileinput
+import gongcq.EventLog as EventLog
 
-def WriteLog(logStr):
-    file = open(os.path.join('.', 'log', 'log' + str(dt.datetime.now().date()) + '.txt'), 'a')
-    file.write(str(dt.datetime.now()) + '  ' + logStr + '\n\r\n')
-    file.flush()
-    file.close()
+# 结构化事件日志（EventLog.EventLog对象），设置后WriteLog写入事件日志
+eventLog = None
+# 当前日志文件及其日期，日期变化时才重新打开
+logFile = None
+logDate = None
+
+def SetEventLog(log):
+    global eventLog
+    eventLog = log
+
+def WriteLog(logStr, level = EventLog.LOG_INFO):
+    global logFile, logDate
+    if eventLog is not None:
+        eventLog.Event('Log', level, msg = logStr)
+        return
+    now = dt.datetime.now()
+    if logFile is None or logDate != now.date():
+        if logFile is not None:
+            logFile.close()
+        logDate = now.date()
+        logFile = open(os.path.join('.', 'log', 'log' + str(logDate) + '.txt'), 'a')
+    logFile.write(str(now) + '  ' + logStr + '\n\r\n')
+    logFile.flush()
 
 def GetPara(path):
     paraDict = {}
@@ -0,0 +1,96 @@
+import concurrent.futures
+import gongcq.Analytics as Analytics
+import numpy as np
+import os
+
+
+def GetChartData(netValList, excEar = None, tickStep = 60):
+    """
+    生成账户净值图所需的数据（不依赖matplotlib，可以只输出数据而不绘图）
+    :param netValList: Account.netValList
+    :param excEar: 超额收益曲线，为None时由Analytics.GetExcessCurve计算
+    :param tickStep: 横轴刻度的间隔（交易日数）
+    :return: dict类型：x横轴，bmEar基准净值，stgEar策略净值，excEar超额收益，xTickList刻度位置，xLabelList刻度标签
+    """
+    dates, bm, bmRise, netVal, rise = Analytics.GetNetValArray(netValList)
+    if excEar is None:
+        excEar = Analytics.GetExcessCurve(netVal, bm)
+    xTickList = list(range(0, len(dates), tickStep))
+    return {'x': np.arange(len(dates)), 'bmEar': bm / bm[0], 'stgEar': netVal / netVal[0], 'excEar': excEar,
+            'xTickList': xTickList, 'xLabelList': [dates[i].strftime('%Y%m%d') for i in xTickList]}
+
+
+def DrawChart(ax, data):
+    """
+    在指定的坐标轴上绘制账户净值图
+    :param ax: matplotlib的Axes对象
+    :param data: GetChartData生成的数据
+    :return:
+    """
+    ax.plot(data['x'], data['bmEar'], label = "Benchmark", color = "black")
+    ax.plot(data['x'], data['stgEar'], label = "Strategy", color = "blue")
+    ax.plot(data['x'], data['excEar'], label = "Excess", color = "red")
+    ax.set_xticks(data['xTickList'])
+    ax.set_xticklabels(data['xLabelList'], rotation = 90)
+    ax.legend(loc = 'upper left')
+
+
+def RenderChart(data, filePath):
+    """
+    以非交互的Agg后端将账户净值图保存为图片：使用独立的Figure对象而不是pyplot的全局状态，因此可以在多个线程或进程中同时绘制；
+    matplotlib在第一次绘图时才被导入
+    :param data: GetChartData生成的数据
+    :param filePath: 图片文件路径
+    :return: 图片文件路径
+    """
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    fig = Figure()
+    FigureCanvasAgg(fig)
+    DrawChart(fig.add_subplot(), data)
+    fig.savefig(filePath)
+    return filePath
+
+
+def ShowChart(data):
+    """
+    在交互窗口中显示账户净值图
+    :param data: GetChartData生成的数据
+    :return:
+    """
+    import matplotlib.pyplot as mp
+    fig = mp.figure()
+    DrawChart(fig.add_subplot(), data)
+    mp.show()
+
+
+def RenderCharts(jobList, workers = None):
+    """
+    批量绘制账户净值图
+    :param jobList: (GetChartData生成的数据, 图片文件路径)的list
+    :param workers: 进程数，为None时取CPU核数，为0或只有一张图时在当前进程中依次绘制
+    :return: 图片文件路径的list
+    """
+    if workers == 0 or len(jobList) <= 1:
+        return [RenderChart(data, filePath) for data, filePath in jobList]
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        futureList = [executor.submit(RenderChart, data, filePath) for data, filePath in jobList]
+        return [future.result() for future in futureList]
+
+
+def EvalAccounts(actList, path, labelList = None, render = True, workers = None):
+    """
+    批量评估多个账户：先依次写出各账户的统计指标、交易记录和净值文件，再批量绘制净值图
+    :param actList: 账户list
+    :param path: 评估文件的保存路径
+    :param labelList: 各账户的标签list，为None时取账户ID
+    :param render: 是否绘图，为False时只输出数据文件
+    :param workers: 绘图的进程数，见RenderCharts
+    :return: 各账户净值图数据的list（没有数据的账户为None）
+    """
+    if labelList is None:
+        labelList = [str(act.accountID) for act in actList]
+    dataList = [act.EvalAccount(path, label, render = False) for act, label in zip(actList, labelList)]
+    if render:
+        RenderCharts([(data, os.path.join(path, 'figure ' + label + '.png')) for data, label in zip(dataList, labelList) if data is not None], workers)
+    return dataList
@@ -0,0 +1,177 @@
+import datetime
+import gongcq.Market as Market
+import threading
+
+
+class Scheduler:
+    """
+    实盘调度器，按交易日历和各阶段的时间依次触发Market的开盘前、开盘、收盘和收盘后事件：
+    FetchDate得到下一个交易日后，等待至该日各阶段的时间点再触发相应事件（已经过去的时间点立即触发，即追赶历史交易日），
+    收盘后事件在到达其时间点后还要等待数据就绪，数据就绪即触发，而不是固定间隔轮询；
+    等待使用threading.Event，可以随时通过Stop从其他线程中止"""
+    """
+    Market对象"""
+    mkt = None
+    """
+    各阶段相对于交易日0点的时间，key为'BeforeOpen'、'Open'、'Close'、'AfterClose'，value为datetime.timedelta对象，
+    其中'AfterClose'为开始检查数据是否就绪的时间"""
+    phaseTime = None
+    """
+    数据就绪的截止时间（相对于交易日0点），超过此时间数据仍未就绪时记录日志并以已有的数据触发收盘后事件"""
+    dataDeadline = None
+    """
+    检查数据库数据源是否就绪的间隔（秒）"""
+    pollInterval = 30
+    """
+    检查文本数据源的文件是否存在的间隔（秒）"""
+    filePollInterval = 1
+    """
+    需要等待就绪的数据源下标list，为None时只等待行情数据源（dsList[0]）；
+    只有具备就绪判断（见DataSource.HasReadyCheck，数据库数据源须指定readySql）的数据源才会被等待"""
+    readyList = None
+    """
+    FetchDate失败（没有下一个交易日）时，是否等待pollInterval秒后重试，为False时结束运行"""
+    keepAlive = False
+    """
+    每日收盘后事件结束后调用的函数列表，此类函数接受一个Market对象作为输入（例如保存检查点）"""
+    dayHandlerList = None
+    """
+    停止信号"""
+    stopEvent = None
+
+    def __init__(self, mkt, phaseTime = None, dataDeadline = datetime.timedelta(hours = 23, minutes = 59), pollInterval = 30,
+                 filePollInterval = 1, readyList = None, keepAlive = False):
+        """
+        构造一个调度器
+        :param mkt: Market对象
+        :param phaseTime: 各阶段的时间dict，未指定的阶段取默认值（9:00、9:30、15:00、16:30）
+        :param dataDeadline: 数据就绪的截止时间
+        :param pollInterval: 检查数据库数据源是否就绪的间隔（秒）
+        :param filePollInterval: 检查文本数据源的文件是否存在的间隔（秒）
+        :param readyList: 需要等待就绪的数据源下标list，为None时只等待行情数据源
+        :param keepAlive: FetchDate失败时是否继续等待
+        """
+        self.mkt = mkt
+        self.phaseTime = {'BeforeOpen': datetime.timedelta(hours = 9),
+                          'Open': datetime.timedelta(hours = 9, minutes = 30),
+                          'Close': datetime.timedelta(hours = 15),
+                          'AfterClose': datetime.timedelta(hours = 16, minutes = 30)}
+        if phaseTime is not None:
+            self.phaseTime.update(phaseTime)
+        self.dataDeadline = dataDeadline
+        self.pollInterval = pollInterval
+        self.filePollInterval = filePollInterval
+        self.readyList = readyList
+        self.keepAlive = keepAlive
+        self.dayHandlerList = []
+        self.stopEvent = threading.Event()
+
+    def AddDayHandler(self, handler):
+        """
+        添加每日收盘后事件结束后调用的函数
+        :param handler: 一个接受Market对象作为输入的函数
+        :return:
+        """
+        self.dayHandlerList.append(handler)
+
+    def Stop(self):
+        """
+        停止调度（可以在其他线程中调用），正在进行的等待会立即结束
+        :return:
+        """
+        self.stopEvent.set()
+
+    def WaitUntil(self, time):
+        """
+        等待至指定时间
+        :param time: datetime.datetime对象
+        :return: 是否正常到达指定时间（被停止时返回False）
+        """
+        while not self.stopEvent.is_set():
+            remain = (time - datetime.datetime.now()).total_seconds()
+            if remain <= 0:
+                return True
+            self.stopEvent.wait(min(remain, 3600))  # 分段等待，避免系统时间调整后等待过久
+        return False
+
+    def GetWaitList(self):
+        """
+        获取需要等待就绪的数据源：没有就绪判断的数据源不被等待（并记录日志），
+        否则当日合法地没有数据的数据源会一直等到截止时间，而读取到部分数据就视为就绪又会使用不完整的数据
+        :return: 数据源list
+        """
+        waitList = []
+        for k in ([0] if self.readyList is None else self.readyList):
+            ds = self.mkt.dsList[k]
+            if ds.HasReadyCheck():
+                waitList.append(ds)
+            else:
+                self.mkt.WriteLog('Data source ' + str(ds.label) + ' has no readySql or backend IsReady, not waited in Scheduler.WaitData()', Market.LOG_WARN)
+        return waitList
+
+    def WaitData(self, date):
+        """
+        等待指定日期的数据就绪，已就绪的数据源不再重复检查
+        :param date: 交易日
+        :return: 数据是否全部就绪（超过截止时间或被停止时返回False）
+        """
+        deadline = date + self.dataDeadline
+        waitList = self.GetWaitList()
+        while not self.stopEvent.is_set():
+            notReady = []
+            for ds in waitList:
+                try:
+                    ready = ds.IsReady(date)
+                except Exception as exc:
+                    self.mkt.WriteLog('Fail to check data source ' + str(ds.label) + ' in Scheduler.WaitData(),' + str(exc), Market.LOG_ERROR)
+                    ready = False
+                if not ready:
+                    notReady.append(ds)
+            waitList = notReady
+            if len(waitList) == 0:
+                return True
+            remain = (deadline - datetime.datetime.now()).total_seconds()
+            if remain <= 0:
+                return False
+            # 只剩文本数据源时按较短的间隔检查文件是否存在
+            interval = self.filePollInterval if all(ds.sql is None for ds in waitList) else self.pollInterval
+            self.stopEvent.wait(min(interval, remain))
+        return False
+
+    def RunDay(self):
+        """
+        运行当前交易日（mkt.crtDate）的各个阶段
+        :return: 是否完整运行（被停止时返回False）
+        """
+        mkt = self.mkt
+        date = mkt.crtDate
+        for name, phase in (('BeforeOpen', mkt.BeforeOpen), ('Open', mkt.Open), ('Close', mkt.Close)):
+            if not self.WaitUntil(date + self.phaseTime[name]):
+                return False
+            phase()
+        if not self.WaitUntil(date + self.phaseTime['AfterClose']):
+            return False
+        ready = self.WaitData(date)
+        if self.stopEvent.is_set():
+            return False
+        if not ready:
+            mkt.WriteLog(str(date) + ',' + 'Data is not ready before the deadline in Scheduler.RunDay()', Market.LOG_WARN)
+        mkt.WriteLog('Data ready, trigger AfterClose at ' + str(datetime.datetime.now()))
+        mkt.AfterClose()
+        for handler in self.dayHandlerList:
+            handler(mkt)
+        return True
+
+    def Run(self):
+        """
+        依次运行各个交易日，直至被停止或者没有下一个交易日（keepAlive为False时）
+        :return:
+        """
+        while not self.stopEvent.is_set():
+            if not self.mkt.FetchDate():
+                if not self.keepAlive:
+                    break
+                self.stopEvent.wait(self.pollInterval)
+                continue
+            if not self.RunDay():
+                break
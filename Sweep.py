@@ -0,0 +1,138 @@
+import concurrent.futures
+import datetime
+import gongcq.Calendar as Calendar
+import itertools
+import numpy as np
+import os
+import traceback
+
+
+def ParaGrid(paraDict):
+    """
+    由参数取值表生成参数组合
+    :param paraDict: dict类型，key为参数名，value为该参数所有取值的list
+    :return: 参数组合的list，每个元素为一个dict
+    """
+    names = list(paraDict.keys())
+    return [dict(zip(names, values)) for values in itertools.product(*[paraDict[name] for name in names])]
+
+
+def SaveMarketData(mkt, beginDate, endDate, path):
+    """
+    将Market对象中所有数据源在一个区间内的数据保存为面板文件（.npy），供多个进程以内存映射的方式共享读取。
+    数据按交易日依次通过各数据源的GetData读取，因此可以配合预加载和磁盘缓存使用
+    :param mkt: Market对象，其crtDate须早于beginDate
+    :param beginDate: 起始日期（含）
+    :param endDate: 截止日期（含）
+    :param path: 保存目录
+    :return: 交易日list
+    """
+    os.makedirs(path, exist_ok = True)
+    mkt.SetBacktest()
+    dateList = []
+    while mkt.FetchDate():
+        if mkt.crtDate > endDate:
+            break
+        if mkt.crtDate >= beginDate:
+            dateList.append(mkt.crtDate)
+    dateStrList = [date.strftime('%Y-%m-%d') for date in dateList]
+    for k, ds in enumerate(mkt.dsList):
+        values = np.lib.format.open_memmap(os.path.join(path, 'ds' + str(k) + ' values.npy'), mode = 'w+',
+                                           dtype = np.float64, shape = (len(dateList), ds.codeCount, ds.fieldNum))
+        valid = np.lib.format.open_memmap(os.path.join(path, 'ds' + str(k) + ' valid.npy'), mode = 'w+',
+                                          dtype = bool, shape = (len(dateList), ds.codeCount))
+        for i, date in enumerate(dateList):
+            ds.GetData(date)
+            values[i], valid[i] = ds.GetMatrix()
+        values.flush()
+        valid.flush()
+        del values, valid
+        ds.ClearData()
+    file = open(os.path.join(path, 'dates.txt'), 'w')
+    file.write('\n'.join(dateStrList))
+    file.close()
+    return dateList
+
+
+def LoadMarketData(mkt, path):
+    """
+    以内存映射的方式加载SaveMarketData保存的面板数据，并为Market对象设置相应的交易日历
+    :param mkt: Market对象，其数据源须与保存面板数据时的数据源一一对应
+    :param path: 面板数据目录
+    :return: 交易日list
+    """
+    file = open(os.path.join(path, 'dates.txt'), 'r')
+    dateStrList = file.read().split()
+    file.close()
+    for k, ds in enumerate(mkt.dsList):
+        values = np.load(os.path.join(path, 'ds' + str(k) + ' values.npy'), mmap_mode = 'r')
+        valid = np.load(os.path.join(path, 'ds' + str(k) + ' valid.npy'), mmap_mode = 'r')
+        if values.shape[1 :] != (ds.codeCount, ds.fieldNum):
+            raise Exception('面板数据与数据源不匹配：ds' + str(k) + '，' + str(ds.label))
+        ds.AttachPanel(dateStrList, values, valid)
+    dateList = [datetime.datetime.strptime(dateStr, '%Y-%m-%d') for dateStr in dateStrList]
+    mkt.SetCalendar(Calendar.TradeCalendar(dateList))
+    return dateList
+
+
+def RunOne(mktFactory, stgFactory, para, path, logPath = None):
+    """
+    运行一个参数组合的回测（在子进程中执行）
+    :param mktFactory: 无参数的函数，返回一个已创建数据源的Market对象
+    :param stgFactory: 接受(Market对象, 参数dict)的函数，创建账户并注册事件接收者，返回策略对象
+    :param para: 参数dict
+    :param path: 面板数据目录
+    :param logPath: 此参数组合的日志文件路径，为None时使用Market的默认回测日志文件
+    :return: 结果的list，每个账户对应一个dict
+    """
+    try:
+        mkt = mktFactory()
+        dateList = LoadMarketData(mkt, path)
+        if len(dateList) == 0:
+            return []
+        mkt.SetBacktest(logPath = logPath)   # 各参数组合写入各自的日志文件，避免多个进程的日志混杂
+        stgFactory(mkt, para)
+        mkt.Run(dateList[0], dateList[-1])
+        resultList = []
+        for act in mkt.actList:
+            result = dict(para)
+            result['accountID'] = act.accountID
+            result.update(act.GetStat())
+            result['netValList'] = act.netValList
+            result['logPath'] = logPath
+            result['error'] = None
+            resultList.append(result)
+        return resultList
+    except Exception:
+        result = dict(para)
+        result['logPath'] = logPath
+        result['error'] = traceback.format_exc()
+        return [result]
+
+
+def RunSweep(mktFactory, stgFactory, paraList, beginDate, endDate, path, workers = None, reuseData = False):
+    """
+    在多个进程中并行运行参数扫描。
+    主进程先将市场数据读取一次并保存为面板文件，各子进程以内存映射的方式共享读取，不再访问数据库
+    :param mktFactory: 无参数的函数（须可被pickle，即模块级函数），返回一个已创建数据源的Market对象，其crtDate须早于beginDate
+    :param stgFactory: 接受(Market对象, 参数dict)的函数（须可被pickle），创建账户并注册事件接收者
+    :param paraList: 参数dict的list，可以由ParaGrid生成
+    :param beginDate: 起始日期（含）
+    :param endDate: 截止日期（含）
+    :param path: 面板数据目录
+    :param workers: 进程数，为None时取CPU核数
+    :param reuseData: 面板数据目录中已有数据时是否直接使用
+    :return: pandas.DataFrame类型的结果表，每行对应一个参数组合下的一个账户，logPath列为该参数组合的日志文件（面板数据目录下的log目录中）
+    """
+    if not (reuseData and os.path.exists(os.path.join(path, 'dates.txt'))):
+        SaveMarketData(mktFactory(), beginDate, endDate, path)
+    import pandas as pd   # 子进程只导入本模块中的RunOne，不需要pandas
+    resultList = []
+    logDir = os.path.join(path, 'log')
+    os.makedirs(logDir, exist_ok = True)
+    with concurrent.futures.ProcessPoolExecutor(max_workers = workers) as executor:
+        futureList = [executor.submit(RunOne, mktFactory, stgFactory, para, path, os.path.join(logDir, 'run ' + str(i) + '.txt'))
+                      for i, para in enumerate(paraList)]
+        for future in futureList:
+            resultList.extend(future.result())
+    return pd.DataFrame(resultList)
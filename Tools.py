@@ -1,5 +1,5 @@
 # Some tools in common use
-import cx_Oracle as co
+import gongcq.DbPool as DbPool
 import datetime as dt
 
 # 0.日期 1.编码 2.收盘价 3.收盘价复权 4.涨跌幅复权 5.开盘价 6.开盘价复权 7.总市值 8.流通市值 9.成交量 10.成交额 11.换手率
@@ -7,15 +7,38 @@ sqlPrc = "SELECT TRADE_DATE, STK_UNI_CODE, CLOSE_PRICE, CLOSE_PRICE_RE, RISE_DRO
          "FROM UPCENTER.STK_BASIC_PRICE_MID " \
          "WHERE ISVALID = 1 AND TRADE_VOL > 0 AND TRADE_DATE = TO_DATE('{TRADE_DATE}', 'YYYY-MM-DD') "
 numPrc = 12
+# 行情数据的就绪判断（DataSource.readySql）：当日有效记录数达到前一交易日的95%时视为已完整入库
+sqlPrcReady = "SELECT CASE WHEN COUNT(*) >= 0.95 * (SELECT COUNT(*) FROM UPCENTER.STK_BASIC_PRICE_MID " \
+              "                                     WHERE ISVALID = 1 AND TRADE_VOL > 0 AND TRADE_DATE = " \
+              "                                           (SELECT MAX(TRADE_DATE) FROM UPCENTER.STK_BASIC_PRICE_MID " \
+              "                                            WHERE TRADE_DATE < TO_DATE('{TRADE_DATE}', 'YYYY-MM-DD'))) " \
+              "            AND COUNT(*) > 0 THEN 1 ELSE 0 END " \
+              "FROM UPCENTER.STK_BASIC_PRICE_MID " \
+              "WHERE ISVALID = 1 AND TRADE_VOL > 0 AND TRADE_DATE = TO_DATE('{TRADE_DATE}', 'YYYY-MM-DD') "
+sqlPrcRange = "SELECT TRADE_DATE, STK_UNI_CODE, CLOSE_PRICE, CLOSE_PRICE_RE, RISE_DROP_RANGE_RE / 100, OPEN_PRICE, OPEN_PRICE_RE, STK_TOT_VALUE, STK_CIR_VALUE, TRADE_VOL, TRADE_AMUT, TURNOVER_RATE " \
+              "FROM UPCENTER.STK_BASIC_PRICE_MID " \
+              "WHERE ISVALID = 1 AND TRADE_VOL > 0 AND " \
+              "      TRADE_DATE BETWEEN TO_DATE('{START_DATE}', 'YYYY-MM-DD') AND TO_DATE('{END_DATE}', 'YYYY-MM-DD') " \
+              "ORDER BY TRADE_DATE "
 sqlBm = "SELECT TRADE_DATE, IND_UNI_CODE, CLOSE_PRICE, OPEN_PRICE, CHAN_RATE / 100 " \
         "FROM UPCENTER.IND_BASIC_MQ " \
         "WHERE ISVALID = 1 AND TRADE_DATE = TO_DATE('{TRADE_DATE}', 'YYYY-MM-DD') AND IND_UNI_CODE = 2060002293 "
 numBm = 5
+sqlBmRange = "SELECT TRADE_DATE, IND_UNI_CODE, CLOSE_PRICE, OPEN_PRICE, CHAN_RATE / 100 " \
+             "FROM UPCENTER.IND_BASIC_MQ " \
+             "WHERE ISVALID = 1 AND IND_UNI_CODE = 2060002293 AND " \
+             "      TRADE_DATE BETWEEN TO_DATE('{START_DATE}', 'YYYY-MM-DD') AND TO_DATE('{END_DATE}', 'YYYY-MM-DD') " \
+             "ORDER BY TRADE_DATE "
 sqlCld = "SELECT MIN(C.END_DATE) " \
          "FROM UPCENTER.PUB_EXCH_CALE C " \
          "WHERE C.IS_TRADE_DATE = 1 AND C.SEC_MAR_PAR = 1 AND " \
          "      C.END_DATE > TO_DATE('{LAST_DATE}', 'YYYY-MM-DD') " \
          "ORDER BY END_DATE"
+sqlCldRange = "SELECT C.END_DATE " \
+              "FROM UPCENTER.PUB_EXCH_CALE C " \
+              "WHERE C.IS_TRADE_DATE = 1 AND C.SEC_MAR_PAR = 1 AND " \
+              "      C.END_DATE BETWEEN TO_DATE('{START_DATE}', 'YYYY-MM-DD') AND TO_DATE('{END_DATE}', 'YYYY-MM-DD') " \
+              "ORDER BY C.END_DATE"
 sqlScale = "SELECT DATE'{TRADE_DATE}', SEC_UNI_CODE,  " \
            "       CASE IND_ID  " \
            "            WHEN 2060000246 THEN 0  " \
@@ -28,11 +51,22 @@ sqlScale = "SELECT DATE'{TRADE_DATE}', SEC_UNI_CODE,  " \
            "WHERE IN_DATE <= DATE'{TRADE_DATE}' AND (OUT_DATE > DATE'{TRADE_DATE}' OR OUT_DATE IS NULL) AND ISVALID = 1  " \
            "AND IND_ID IN (2060000246, 2060000247, 2060000248, 2060007759)"
 numScale = 3
+# sqlScale中各规模指数的IND_ID，下标即规模序号
+scaleIndList = [2060000246, 2060000247, 2060000248, 2060007759]
+# 规模指数的全部成分股区间：0.编码 1.指数 2.纳入日期 3.剔除日期（为空表示仍在指数中），用于Membership.Membership
+sqlScaleInterval = "SELECT SEC_UNI_CODE, IND_ID, IN_DATE, OUT_DATE " \
+                   "FROM UPCENTER.IND_SAMP_INFO " \
+                   "WHERE ISVALID = 1 AND IND_ID IN (2060000246, 2060000247, 2060000248, 2060007759)"
 sqlSi = "SELECT TRADE_DATE, IND_UNI_CODE, CLOSE_PRICE, OPEN_PRICE, CHAN_RATE / 100 " \
         "FROM UPCENTER.IND_BASIC_MQ " \
         "WHERE ISVALID = 1 AND TRADE_DATE = TO_DATE('{TRADE_DATE}', 'YYYY-MM-DD') " \
         "AND IND_UNI_CODE IN (2060002285, 2060002287, 2060002289, 2060005124) "
 numSi = 5
+sqlSiRange = "SELECT TRADE_DATE, IND_UNI_CODE, CLOSE_PRICE, OPEN_PRICE, CHAN_RATE / 100 " \
+             "FROM UPCENTER.IND_BASIC_MQ " \
+             "WHERE ISVALID = 1 AND IND_UNI_CODE IN (2060002285, 2060002287, 2060002289, 2060005124) AND " \
+             "      TRADE_DATE BETWEEN TO_DATE('{START_DATE}', 'YYYY-MM-DD') AND TO_DATE('{END_DATE}', 'YYYY-MM-DD') " \
+             "ORDER BY TRADE_DATE "
 siCodeList = [2060002285, 2060002287, 2060002289, 2060005124]
 
 def GetPara(seq, name):
@@ -46,10 +80,7 @@ def GetPara(seq, name):
 
 def GetScaleStockCode(connStr, tradeDate = dt.datetime.now()):
     tradeDateStr = tradeDate.strftime("%Y-%m-%d")
-    conn = co.connect(connStr)
-    cursor = conn.cursor()
-    cursor.execute(sqlScale.replace('{TRADE_DATE}', tradeDateStr))
-    recordSet = cursor.fetchall()
+    recordSet = DbPool.Query(connStr, sqlScale.replace('{TRADE_DATE}', tradeDateStr))
     scaleStockCodeList = [[], [], [], []]
     for record in recordSet:
         if record[2] is not None: